@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Benchmark the cold start of the masterdata cache: SQLite load vs. snapshot.
+
+For every requested SQLite file size a synthetic database is generated and
+a columnar snapshot is written from it, plain and zlib-compressed. Each
+startup path then runs in a fresh process, so nothing is shared with the
+previous one but the OS page cache, which holds the files (warm start of a
+restarted worker):
+
+    sqlite            sqlite engine loading the SQLite file
+    columnar          columnar engine loading the SQLite file
+    snapshot          columnar engine mapping the snapshot
+    snapshot-zlib     columnar engine opening the compressed snapshot
+
+Reports the load time, the RSS after the load and the peak RSS of the
+process.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_cache_cold_start --size-mb 100 1000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic_masterdata import write_sqlite_database
+from src.cache.cache_manager import create_cache_manager
+from src.cache.columnar_cache import ColumnarMasterdataCacheManager
+from src.cache.memory import current_rss_bytes
+
+MODES = ("sqlite", "columnar", "snapshot", "snapshot-zlib")
+
+# Records written to estimate the SQLite bytes per record
+_CALIBRATION_RECORDS = 5_000
+
+
+def records_for_size(size_mb: float, directory: str) -> int:
+    """Estimate how many synthetic records make a SQLite file of size_mb."""
+    path = os.path.join(directory, "calibration.sqlite3")
+    write_sqlite_database(path, _CALIBRATION_RECORDS)
+    bytes_per_record = os.path.getsize(path) / _CALIBRATION_RECORDS
+    os.remove(path)
+    return int(size_mb * 1024 * 1024 / bytes_per_record)
+
+
+def write_snapshots(db_path: str, snapshot_path: str, compressed_path: str) -> None:
+    """Load the SQLite file once and write both snapshots (runs in a child process)."""
+    manager = ColumnarMasterdataCacheManager()
+    manager.initialize_cache()
+    manager.load_masterdata_from_sqlite(db_path)
+    table = manager._current_generation()
+    table.write_snapshot(snapshot_path)
+    table.write_snapshot(compressed_path, "zlib")
+    manager.close_cache()
+
+
+def measure(mode: str, db_path: str, snapshot_path: str, compressed_path: str) -> dict:
+    """Start the cache in one way and measure it (runs in a child process)."""
+    if mode == "sqlite" or mode == "columnar":
+        manager = create_cache_manager(mode)
+    else:
+        manager = ColumnarMasterdataCacheManager()
+    manager.initialize_cache()
+
+    started = time.perf_counter()
+    if mode == "snapshot":
+        rows = manager.load_masterdata_from_snapshot(snapshot_path)
+    elif mode == "snapshot-zlib":
+        rows = manager.load_masterdata_from_snapshot(compressed_path)
+    else:
+        rows = manager.load_masterdata_from_sqlite(db_path)
+    seconds = time.perf_counter() - started
+
+    # The cache must answer right away, not only after pages were faulted in
+    manager.search_masterdata_json("folding box", limit=10)
+    manager.get_typeahead_completions("800", 10)
+    return {
+        "mode": mode,
+        "rows": rows,
+        "seconds": seconds,
+        "rss_mb": (current_rss_bytes() or 0) / 1024 / 1024,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run_child(*arguments: str) -> str:
+    """Run this module in a fresh interpreter and return its output."""
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_cache_cold_start", *arguments],
+        check=True, capture_output=True, text=True,
+    )
+    return completed.stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, nargs="+", default=[100.0], help="SQLite file sizes to test")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES), help="Startup paths to measure")
+    parser.add_argument("--directory", help="Where to write the test files (default: a temporary directory)")
+    # Internal: run a single step in this process
+    parser.add_argument("--child", choices=("write",) + MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--paths", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child == "write":
+        write_snapshots(*args.paths)
+        return
+    if args.child:
+        print(json.dumps(measure(args.child, *args.paths)))
+        return
+
+    with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+        print(f"{'SQLite':>8} {'mode':<14} {'rows':>9} {'load (s)':>9} {'RSS (MB)':>9} {'peak (MB)':>10}")
+        for size_mb in args.size_mb:
+            count = records_for_size(size_mb, directory)
+            paths = [os.path.join(directory, name) for name in ("scripta-db.sqlite3", "plain.snapshot", "zlib.snapshot")]
+            write_sqlite_database(paths[0], count)
+            run_child("--child", "write", "--paths", *paths)
+            label = f"{os.path.getsize(paths[0]) / 1024 / 1024:.0f}MB"
+
+            for mode in args.modes:
+                result = json.loads(run_child("--child", mode, "--paths", *paths))
+                print(
+                    f"{label:>8} {result['mode']:<14} {result['rows']:>9} {result['seconds']:>9.2f} "
+                    f"{result['rss_mb']:>9.0f} {result['peak_rss_mb']:>10.0f}",
+                    flush=True,
+                )
+            print(
+                f"{'':>8} snapshot files: {os.path.getsize(paths[1]) / 1024 / 1024:.0f}MB plain, "
+                f"{os.path.getsize(paths[2]) / 1024 / 1024:.0f}MB zlib"
+            )
+            for path in paths:
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
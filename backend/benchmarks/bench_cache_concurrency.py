@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark MATNR8 lookup throughput of the cache engines as reader threads are added.
+
+Every thread performs the same number of random lookups against one shared
+cache manager; the reported throughput is the total over all threads.
+
+With --app the lookups are requests to GET /get_masterdata_from_sqlite
+instead, sent through the ASGI app with the given numbers of requests in
+flight, so the routing and the threadpool the endpoint runs in are included.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_cache_concurrency --records 50000 --threads 1 2 4 8
+    python -m benchmarks.bench_cache_concurrency --records 50000 --threads 1 2 4 8 --app
+"""
+import argparse
+import asyncio
+import random
+import threading
+import time
+
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+from benchmarks.synthetic_masterdata import generate_record_list
+from src.cache.cache_manager import create_cache_manager
+from src.routers import masterdata_sqlite
+
+
+def measure_throughput(manager, keys, threads: int, lookups_per_thread: int) -> float:
+    """Return lookups per second with ``threads`` concurrent readers."""
+    barrier = threading.Barrier(threads + 1)
+
+    def reader(seed: int):
+        rng = random.Random(seed)
+        sample = [rng.choice(keys) for _ in range(lookups_per_thread)]
+        barrier.wait()
+        for key in sample:
+            if manager.get_masterdata_by_matnr8(key) is None:
+                raise AssertionError(f"MATNR8 {key} missing from cache")
+
+    workers = [threading.Thread(target=reader, args=(seed,)) for seed in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    return threads * lookups_per_thread / elapsed
+
+
+def measure_app_throughput(manager, keys, in_flight: int, lookups_per_client: int) -> float:
+    """Return requests per second with ``in_flight`` concurrent clients of the masterdata endpoint."""
+    masterdata_sqlite.cache_manager = manager
+    app = FastAPI()
+    app.include_router(masterdata_sqlite.router)
+
+    async def client(http: AsyncClient, seed: int):
+        rng = random.Random(seed)
+        for _ in range(lookups_per_client):
+            response = await http.get("/get_masterdata_from_sqlite", params={"matnr8": rng.choice(keys)})
+            if response.status_code != 200:
+                raise AssertionError(f"Lookup answered {response.status_code}")
+
+    async def run() -> float:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as http:
+            started = time.perf_counter()
+            await asyncio.gather(*(client(http, seed) for seed in range(in_flight)))
+            return time.perf_counter() - started
+
+    return in_flight * lookups_per_client / asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=50000, help="Number of synthetic records to load")
+    parser.add_argument("--lookups", type=int, default=5000, help="Lookups per thread")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8], help="Thread counts to measure")
+    parser.add_argument("--app", action="store_true", help="Send requests through the app instead")
+    args = parser.parse_args()
+    measure = measure_app_throughput if args.app else measure_throughput
+
+    records = generate_record_list(args.records)
+    keys = [record["MATNR8"] for record in records]
+
+    print(f"{'engine':<10} {'in flight' if args.app else 'threads':>9} {'lookups/s':>12} {'scaling':>8}")
+    for engine in ("sqlite", "columnar"):
+        manager = create_cache_manager(engine)
+        manager.initialize_cache()
+        manager.bulk_insert_masterdata(records)
+        baseline = None
+        for threads in args.threads:
+            throughput = measure(manager, keys, threads, args.lookups)
+            baseline = baseline or throughput
+            print(f"{engine:<10} {threads:>9} {throughput:>12,.0f} {throughput / baseline:>7.2f}x")
+        manager.close_cache()
+
+
+if __name__ == "__main__":
+    main()
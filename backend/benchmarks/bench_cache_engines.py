@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark point lookups and memory use of the masterdata cache engines.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_cache_engines --records 50000
+"""
+import argparse
+import gc
+import random
+import time
+
+from benchmarks.synthetic_masterdata import generate_record_list
+from src.cache.cache_manager import create_cache_manager
+
+
+def benchmark_engine(engine: str, records, lookups: int) -> dict:
+    """Load the records into one engine and time random MATNR8 lookups."""
+    gc.collect()
+    manager = create_cache_manager(engine)
+    manager.initialize_cache()
+    started = time.perf_counter()
+    manager.bulk_insert_masterdata(records)
+    load_seconds = time.perf_counter() - started
+    # Both engines account for their records and indexes the same way here,
+    # unlike allocator tracing, which misses SQLite's own page cache
+    memory = manager.get_memory_stats()
+
+    rng = random.Random(7)
+    keys = [rng.choice(records)["MATNR8"] for _ in range(lookups)]
+    started = time.perf_counter()
+    for key in keys:
+        manager.get_masterdata_by_matnr8(key)
+    lookup_seconds = time.perf_counter() - started
+    manager.close_cache()
+
+    return {
+        "engine": engine,
+        "load_seconds": load_seconds,
+        "lookup_us": lookup_seconds / lookups * 1_000_000,
+        "records_mb": memory["records_bytes"] / 1024 / 1024,
+        "indexes_mb": sum(memory["indexes_bytes"].values()) / 1024 / 1024,
+        "bytes_per_record": memory["bytes_per_record"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=50000, help="Number of synthetic records to load")
+    parser.add_argument("--lookups", type=int, default=20000, help="Number of random MATNR8 lookups to time")
+    args = parser.parse_args()
+
+    records = generate_record_list(args.records)
+    print(f"{'engine':<10} {'load (s)':>10} {'lookup (us)':>12} {'records (MB)':>13} {'indexes (MB)':>13} {'B/record':>9}")
+    for engine in ("sqlite", "columnar"):
+        result = benchmark_engine(engine, records, args.lookups)
+        print(
+            f"{result['engine']:<10} {result['load_seconds']:>10.2f} {result['lookup_us']:>12.1f}"
+            f" {result['records_mb']:>13.1f} {result['indexes_mb']:>13.1f} {result['bytes_per_record']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
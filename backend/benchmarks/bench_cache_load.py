@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Benchmark loading the masterdata cache from the file-based SQLite database.
+
+Reports wall time and the peak of Python-level allocations during the load
+for every cache engine. The peak is measured in a second load because
+tracemalloc slows allocation-heavy code down considerably.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_cache_load --records 50000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.synthetic_masterdata import write_sqlite_database
+from src.cache.cache_manager import create_cache_manager
+
+
+def benchmark_sqlite_load(engine: str, db_path: str) -> dict:
+    """Load the cache of one engine from the SQLite file."""
+    manager = create_cache_manager(engine)
+    manager.initialize_cache()
+    started = time.perf_counter()
+    rows = manager.load_masterdata_from_sqlite(db_path)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    manager.load_masterdata_from_sqlite(db_path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    manager.close_cache()
+    return {"source": f"sqlite -> {engine}", "rows": rows, "seconds": elapsed, "peak_mb": peak / 1024 / 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=50000, help="Number of synthetic records to generate")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, "scripta-db.sqlite3")
+        write_sqlite_database(db_path, args.records)
+        size_mb = os.path.getsize(db_path) / 1024 / 1024
+        print(f"SQLite file: {size_mb:.1f} MB, {args.records} records")
+
+        print(f"{'source':<22} {'rows':>8} {'load (s)':>9} {'py peak (MB)':>13}")
+        for engine in ("sqlite", "columnar"):
+            result = benchmark_sqlite_load(engine, db_path)
+            print(f"{result['source']:<22} {result['rows']:>8} {result['seconds']:>9.2f} {result['peak_mb']:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark saving a full masterdata fetch to the file-based SQLite database.
+
+Compares saving the fetch as one list, as the refresh did before it streamed,
+with streaming it in chunks through prefetch, which fetches the next chunk
+while the current one is written. Every chunk waits --fetch-ms to stand in for
+the Databricks round trip. Reports wall time and the peak of Python-level
+allocations, the fetched rows included, for a first load and for a refresh
+without changes. The peak is measured in separate runs because tracemalloc
+slows allocation-heavy code down considerably.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_masterdata_ingest --records 50000 --chunk-size 10000
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from itertools import islice
+
+from benchmarks.synthetic_masterdata import generate_records
+from src.config.databricks import prefetch
+from src.routers import database
+
+
+def fetched_chunks(records: int, chunk_size: int, fetch_ms: float):
+    """Synthetic rows in chunks, each arriving after a simulated round trip."""
+    rows = generate_records(records)
+    while True:
+        time.sleep(fetch_ms / 1000)
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def save_as_list(records: int, chunk_size: int, fetch_ms: float) -> dict:
+    rows = [row for chunk in fetched_chunks(records, chunk_size, fetch_ms) for row in chunk]
+    return database.save_masterdata_to_sqlite(rows)
+
+
+def save_streamed(records: int, chunk_size: int, fetch_ms: float) -> dict:
+    return database.save_masterdata_chunks_to_sqlite(prefetch(fetched_chunks(records, chunk_size, fetch_ms)))
+
+
+def measure(save, records: int, chunk_size: int, fetch_ms: float, refresh: bool) -> dict:
+    """Time save and measure its peak, on an empty table or on a refresh without changes."""
+    results = {}
+    for traced in (False, True):
+        with sqlite3.connect(database.DB_PATH) as conn:
+            conn.execute("DELETE FROM masterdata_databricks")
+        if refresh:
+            save_streamed(records, chunk_size, 0)
+        if traced:
+            tracemalloc.start()
+        started = time.perf_counter()
+        report = save(records, chunk_size, fetch_ms)
+        if traced:
+            results["peak_mb"] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            tracemalloc.stop()
+        else:
+            results["seconds"] = time.perf_counter() - started
+            results["changed"] = report["inserted"] + report["updated"]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=50000, help="Number of synthetic records to fetch")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Rows per fetched chunk")
+    parser.add_argument("--fetch-ms", type=float, default=200.0, help="Simulated Databricks time per chunk")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database.DB_PATH = os.path.join(directory, "scripta-db.sqlite3")
+        sqlite3.connect(database.DB_PATH).close()
+        database.create_masterdata_databricks_table()
+        print(f"{args.records} records in chunks of {args.chunk_size}, {args.fetch_ms:.0f} ms per chunk")
+
+        print(f"{'save':<10} {'table':<10} {'changed':>8} {'time (s)':>9} {'py peak (MB)':>13}")
+        for refresh in (False, True):
+            for name, save in (("list", save_as_list), ("streamed", save_streamed)):
+                result = measure(save, args.records, args.chunk_size, args.fetch_ms, refresh)
+                table = "unchanged" if refresh else "empty"
+                print(f"{name:<10} {table:<10} {result['changed']:>8} {result['seconds']:>9.2f} "
+                      f"{result['peak_mb']:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Synthetic masterdata generator shared by the benchmark scripts.
+Produces rows shaped like the output of the unified Databricks CTE.
+"""
+import os
+import random
+import sqlite3
+import sys
+from typing import Dict, Iterator, List
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.cache.schema import INTEGER_COLUMNS, MASTERDATA_COLUMNS
+
+_WORDS = [
+    "folding", "box", "leaflet", "label", "blister", "foil", "carton", "tablet", "film",
+    "coated", "aspirin", "xarelto", "bayer", "insert", "vial", "sachet", "tube", "bottle",
+]
+_PLANTS = ["DE01", "DE02", "DE05", "FR10", "IT03", "ES07", "US12", "BR02", "CN01", "IN04"]
+_FLAG_COLUMNS = {column for column in MASTERDATA_COLUMNS if column.startswith("PRINTCHAR_")} | {
+    "ACF_FLAG", "PRINTED", "LAYOUT_APPROVED",
+}
+_SPARSE_COLUMNS = {column for column in MASTERDATA_COLUMNS if column.startswith(("DRA_", "HRL", "ACS"))}
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+
+def generate_records(count: int, seed: int = 42) -> Iterator[Dict]:
+    """Yield ``count`` synthetic masterdata records with realistic value distributions."""
+    rng = random.Random(seed)
+    for number in range(count):
+        matnr8 = 80000000 + number * 7
+        record = {}
+        for column in MASTERDATA_COLUMNS:
+            if column in ("created_at", "updated_at"):
+                continue
+            if column in _FLAG_COLUMNS:
+                record[column] = rng.choice(["", "", "", "X"])
+            elif column in _SPARSE_COLUMNS:
+                record[column] = f"DRA_{rng.randint(1000000, 9999999)}-000" if rng.random() < 0.05 else ""
+            else:
+                record[column] = _text(rng, rng.randint(1, 4))
+        plants = rng.sample(_PLANTS, rng.randint(1, 4))
+        record.update({
+            "MATNR": f"0000000000{matnr8}",
+            "MATNR8": matnr8,
+            "MATERIAL_DESCRIPTION": _text(rng, 6),
+            "MATERIAL_TYPE": rng.choice(["YPM", "YTXT", "YPMN"]),
+            "XPLANT_STATUS": rng.choice(["Z1", "Z2", "Z5", ""]),
+            "PLANTS": ",".join(plants),
+            "PLANTS_TXT": ", ".join(f"Plant {plant}" for plant in plants),
+            "TPM": f"TPM{rng.randint(1, 2000):05d}",
+            "TPM_STATUS": rng.choice(["RELEASED", "IN WORK", None]),
+            "GLPT": f"GLPT{rng.randint(1, 40):03d}",
+            "ECLASS": f"{rng.randint(10000000, 10000200)}",
+        })
+        yield record
+
+
+def generate_record_list(count: int, seed: int = 42) -> List[Dict]:
+    """Return ``count`` synthetic masterdata records as a list."""
+    return list(generate_records(count, seed))
+
+
+def write_sqlite_database(path: str, count: int, seed: int = 42) -> None:
+    """Create a file-based SQLite database with a filled masterdata_databricks table."""
+    column_definitions = ", ".join(
+        f"{column} TIMESTAMP DEFAULT CURRENT_TIMESTAMP" if column in ("created_at", "updated_at")
+        else f"{column} INTEGER" if column in INTEGER_COLUMNS
+        else f"{column} TEXT"
+        for column in MASTERDATA_COLUMNS
+    )
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute(f"CREATE TABLE masterdata_databricks ({column_definitions})")
+        conn.execute("CREATE INDEX idx_masterdata_databricks_matnr8 ON masterdata_databricks (MATNR8)")
+        columns = [column for column in MASTERDATA_COLUMNS if column not in ("created_at", "updated_at")]
+        insert_sql = f"INSERT INTO masterdata_databricks ({','.join(columns)}) VALUES ({','.join('?' for _ in columns)})"
+        conn.executemany(insert_sql, (tuple(record[column] for column in columns) for record in generate_records(count, seed)))
+        conn.commit()
+    finally:
+        conn.close()
@@ -4,7 +4,8 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from src.cache import cache_manager
+from src.cache import cache_manager, cache_warmup
+from src.metrics import MetricsMiddleware
 from src.routers import databricks, layers, masterdata_sqlite, swatches, tpm, utility
 from src.routers.database import (
     create_masterdata_databricks_table,
@@ -35,15 +36,16 @@ async def lifespan(app: FastAPI):
         sqlite_stats = get_masterdata_databricks_stats()
         
         if sqlite_stats["table_exists"] and sqlite_stats["record_count"] > 0:
-            # Load data from SQLite into in-memory cache
+            # Load data from SQLite into the in-memory cache in the background,
+            # so the other routes are served while it loads; /ready reports
+            # when masterdata is servable
             db_path = os.path.join(os.path.dirname(__file__), "scripta-db.sqlite3")
-            rows_loaded = cache_manager.load_masterdata_from_sqlite(db_path)
-            logger.info(f"Loaded {rows_loaded} masterdata records from SQLite into in-memory cache")
-            
-            # Get cache stats
-            cache_stats = cache_manager.get_cache_stats()
-            logger.info(f"Cache statistics: {cache_stats}")
+            cache_warmup.start(
+                lambda: cache_manager.load_masterdata_on_startup(db_path), sqlite_stats["record_count"]
+            )
+            logger.info(f"Loading {sqlite_stats['record_count']} masterdata records into in-memory cache in background")
         else:
+            cache_warmup.mark_ready()
             logger.warning("No masterdata found in SQLite database. Cache will be empty until data is loaded.")
             logger.info("Use the /databricks/save_masterdata_to_sqlite_and_cache endpoint to load data")
         
@@ -51,13 +53,34 @@ async def lifespan(app: FastAPI):
         
     except Exception as e:
         logger.error(f"Error during startup: {str(e)}")
+        cache_warmup.mark_failed(str(e))
         # Don't fail startup if cache initialization fails
         # The application can still work without the cache
+    
+    try:
+        # Refresh masterdata on the configured cron schedule, e.g. "*/15 * * * *"
+        databricks.refresh_scheduler.start(
+            os.getenv("MASTERDATA_REFRESH_SCHEDULE"),
+            os.getenv("MASTERDATA_REFRESH_SCHEDULE_MODE", "incremental"),
+        )
+    except ValueError as e:
+        logger.error(f"Masterdata refreshes are not scheduled: {str(e)}")
         
     yield
     
     # Shutdown
     logger.info("Shutting down ScriPTA backend...")
+    await databricks.refresh_scheduler.stop()
+    if databricks.refresh_scheduler.running:
+        logger.warning("Shutting down while a masterdata refresh is running")
+    if cache_warmup.loading:
+        logger.warning("Shutting down while the masterdata cache is still loading")
+    try:
+        # Keep the loaded generation for a fast next start
+        if cache_manager.save_snapshot():
+            logger.info("Masterdata cache snapshot saved")
+    except Exception as e:
+        logger.error(f"Failed to save masterdata cache snapshot: {str(e)}")
     try:
         cache_manager.close_cache()
         logger.info("In-memory cache closed")
@@ -87,6 +110,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Record the latency of every request per route
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(utility.router)
 app.include_router(swatches.router)
@@ -1,4 +1,5 @@
 """Cache package initialization."""
-from .cache_manager import cache_manager
+from .cache_manager import cache_manager, create_cache_manager
+from .warmup import cache_warmup
 
-__all__ = ["cache_manager"]
+__all__ = ["cache_manager", "cache_warmup", "create_cache_manager"]
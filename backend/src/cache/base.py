@@ -0,0 +1,542 @@
+"""
+Behaviour shared by the masterdata cache engines.
+
+Cache contents are organised in generations. A refresh builds a complete new
+generation on the side and publishes it with a single reference assignment, so
+readers always see either the old or the new contents, never a partial load.
+Readers that still hold the previous generation finish on it; it is freed once
+the last reference is dropped.
+"""
+import itertools
+import logging
+import sys
+import threading
+import time
+import zlib
+from typing import AbstractSet, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from ..metrics import metrics
+from ..models.models import MASTERDATA_FIELD_COLUMNS
+from .facets import FACET_COLUMNS, FacetIndex, FilterResult, popcount
+from .memory import current_rss_bytes, deep_sizeof
+from .pagination import (
+    AFTER_ALL_POSITIONS,
+    PageCursor,
+    StalePageTokenError,
+    decode_page_token,
+    encode_page_token,
+)
+from .reverse_index import LinkedMaterials, ReverseIndex
+from .search import tokenize
+from .serialization import MasterdataFields, projected_columns, record_etag, serialize_masterdata_record
+from .typeahead import TypeaheadIndex
+
+logger = logging.getLogger(__name__)
+
+_LOOKUPS = "scripta_masterdata_lookups_total"
+# Every found record is a hit; source tells whether its serialized JSON was already kept
+_SERIALIZED_HIT = (("result", "hit"), ("source", "serialized"))
+_ENGINE_HIT = (("result", "hit"), ("source", "engine"))
+_NOT_FOUND = (("result", "not_found"),)
+
+
+class CacheGeneration:
+    """One fully loaded, immutable version of the cache contents."""
+
+    def __init__(self):
+        self.number = 0
+        self.loaded_at = time.time()
+        self.serialized_records: Dict[int, bytes] = {}
+        # Content ETags of the serialized records, kept with them
+        self.record_etags: Dict[int, str] = {}
+        # Bytes of the kept serialized records and ETags, counted as they are added
+        self.serialized_bytes = 0
+        self.typeahead = TypeaheadIndex.empty()
+        self.facets = FacetIndex.empty()
+        self.tpm_index = ReverseIndex.empty()
+        # Memory accounting, computed on first request
+        self.memory_usage: Optional[Dict] = None
+
+    @property
+    def etag(self) -> str:
+        """
+        Strong entity tag of the generation's contents.
+
+        Includes the publish time because generation numbers restart with the
+        process.
+        """
+        return f'"g{self.number}-{int(self.loaded_at * 1000):x}"'
+
+
+class BaseMasterdataCache:
+    """Base class for masterdata cache engines."""
+
+    engine = ""
+
+    # Upper bound for lazily serialized records kept per generation
+    max_serialized_records = 200_000
+
+    def __init__(self):
+        self._is_initialized = False
+        self._generation: Optional[CacheGeneration] = None
+        self._generation_numbers = itertools.count(1)
+        self._publish_lock = threading.Lock()
+        self._last_load: Optional[Dict] = None
+        # Rows read so far by the load in progress, kept up to date by engines that load in batches
+        self.load_rows_read = 0
+
+    def _begin_load(self) -> Tuple[float, Optional[int]]:
+        """Mark the start of a load; pass the result to _publish_generation."""
+        self.load_rows_read = 0
+        return time.perf_counter(), current_rss_bytes()
+
+    def _publish_generation(self, generation: CacheGeneration,
+                            load: Optional[Tuple[float, Optional[int]]] = None) -> None:
+        """
+        Atomically replace the current generation with a fully built one.
+
+        With the mark of _begin_load, the duration of the load and the change
+        in process RSS it caused (new generation in, old one out) are recorded.
+        """
+        with self._publish_lock:
+            generation.number = next(self._generation_numbers)
+            generation.loaded_at = time.time()
+            self._generation = generation
+        logger.info(f"Published masterdata cache generation {generation.number}")
+
+        if load is not None:
+            started, rss_before = load
+            seconds = time.perf_counter() - started
+            metrics.observe("scripta_refresh_phase_duration_seconds", seconds, (("phase", "cache_load"),))
+            rss_after = current_rss_bytes()
+            self._last_load = {
+                "generation": generation.number,
+                "seconds": round(seconds, 3),
+                "rss_before_bytes": rss_before,
+                "rss_after_bytes": rss_after,
+                "rss_delta_bytes": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+            }
+
+    def _current_generation(self) -> CacheGeneration:
+        """Return the generation readers should use for the whole request."""
+        generation = self._generation
+        if not self._is_initialized or generation is None:
+            raise RuntimeError("Cache not initialized. Call initialize_cache() first.")
+        return generation
+
+    # The engine hooks below read only the given columns when columns is not
+    # None, so projections are applied inside the cache query.
+
+    def _lookup(self, generation: CacheGeneration, matnr8: int,
+                columns: Optional[AbstractSet[str]] = None) -> Optional[Dict]:
+        """Look up a MATNR8 in the given generation."""
+        raise NotImplementedError
+
+    def _lookup_many(self, generation: CacheGeneration, matnr8s: List[int],
+                     columns: Optional[AbstractSet[str]] = None) -> Dict[int, Dict]:
+        """Look up several MATNR8s in the given generation; missing keys are left out."""
+        records = {}
+        for matnr8 in matnr8s:
+            record = self._lookup(generation, matnr8, columns)
+            if record is not None:
+                records[matnr8] = record
+        return records
+
+    def _page(self, generation: CacheGeneration, after: Optional[Tuple[int, int]], limit: int,
+              columns: Optional[AbstractSet[str]] = None) -> List[Tuple[int, Dict]]:
+        """
+        Return up to limit (position, record) pairs ordered by (MATNR8, position)
+        that come strictly after the given key; records without MATNR8 are skipped.
+        """
+        raise NotImplementedError
+
+    def _iter_records(self, generation: CacheGeneration,
+                      columns: Optional[AbstractSet[str]] = None) -> Iterator[Dict]:
+        """Iterate over all records of the given generation ordered by MATNR8."""
+        raise NotImplementedError
+
+    def _search(self, generation: CacheGeneration, terms: List[str], limit: int, prefix: bool,
+                columns: Optional[AbstractSet[str]] = None) -> List[Dict]:
+        """Return up to limit records matching all search terms, best match first."""
+        raise NotImplementedError
+
+    def _records_at(self, generation: CacheGeneration, positions: List[int],
+                    columns: Optional[AbstractSet[str]] = None) -> List[Dict]:
+        """Return the records at the given engine positions, in the given order."""
+        raise NotImplementedError
+
+    def _memory_usage(self, generation: CacheGeneration) -> Tuple[Dict[str, int], int, Dict[str, int]]:
+        """
+        Measure the engine-specific memory of a generation.
+
+        Returns the approximate bytes per column, the bytes of the record
+        storage as a whole and the bytes of the engine's own indexes.
+        """
+        raise NotImplementedError
+
+    @property
+    def generation(self) -> int:
+        """Number of the currently published generation (0 before the first load)."""
+        generation = self._generation
+        return generation.number if generation is not None else 0
+
+    @property
+    def loaded_at(self) -> Optional[float]:
+        """Epoch time the current generation was published (None before initialization)."""
+        generation = self._generation
+        return generation.loaded_at if generation is not None else None
+
+    def get_memory_stats(self) -> Dict:
+        """
+        Approximate memory held by the current generation.
+
+        Reports bytes per column, per record, per index and in total, the
+        process RSS, and the duration and RSS delta of the last load. The
+        generation's sizes are measured once and kept with it, which walks
+        every index, so call this in the threadpool. The lazily serialized
+        records are counted as they are added.
+        """
+        generation = self._current_generation()
+        usage = generation.memory_usage
+        if usage is None:
+            columns, records_bytes, indexes = self._memory_usage(generation)
+            indexes.update({
+                "typeahead": deep_sizeof(generation.typeahead),
+                "facets": deep_sizeof(generation.facets),
+                "tpm": deep_sizeof(generation.tpm_index),
+            })
+            usage = generation.memory_usage = {
+                "columns_bytes": columns,
+                "records_bytes": records_bytes,
+                "indexes_bytes": indexes,
+            }
+
+        serialized_bytes = (
+            sys.getsizeof(generation.serialized_records) + sys.getsizeof(generation.record_etags)
+            + generation.serialized_bytes
+        )
+        record_count = len(generation.facets.positions)
+        return {
+            **usage,
+            "bytes_per_record": round(usage["records_bytes"] / record_count, 1) if record_count else 0,
+            "serialized_records_bytes": serialized_bytes,
+            "total_bytes": usage["records_bytes"] + sum(usage["indexes_bytes"].values()) + serialized_bytes,
+            "rss_bytes": current_rss_bytes(),
+            "last_load": self._last_load,
+        }
+
+    def _keep_serialized(self, generation: CacheGeneration, matnr8: int, serialized: bytes) -> None:
+        """Keep a serialized record and its ETag with the generation, up to max_serialized_records."""
+        serialized_records = generation.serialized_records
+        if len(serialized_records) >= self.max_serialized_records or matnr8 in serialized_records:
+            return
+        etag = record_etag(serialized)
+        generation.record_etags[matnr8] = etag
+        serialized_records[matnr8] = serialized
+        # Approximate: concurrent first hits may race on the total. The key is held by both dicts.
+        generation.serialized_bytes += sys.getsizeof(serialized) + sys.getsizeof(etag) + 2 * sys.getsizeof(matnr8)
+
+    def get_generation_validators(self) -> Tuple[str, float]:
+        """ETag and publish time of the current generation, read from the same generation."""
+        generation = self._current_generation()
+        return generation.etag, generation.loaded_at
+
+    def get_masterdata_etag_by_matnr8(self, matnr8: int) -> Optional[str]:
+        """
+        Content ETag of a record in the current generation, if already known.
+
+        Known once the record was serialized in this generation; the record
+        itself is not read, so None does not mean the record is missing.
+        """
+        return self._current_generation().record_etags.get(matnr8)
+
+    def load_masterdata_on_startup(self, sqlite_db_path: str) -> int:
+        """Load the cache when the application starts; engines may use faster sources than SQLite."""
+        return self.load_masterdata_from_sqlite(sqlite_db_path)
+
+    def save_snapshot(self) -> bool:
+        """Persist the current generation for a fast next start, if the engine supports it; returns whether it did."""
+        return False
+
+    def get_masterdata_by_matnr8(self, matnr8: int) -> Optional[Dict]:
+        """Get masterdata record by MATNR8 from the current cache generation."""
+        generation = self._current_generation()
+        try:
+            record = self._lookup(generation, matnr8)
+            metrics.inc(_LOOKUPS, _ENGINE_HIT if record is not None else _NOT_FOUND)
+            return record
+        except Exception as e:
+            logger.error(f"Failed to get masterdata by MATNR8 {matnr8}: {str(e)}")
+            raise
+
+    def get_masterdata_json_by_matnr8(self, matnr8: int, fields: Optional[MasterdataFields] = None) -> Optional[bytes]:
+        """
+        Get the serialized JSON object of a masterdata record by MATNR8.
+
+        Records are serialized on their first hit and the bytes are kept with
+        their generation, so a refresh invalidates them implicitly. With fields
+        only those columns are read and serialized; projections are not kept.
+        """
+        generation = self._current_generation()
+        if fields is not None:
+            record = self._lookup(generation, matnr8, projected_columns(fields))
+            metrics.inc(_LOOKUPS, _ENGINE_HIT if record is not None else _NOT_FOUND)
+            return serialize_masterdata_record(record, fields) if record is not None else None
+
+        serialized_records = generation.serialized_records
+        serialized = serialized_records.get(matnr8)
+        if serialized is not None:
+            metrics.inc(_LOOKUPS, _SERIALIZED_HIT)
+            return serialized
+
+        record = self._lookup(generation, matnr8)
+        if record is None:
+            metrics.inc(_LOOKUPS, _NOT_FOUND)
+            return None
+
+        metrics.inc(_LOOKUPS, _ENGINE_HIT)
+
+        serialized = serialize_masterdata_record(record)
+        self._keep_serialized(generation, matnr8, serialized)
+        return serialized
+
+    def get_masterdata_json_by_matnr8s(
+        self, matnr8s: Iterable[int], fields: Optional[MasterdataFields] = None
+    ) -> Tuple[List[bytes], List[int]]:
+        """
+        Get the serialized JSON objects of several masterdata records in one pass.
+
+        All keys are resolved against the same generation. Returns the found
+        records in request order (duplicates collapsed) and the missing keys.
+        """
+        generation = self._current_generation()
+        requested = list(dict.fromkeys(matnr8s))
+        if fields is not None:
+            records = self._lookup_many(generation, requested, projected_columns(fields))
+            found = [serialize_masterdata_record(records[matnr8], fields) for matnr8 in requested if matnr8 in records]
+            missing = [matnr8 for matnr8 in requested if matnr8 not in records]
+            metrics.inc(_LOOKUPS, _ENGINE_HIT, len(found))
+            metrics.inc(_LOOKUPS, _NOT_FOUND, len(missing))
+            return found, missing
+
+        serialized_records = generation.serialized_records
+
+        uncached = [matnr8 for matnr8 in requested if matnr8 not in serialized_records]
+        records = self._lookup_many(generation, uncached) if uncached else {}
+
+        found = []
+        missing = []
+        for matnr8 in requested:
+            serialized = serialized_records.get(matnr8)
+            if serialized is None:
+                record = records.get(matnr8)
+                if record is None:
+                    missing.append(matnr8)
+                    continue
+                serialized = serialize_masterdata_record(record)
+                self._keep_serialized(generation, matnr8, serialized)
+            found.append(serialized)
+
+        metrics.inc(_LOOKUPS, _SERIALIZED_HIT, len(found) - len(records))
+        metrics.inc(_LOOKUPS, _ENGINE_HIT, len(records))
+        metrics.inc(_LOOKUPS, _NOT_FOUND, len(missing))
+        return found, missing
+
+    def get_masterdata_page_json(
+        self,
+        page_size: int,
+        after_matnr8: Optional[int] = None,
+        page_token: Optional[str] = None,
+        fields: Optional[MasterdataFields] = None,
+    ) -> Tuple[List[bytes], Optional[str]]:
+        """
+        Get one keyset-paginated page of serialized records ordered by MATNR8.
+
+        Start after after_matnr8 or continue from a page_token returned for the
+        previous page. Returns the page and the token of the next page (None on
+        the last page). Raises ValueError for malformed tokens and
+        StalePageTokenError when the token's generation has been replaced.
+        """
+        generation = self._current_generation()
+        after = None
+        if page_token:
+            cursor = decode_page_token(page_token)
+            if cursor.generation != generation.number:
+                raise StalePageTokenError(
+                    f"Page token belongs to cache generation {cursor.generation}, "
+                    f"current generation is {generation.number}"
+                )
+            after = (cursor.matnr8, cursor.position)
+        elif after_matnr8 is not None:
+            after = (after_matnr8, AFTER_ALL_POSITIONS)
+
+        # Fetch one extra record to know whether another page follows
+        rows = self._page(generation, after, page_size + 1, projected_columns(fields))
+        next_page_token = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            position, record = rows[-1]
+            next_page_token = encode_page_token(PageCursor(generation.number, record["MATNR8"], position))
+
+        fields = fields or MASTERDATA_FIELD_COLUMNS
+        return [serialize_masterdata_record(record, fields) for _, record in rows], next_page_token
+
+    def export_masterdata_ndjson(
+        self, batch_size: int = 500, fields: Optional[MasterdataFields] = None
+    ) -> Tuple[str, Iterator[bytes]]:
+        """
+        Export the current generation as newline-delimited JSON.
+
+        Returns the ETag of the export and a lazy iterator of chunks with up to
+        batch_size records each, one JSON object per line. The iterator keeps
+        the generation it started on, so a refresh during the export does not
+        mix contents, and memory use does not depend on the size of the cache.
+        Projected exports get their own ETag per field selection.
+        """
+        generation = self._current_generation()
+        etag = generation.etag
+        if fields is not None:
+            selection = ",".join(alias for alias, _ in fields).encode("utf-8")
+            etag = f'{etag[:-1]}-f{zlib.crc32(selection):08x}"'
+        columns = projected_columns(fields)
+        fields = fields or MASTERDATA_FIELD_COLUMNS
+
+        def chunks() -> Iterator[bytes]:
+            lines = []
+            for record in self._iter_records(generation, columns):
+                lines.append(serialize_masterdata_record(record, fields))
+                if len(lines) >= batch_size:
+                    yield b"\n".join(lines) + b"\n"
+                    lines = []
+            if lines:
+                yield b"\n".join(lines) + b"\n"
+
+        return etag, chunks()
+
+    def search_masterdata_json(
+        self, query: str, limit: int = 20, prefix: bool = True, fields: Optional[MasterdataFields] = None
+    ) -> List[bytes]:
+        """
+        Full-text search over MATERIAL_DESCRIPTION, TPMTXT, PRDHATXT and PLANTS_TXT.
+
+        Returns the serialized records containing every word of the query,
+        ranked by BM25. With prefix, query words also match longer words
+        ("xare" finds "Xarelto").
+        """
+        generation = self._current_generation()
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        records = self._search(generation, terms, limit, prefix, projected_columns(fields))
+        fields = fields or MASTERDATA_FIELD_COLUMNS
+        return [serialize_masterdata_record(record, fields) for record in records]
+
+    def get_typeahead_completions(self, prefix: str, limit: int = 10) -> List[bytes]:
+        """
+        Complete a MATNR8 or MATNR prefix from the current generation.
+
+        Returns up to limit serialized {MATNR8, MATNR, materialDescription}
+        entries ordered by material number.
+        """
+        return self._current_generation().typeahead.complete(prefix, limit)
+
+    def get_plant_counts(self) -> List[Dict]:
+        """
+        Number of materials per plant in the current generation, ordered by plant.
+
+        Read from the plant posting lists of the facet index; materials
+        without plants are not listed.
+        """
+        counts = self._current_generation().facets.value_counts("plant")
+        return [{"plant": plant, "count": counts[plant]} for plant in sorted(counts) if plant]
+
+    def get_masterdata_json_by_tpm(
+        self,
+        tpm: str,
+        limit: int,
+        page_token: Optional[str] = None,
+        fields: Optional[MasterdataFields] = None,
+    ) -> LinkedMaterials:
+        """
+        Get one page of the materials linked to a TPM, ordered by MATNR8.
+
+        The materials are read from the generation's TPM -> materials index,
+        so only the linked records are touched. Returns the page, the total
+        number of linked materials and the token of the next page.
+        """
+        generation = self._current_generation()
+        start = 0
+        if page_token:
+            cursor = decode_page_token(page_token)
+            if cursor.generation != generation.number:
+                raise StalePageTokenError(
+                    f"Page token belongs to cache generation {cursor.generation}, "
+                    f"current generation is {generation.number}"
+                )
+            start = cursor.position + 1
+
+        linked = generation.tpm_index.positions(tpm)
+        records = self._records_at(generation, list(linked[start:start + limit]), projected_columns(fields))
+
+        next_page_token = None
+        if start + limit < len(linked) and records:
+            next_page_token = encode_page_token(
+                PageCursor(generation.number, records[-1]["MATNR8"] or 0, start + limit - 1)
+            )
+
+        fields = fields or MASTERDATA_FIELD_COLUMNS
+        return LinkedMaterials(
+            [serialize_masterdata_record(record, fields) for record in records], len(linked), next_page_token
+        )
+
+    def filter_masterdata_json(
+        self,
+        filters: Mapping[str, Sequence[str]],
+        limit: int,
+        page_token: Optional[str] = None,
+        fields: Optional[MasterdataFields] = None,
+        facet_limit: Optional[int] = None,
+    ) -> FilterResult:
+        """
+        Filter on the facet columns and return one page of matches ordered by MATNR8.
+
+        filters maps facet names (see FACET_COLUMNS) to accepted values; an
+        empty string selects records without a value. Matching and the facet
+        counts are computed on the generation's bitmaps; facet_limit caps the
+        values listed per facet. Pages continue with next_page_token like the
+        masterdata listing.
+        """
+        unknown = set(filters) - {name for name, _ in FACET_COLUMNS}
+        if unknown:
+            raise ValueError(f"Unknown facets: {', '.join(sorted(unknown))}")
+
+        generation = self._current_generation()
+        after = -1
+        if page_token:
+            cursor = decode_page_token(page_token)
+            if cursor.generation != generation.number:
+                raise StalePageTokenError(
+                    f"Page token belongs to cache generation {cursor.generation}, "
+                    f"current generation is {generation.number}"
+                )
+            after = cursor.position
+
+        facet_index = generation.facets
+        matches, facets = facet_index.filter(filters, facet_limit)
+        ordinals = facet_index.ordinals(matches, after, limit + 1)
+
+        next_page_token = None
+        if len(ordinals) > limit:
+            ordinals = ordinals[:limit]
+            last = ordinals[-1]
+            next_page_token = encode_page_token(PageCursor(generation.number, facet_index.matnr8s[last] or 0, last))
+
+        positions = [facet_index.positions[ordinal] for ordinal in ordinals]
+        records = self._records_at(generation, positions, projected_columns(fields))
+        fields = fields or MASTERDATA_FIELD_COLUMNS
+        return FilterResult(
+            [serialize_masterdata_record(record, fields) for record in records],
+            popcount(matches),
+            facets,
+            next_page_token,
+        )
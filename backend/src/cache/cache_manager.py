@@ -1,133 +1,224 @@
 """
 In-memory cache manager for masterdata to provide fast access to material data.
 This module manages an in-memory SQLite database for ultra-fast material lookups.
+Every load fills a fresh in-memory database that replaces the previous one atomically.
+Readers get their own read-only connection per thread to the shared-cache database.
 """
+import json
 import logging
+import os
 import sqlite3
-from typing import Dict, List, Optional
+import threading
+import uuid
+from typing import AbstractSet, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.request import pathname2url
+
+from .base import BaseMasterdataCache, CacheGeneration
+from .facets import FACET_COLUMNS, FacetIndex
+from .reverse_index import ReverseIndex
+from .search import SEARCH_COLUMNS, fts5_match_expression
+from .typeahead import TypeaheadIndex
 
 logger = logging.getLogger(__name__)
 
 
-class MasterdataCacheManager:
+class _SQLiteGeneration(CacheGeneration):
+    """Cache generation backed by its own shared-cache in-memory SQLite database."""
+
+    def __init__(self):
+        super().__init__()
+        self.uri = f"file:scripta-masterdata-{uuid.uuid4().hex}?mode=memory&cache=shared"
+        # The writer connection builds the generation and keeps the in-memory
+        # database alive for as long as the generation is referenced
+        self.connection = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        self.column_names: List[str] = []
+        self._readers = threading.local()
+
+    def read_connection(self) -> sqlite3.Connection:
+        """Return the calling thread's read-only connection to this generation."""
+        connection = getattr(self._readers, "connection", None)
+        if connection is None:
+            # Closed when the generation (and with it the thread-local) is freed,
+            # which may happen on another thread
+            connection = self.open_reader()
+            self._readers.connection = connection
+        return connection
+
+    def select_list(self, columns: Optional[AbstractSet[str]] = None) -> Tuple[List[str], str]:
+        """Return the selected column names and SQL select list for a projection."""
+        if columns is None:
+            return self.column_names, "*"
+        names = [name for name in self.column_names if name in columns]
+        return names, ", ".join(names)
+
+    def open_reader(self) -> sqlite3.Connection:
+        """Open a dedicated read-only connection; the caller closes it."""
+        connection = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        connection.execute("PRAGMA query_only = ON")
+        # Published generations are never written again, so readers can skip
+        # the shared-cache table locks
+        connection.execute("PRAGMA read_uncommitted = ON")
+        return connection
+
+
+class MasterdataCacheManager(BaseMasterdataCache):
     """Manages in-memory SQLite database for masterdata caching."""
+
+    engine = "sqlite"
     
-    def __init__(self):
-        self._memory_db: Optional[sqlite3.Connection] = None
-        self._is_initialized = False
+    def _create_generation(self, with_indexes: bool = True) -> _SQLiteGeneration:
+        """
+        Create an empty in-memory database with the masterdata table.
+
+        Bulk loads pass with_indexes=False and build the indexes once the data
+        is in place, which is considerably faster than maintaining them per row.
+        """
+        # Create in-memory database
+        generation = _SQLiteGeneration()
+        memory_db = generation.connection
+        
+        # Create masterdata_databricks table with same structure as file-based SQLite
+        create_table_sql = """
+        CREATE TABLE masterdata_databricks (
+            MATNR TEXT PRIMARY KEY,
+            MATNR8 INTEGER,
+            MATERIAL_DESCRIPTION TEXT,
+            MATERIAL_TYPE TEXT,
+            XPLANT_STATUS TEXT,
+            PRDHATXT TEXT,
+            MAKEUP TEXT,
+            PLANTS TEXT,
+            PLANTS_TXT TEXT,
+            CONTRACT_MANUFACTURER_CODETYPE TEXT,
+            CONTRACT_MANUFACTURER_CODE TEXT,
+            RESPONSIBLE_FOR_SPECIFICATION TEXT,
+            CONTRACT_MANUFACTURER_MATERIAL TEXT,
+            LAYOUT_APPROVED TEXT,
+            USAGE_PREFIX TEXT,
+            NUMBER_OF_PAGES TEXT,
+            ACF_FLAG TEXT,
+            VISIBLE_MARKINGS TEXT,
+            CODE TEXT,
+            COLORS TEXT,
+            NUMBER_COLORS_FRONT TEXT,
+            CONTRACT_MANUFACTURER TEXT,
+            ARTICLE_CODETYPE TEXT,
+            ARTICLE_CODE TEXT,
+            CONTRACT_MAN_VISIBLE_MARKINGS TEXT,
+            CONTRACT_MANUFACTURER_MT_INDEX TEXT,
+            COMPONENT_SCRAB_KEY TEXT,
+            REMARKS TEXT,
+            PRINTED TEXT,
+            NUMBER_COLORS_BACK TEXT,
+            PRINT_CHARACTERISTICS TEXT,
+            BRAILLE_TEXT TEXT,
+            PRINTCHAR_BRAILLE TEXT,
+            PRINTCHAR_FOILSTAMP TEXT,
+            PRINTCHAR_GOLDHOTFOIL TEXT,
+            PRINTCHAR_EMBOSSDEBOSS TEXT,
+            PRINTCHAR_SPOTVARNISH TEXT,
+            PRINTCHAR_SCRATCHOFF TEXT,
+            PRINTCHAR_LAMINATION TEXT,
+            PRINTCHAR_DIECUT TEXT,
+            PRINTCHAR_PERFORATION TEXT,
+            PRINTCHAR_GLOSSVARNISH TEXT,
+            PRINTCHAR_LEAFLETING TEXT,
+            PRINTCHAR_FOLDING TEXT,
+            PRINTCHAR_RICHPALEGOLD TEXT,
+            PRINTCHAR_SILVERHOTFOIL TEXT,
+            PRINTCHAR_UNVARNISH TEXT,
+            PRINTCHAR_SECURITYVARISH TEXT,
+            PRINTCHAR_MATTVARNISH TEXT,
+            PRINTCHAR_CODINGBYSUPPLIER TEXT,
+            PRINTCHAR_BKLOGO TEXT,
+            PRINTCHAR_S_DR TEXT,
+            DRA_COMBINATION TEXT,
+            DRA_COMBINATION_DKTXTUC TEXT,
+            DRA_DIELINE TEXT,
+            DRA_DIELINE_DKTXTUC TEXT,
+            DRA_OTHER TEXT,
+            DRA_OTHER_DKTXTUC TEXT,
+            DRA_ALL TEXT,
+            DRA_ALL_DKTXTUC TEXT,
+            DRA_1 TEXT,
+            DRA_2 TEXT,
+            DRA_3 TEXT,
+            DRA_4 TEXT,
+            DRA_5 TEXT,
+            DRA_6 TEXT,
+            DRA_7 TEXT,
+            DRA_8 TEXT,
+            DRA_9 TEXT,
+            DRA_10 TEXT,
+            LRA TEXT,
+            LRA_VERSION TEXT,
+            LRA_DATE TEXT,
+            LRA_FILENAME TEXT,
+            HRL TEXT,
+            HRL_VERSION TEXT,
+            HRL_DATE TEXT,
+            ACS TEXT,
+            ACS_VERSION TEXT,
+            TPM_DRAWING TEXT,
+            TPM TEXT,
+            TPMTXT TEXT,
+            TPM_STATUS TEXT,
+            GLPT TEXT,
+            GLPTTXT TEXT,
+            ECLASS TEXT,
+            ECLASSTXT TEXT,
+            ECLASS_S TEXT,
+            ECLASS_S_TXT TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+        
+        cursor = memory_db.cursor()
+        cursor.execute(create_table_sql)
+        memory_db.commit()
+        generation.column_names = [row[1] for row in cursor.execute("PRAGMA table_info(masterdata_databricks)")]
+        
+        if with_indexes:
+            self._create_indexes(generation)
+        return generation
+    
+    def _create_indexes(self, generation: _SQLiteGeneration) -> None:
+        """Create the lookup indexes of a generation."""
+        cursor = generation.connection.cursor()
+        
+        # Create indexes for faster lookups
+        cursor.execute("CREATE INDEX idx_matnr8 ON masterdata_databricks (MATNR8)")
+        cursor.execute("CREATE INDEX idx_matnr ON masterdata_databricks (MATNR)")
+        cursor.execute("CREATE INDEX idx_material_type ON masterdata_databricks (MATERIAL_TYPE)")
+        
+        # Full-text index over the text columns, filled from the table in one pass
+        cursor.execute(f"""
+            CREATE VIRTUAL TABLE masterdata_search USING fts5(
+                {', '.join(SEARCH_COLUMNS)},
+                content='masterdata_databricks', content_rowid='rowid',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        """)
+        cursor.execute("INSERT INTO masterdata_search (masterdata_search) VALUES ('rebuild')")
+        
+        generation.connection.commit()
+        
+        generation.typeahead = TypeaheadIndex.build(
+            cursor.execute("SELECT MATNR8, MATNR, MATERIAL_DESCRIPTION FROM masterdata_databricks")
+        )
+        facet_columns = ", ".join(column for _, column in FACET_COLUMNS)
+        rows = cursor.execute(
+            f"SELECT rowid, MATNR8, TPM, {facet_columns} FROM masterdata_databricks ORDER BY MATNR8, rowid"
+        ).fetchall()
+        positions, matnr8s, tpms, *columns = zip(*rows) if rows else ((), (), (), *([()] * len(FACET_COLUMNS)))
+        generation.facets = FacetIndex.build(positions, matnr8s, columns)
+        generation.tpm_index = ReverseIndex.build(zip(tpms, positions))
     
     def initialize_cache(self) -> None:
         """Initialize the in-memory SQLite database with masterdata table."""
         try:
-            # Create in-memory database
-            self._memory_db = sqlite3.connect(":memory:", check_same_thread=False)
-            
-            # Create masterdata_databricks table with same structure as file-based SQLite
-            create_table_sql = """
-            CREATE TABLE masterdata_databricks (
-                MATNR TEXT PRIMARY KEY,
-                MATNR8 INTEGER,
-                MATERIAL_DESCRIPTION TEXT,
-                MATERIAL_TYPE TEXT,
-                XPLANT_STATUS TEXT,
-                PRDHATXT TEXT,
-                MAKEUP TEXT,
-                PLANTS TEXT,
-                PLANTS_TXT TEXT,
-                CONTRACT_MANUFACTURER_CODETYPE TEXT,
-                CONTRACT_MANUFACTURER_CODE TEXT,
-                RESPONSIBLE_FOR_SPECIFICATION TEXT,
-                CONTRACT_MANUFACTURER_MATERIAL TEXT,
-                LAYOUT_APPROVED TEXT,
-                USAGE_PREFIX TEXT,
-                NUMBER_OF_PAGES TEXT,
-                ACF_FLAG TEXT,
-                VISIBLE_MARKINGS TEXT,
-                CODE TEXT,
-                COLORS TEXT,
-                NUMBER_COLORS_FRONT TEXT,
-                CONTRACT_MANUFACTURER TEXT,
-                ARTICLE_CODETYPE TEXT,
-                ARTICLE_CODE TEXT,
-                CONTRACT_MAN_VISIBLE_MARKINGS TEXT,
-                CONTRACT_MANUFACTURER_MT_INDEX TEXT,
-                COMPONENT_SCRAB_KEY TEXT,
-                REMARKS TEXT,
-                PRINTED TEXT,
-                NUMBER_COLORS_BACK TEXT,
-                PRINT_CHARACTERISTICS TEXT,
-                BRAILLE_TEXT TEXT,
-                PRINTCHAR_BRAILLE TEXT,
-                PRINTCHAR_FOILSTAMP TEXT,
-                PRINTCHAR_GOLDHOTFOIL TEXT,
-                PRINTCHAR_EMBOSSDEBOSS TEXT,
-                PRINTCHAR_SPOTVARNISH TEXT,
-                PRINTCHAR_SCRATCHOFF TEXT,
-                PRINTCHAR_LAMINATION TEXT,
-                PRINTCHAR_DIECUT TEXT,
-                PRINTCHAR_PERFORATION TEXT,
-                PRINTCHAR_GLOSSVARNISH TEXT,
-                PRINTCHAR_LEAFLETING TEXT,
-                PRINTCHAR_FOLDING TEXT,
-                PRINTCHAR_RICHPALEGOLD TEXT,
-                PRINTCHAR_SILVERHOTFOIL TEXT,
-                PRINTCHAR_UNVARNISH TEXT,
-                PRINTCHAR_SECURITYVARISH TEXT,
-                PRINTCHAR_MATTVARNISH TEXT,
-                PRINTCHAR_CODINGBYSUPPLIER TEXT,
-                PRINTCHAR_BKLOGO TEXT,
-                PRINTCHAR_S_DR TEXT,
-                DRA_COMBINATION TEXT,
-                DRA_COMBINATION_DKTXTUC TEXT,
-                DRA_DIELINE TEXT,
-                DRA_DIELINE_DKTXTUC TEXT,
-                DRA_OTHER TEXT,
-                DRA_OTHER_DKTXTUC TEXT,
-                DRA_ALL TEXT,
-                DRA_ALL_DKTXTUC TEXT,
-                DRA_1 TEXT,
-                DRA_2 TEXT,
-                DRA_3 TEXT,
-                DRA_4 TEXT,
-                DRA_5 TEXT,
-                DRA_6 TEXT,
-                DRA_7 TEXT,
-                DRA_8 TEXT,
-                DRA_9 TEXT,
-                DRA_10 TEXT,
-                LRA TEXT,
-                LRA_VERSION TEXT,
-                LRA_DATE TEXT,
-                LRA_FILENAME TEXT,
-                HRL TEXT,
-                HRL_VERSION TEXT,
-                HRL_DATE TEXT,
-                ACS TEXT,
-                ACS_VERSION TEXT,
-                TPM_DRAWING TEXT,
-                TPM TEXT,
-                TPMTXT TEXT,
-                TPM_STATUS TEXT,
-                GLPT TEXT,
-                GLPTTXT TEXT,
-                ECLASS TEXT,
-                ECLASSTXT TEXT,
-                ECLASS_S TEXT,
-                ECLASS_S_TXT TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """
-            
-            cursor = self._memory_db.cursor()
-            cursor.execute(create_table_sql)
-            
-            # Create indexes for faster lookups
-            cursor.execute("CREATE INDEX idx_matnr8 ON masterdata_databricks (MATNR8)")
-            cursor.execute("CREATE INDEX idx_matnr ON masterdata_databricks (MATNR)")
-            cursor.execute("CREATE INDEX idx_material_type ON masterdata_databricks (MATERIAL_TYPE)")
-            
-            self._memory_db.commit()
+            self._publish_generation(self._create_generation())
             self._is_initialized = True
             
             logger.info("In-memory masterdata cache initialized successfully")
@@ -137,51 +228,47 @@ class MasterdataCacheManager:
             raise
     
     def load_masterdata_from_sqlite(self, sqlite_db_path: str) -> int:
-        """Load masterdata from file-based SQLite into in-memory cache."""
+        """Load masterdata from file-based SQLite into a new in-memory cache generation."""
         if not self._is_initialized:
             raise RuntimeError("Cache not initialized. Call initialize_cache() first.")
         
         try:
-            # Connect to file-based SQLite database
-            file_db = sqlite3.connect(sqlite_db_path)
-            file_cursor = file_db.cursor()
+            if not os.path.exists(sqlite_db_path):
+                logger.warning(f"SQLite database {sqlite_db_path} not found")
+                return 0
+            
+            load = self._begin_load()
+            # Fill a new generation while readers keep using the current one.
+            # The file database is attached read-only and copied with a single
+            # INSERT ... SELECT, so rows never become Python objects.
+            generation = self._create_generation(with_indexes=False)
+            memory_db = generation.connection
+            source_uri = f"file:{pathname2url(os.path.abspath(sqlite_db_path))}?mode=ro"
+            memory_db.execute("ATTACH DATABASE ? AS source", (source_uri,))
             
             # Check if masterdata_databricks table exists in file database
-            file_cursor.execute("""
-                SELECT name FROM sqlite_master
-                WHERE type='table' AND name='masterdata_databricks'
-            """)
+            source_columns = [row[1] for row in memory_db.execute("PRAGMA source.table_info(masterdata_databricks)")]
             
-            if not file_cursor.fetchone():
+            if not source_columns:
                 logger.warning("masterdata_databricks table not found in SQLite database")
-                file_db.close()
                 return 0
             
-            # Fetch all data from file database
-            file_cursor.execute("SELECT * FROM masterdata_databricks")
-            rows = file_cursor.fetchall()
-            
-            # Get column names
-            column_names = [description[0] for description in file_cursor.description]
-            
-            file_db.close()
+            # Copy the columns both tables have in common
+            columns = ','.join(column for column in source_columns if column in generation.column_names)
+            cursor = memory_db.execute(
+                f"INSERT INTO main.masterdata_databricks ({columns}) SELECT {columns} FROM source.masterdata_databricks"
+            )
+            rows_loaded = cursor.rowcount
+            memory_db.commit()
+            memory_db.execute("DETACH DATABASE source")
             
-            if not rows:
+            if not rows_loaded:
                 logger.warning("No data found in masterdata_databricks table")
                 return 0
             
-            # Clear existing data in memory cache
-            memory_cursor = self._memory_db.cursor()
-            memory_cursor.execute("DELETE FROM masterdata_databricks")
+            self._create_indexes(generation)
+            self._publish_generation(generation, load)
             
-            # Insert data into memory database
-            placeholders = ','.join(['?' for _ in column_names])
-            insert_sql = f"INSERT INTO masterdata_databricks ({','.join(column_names)}) VALUES ({placeholders})"
-            
-            memory_cursor.executemany(insert_sql, rows)
-            self._memory_db.commit()
-            
-            rows_loaded = len(rows)
             logger.info(f"Loaded {rows_loaded} masterdata records into in-memory cache")
             
             return rows_loaded
@@ -191,7 +278,7 @@ class MasterdataCacheManager:
             raise
     
     def bulk_insert_masterdata(self, masterdata_records: List[Dict]) -> int:
-        """Bulk insert masterdata records into in-memory cache."""
+        """Bulk insert masterdata records into a new in-memory cache generation."""
         if not self._is_initialized:
             raise RuntimeError("Cache not initialized. Call initialize_cache() first.")
         
@@ -199,10 +286,10 @@ class MasterdataCacheManager:
             return 0
         
         try:
-            cursor = self._memory_db.cursor()
-            
-            # Clear existing data
-            cursor.execute("DELETE FROM masterdata_databricks")
+            load = self._begin_load()
+            # Fill a new generation while readers keep using the current one
+            generation = self._create_generation(with_indexes=False)
+            cursor = generation.connection.cursor()
             
             # Prepare insert statement
             # We'll use the first record to get the column names
@@ -220,7 +307,9 @@ class MasterdataCacheManager:
             
             # Bulk insert
             cursor.executemany(insert_sql, record_tuples)
-            self._memory_db.commit()
+            generation.connection.commit()
+            self._create_indexes(generation)
+            self._publish_generation(generation, load)
             
             rows_inserted = len(record_tuples)
             logger.info(f"Bulk inserted {rows_inserted} masterdata records into in-memory cache")
@@ -231,36 +320,154 @@ class MasterdataCacheManager:
             logger.error(f"Failed to bulk insert masterdata: {str(e)}")
             raise
     
-    def get_masterdata_by_matnr8(self, matnr8: int) -> Optional[Dict]:
-        """Get masterdata record by MATNR8 from in-memory cache."""
+    def apply_masterdata_changes(self, masterdata_records: List[Dict], deleted_matnrs: Iterable[str]) -> int:
+        """
+        Publish a new generation with the records upserted by MATNR and deleted_matnrs removed.
+
+        The unchanged rows are copied from the current generation inside
+        SQLite, so an incremental refresh never reloads the SQLite file.
+        Returns the number of records in the new generation.
+        """
         if not self._is_initialized:
             raise RuntimeError("Cache not initialized. Call initialize_cache() first.")
         
         try:
-            cursor = self._memory_db.cursor()
-            cursor.execute("SELECT * FROM masterdata_databricks WHERE MATNR8 = ?", (matnr8,))
-            row = cursor.fetchone()
+            load = self._begin_load()
+            current = self._current_generation()
+            generation = self._create_generation(with_indexes=False)
+            memory_db = generation.connection
+            replaced = [record["MATNR"] for record in masterdata_records]
+            replaced.extend(deleted_matnrs)
+            
+            columns = ','.join(generation.column_names)
+            memory_db.execute("ATTACH DATABASE ? AS current", (current.uri,))
+            memory_db.execute(
+                f"INSERT INTO main.masterdata_databricks ({columns}) "
+                f"SELECT {columns} FROM current.masterdata_databricks "
+                "WHERE MATNR NOT IN (SELECT value FROM json_each(?))",
+                (json.dumps(replaced),),
+            )
+            memory_db.commit()
+            memory_db.execute("DETACH DATABASE current")
             
-            if not row:
-                return None
+            if masterdata_records:
+                # Stored rows also carry columns the cache does not keep (content_hash)
+                record_columns = [col for col in masterdata_records[0].keys() if col in generation.column_names]
+                placeholders = ','.join(['?' for _ in record_columns])
+                memory_db.executemany(
+                    f"INSERT OR REPLACE INTO masterdata_databricks ({','.join(record_columns)}) VALUES ({placeholders})",
+                    [tuple(record.get(col) for col in record_columns) for record in masterdata_records],
+                )
+                memory_db.commit()
             
-            # Get column names
-            column_names = [description[0] for description in cursor.description]
+            rows = memory_db.execute("SELECT COUNT(*) FROM masterdata_databricks").fetchone()[0]
+            self._create_indexes(generation)
+            self._publish_generation(generation, load)
+            
+            logger.info(f"Applied {len(masterdata_records)} changed records to in-memory cache ({rows} records)")
             
-            # Convert to dictionary
-            return dict(zip(column_names, row))
+            return rows
             
         except Exception as e:
-            logger.error(f"Failed to get masterdata by MATNR8 {matnr8}: {str(e)}")
+            logger.error(f"Failed to apply masterdata changes: {str(e)}")
             raise
     
+    def _lookup(self, generation: _SQLiteGeneration, matnr8: int,
+                columns: Optional[AbstractSet[str]] = None) -> Optional[Dict]:
+        column_names, select_list = generation.select_list(columns)
+        cursor = generation.read_connection().execute(
+            f"SELECT {select_list} FROM masterdata_databricks WHERE MATNR8 = ?", (matnr8,)
+        )
+        row = cursor.fetchone()
+        
+        if not row:
+            return None
+        
+        # Convert to dictionary
+        return dict(zip(column_names, row))
+    
+    def _lookup_many(self, generation: _SQLiteGeneration, matnr8s: List[int],
+                     columns: Optional[AbstractSet[str]] = None) -> Dict[int, Dict]:
+        # One indexed IN lookup; the keys are passed as a single JSON parameter
+        # so batches are not limited by SQLite's bound-variable maximum
+        column_names, select_list = generation.select_list(columns)
+        cursor = generation.read_connection().execute(
+            f"SELECT {select_list} FROM masterdata_databricks WHERE MATNR8 IN (SELECT value FROM json_each(?))",
+            (json.dumps(matnr8s),),
+        )
+        
+        records = {}
+        for row in cursor:
+            record = dict(zip(column_names, row))
+            records.setdefault(record["MATNR8"], record)
+        return records
+    
+    def _page(self, generation: _SQLiteGeneration, after: Optional[Tuple[int, int]], limit: int,
+              columns: Optional[AbstractSet[str]] = None) -> List[Tuple[int, Dict]]:
+        # idx_matnr8 is ordered by (MATNR8, rowid), so both queries seek
+        # straight to the first row of the page
+        column_names, select_list = generation.select_list(columns)
+        if after is None:
+            sql = (f"SELECT rowid, {select_list} FROM masterdata_databricks "
+                   "WHERE MATNR8 IS NOT NULL ORDER BY MATNR8, rowid LIMIT ?")
+            parameters = (limit,)
+        else:
+            sql = (f"SELECT rowid, {select_list} FROM masterdata_databricks "
+                   "WHERE (MATNR8, rowid) > (?, ?) ORDER BY MATNR8, rowid LIMIT ?")
+            parameters = (*after, limit)
+        
+        cursor = generation.read_connection().execute(sql, parameters)
+        return [(row[0], dict(zip(column_names, row[1:]))) for row in cursor]
+    
+    def _iter_records(self, generation: _SQLiteGeneration,
+                      columns: Optional[AbstractSet[str]] = None) -> Iterator[Dict]:
+        # A streamed export may resume on any worker thread, so it reads through
+        # its own connection instead of the thread-local one
+        column_names, select_list = generation.select_list(columns)
+        connection = generation.open_reader()
+        try:
+            cursor = connection.execute(f"SELECT {select_list} FROM masterdata_databricks ORDER BY MATNR8, rowid")
+            while True:
+                rows = cursor.fetchmany(1000)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(zip(column_names, row))
+        finally:
+            connection.close()
+    
+    def _records_at(self, generation: _SQLiteGeneration, positions: List[int],
+                    columns: Optional[AbstractSet[str]] = None) -> List[Dict]:
+        column_names, select_list = generation.select_list(columns)
+        cursor = generation.read_connection().execute(
+            f"SELECT rowid, {select_list} FROM masterdata_databricks WHERE rowid IN (SELECT value FROM json_each(?))",
+            (json.dumps(positions),),
+        )
+        records = {row[0]: dict(zip(column_names, row[1:])) for row in cursor}
+        return [records[position] for position in positions if position in records]
+    
+    def _search(self, generation: _SQLiteGeneration, terms: List[str], limit: int, prefix: bool,
+                columns: Optional[AbstractSet[str]] = None) -> List[Dict]:
+        column_names, _ = generation.select_list(columns)
+        select_list = ", ".join(f"m.{name}" for name in column_names)
+        cursor = generation.read_connection().execute(
+            f"""
+            SELECT {select_list} FROM masterdata_search
+            JOIN masterdata_databricks m ON m.rowid = masterdata_search.rowid
+            WHERE masterdata_search MATCH ?
+            ORDER BY masterdata_search.rank, m.rowid
+            LIMIT ?
+            """,
+            (fts5_match_expression(terms, prefix), limit),
+        )
+        return [dict(zip(column_names, row)) for row in cursor]
+    
     def get_all_masterdata(self, limit: Optional[int] = None) -> List[Dict]:
         """Get all masterdata records from in-memory cache."""
-        if not self._is_initialized:
-            raise RuntimeError("Cache not initialized. Call initialize_cache() first.")
+        generation = self._current_generation()
         
         try:
-            cursor = self._memory_db.cursor()
+            cursor = generation.read_connection().cursor()
             
             if limit:
                 cursor.execute("SELECT * FROM masterdata_databricks ORDER BY MATNR8 LIMIT ?", (limit,))
@@ -282,13 +489,38 @@ class MasterdataCacheManager:
             logger.error(f"Failed to get all masterdata: {str(e)}")
             raise
     
+    def _memory_usage(self, generation: _SQLiteGeneration) -> Tuple[Dict[str, int], int, Dict[str, int]]:
+        connection = generation.read_connection()
+        # Column sizes are the stored value bytes; SQLite adds a few bytes of
+        # record header per value and page overhead on top
+        totals = connection.execute(
+            "SELECT " + ", ".join(f"COALESCE(SUM(LENGTH(CAST({name} AS BLOB))), 0)" for name in generation.column_names)
+            + " FROM masterdata_databricks"
+        ).fetchone()
+        columns = dict(zip(generation.column_names, totals))
+
+        try:
+            pages = dict(connection.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"))
+        except sqlite3.OperationalError:
+            # SQLite built without the dbstat table: only the total is known
+            page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+            page_count = connection.execute("PRAGMA page_count").fetchone()[0]
+            return columns, page_size * page_count, {}
+
+        indexes = {
+            name: pages.get(name, 0) for name in ("idx_matnr8", "idx_matnr", "idx_material_type")
+        }
+        indexes["search"] = sum(size for name, size in pages.items() if name.startswith("masterdata_search"))
+        return columns, pages.get("masterdata_databricks", 0), indexes
+    
     def get_cache_stats(self) -> Dict:
         """Get cache statistics."""
-        if not self._is_initialized:
+        generation = self._generation
+        if not self._is_initialized or generation is None:
             return {"initialized": False, "record_count": 0}
         
         try:
-            cursor = self._memory_db.cursor()
+            cursor = generation.read_connection().cursor()
             cursor.execute("SELECT COUNT(*) FROM masterdata_databricks")
             count = cursor.fetchone()[0]
             
@@ -298,8 +530,11 @@ class MasterdataCacheManager:
             
             return {
                 "initialized": True,
+                "engine": self.engine,
+                "generation": generation.number,
                 "record_count": count,
-                "last_updated": last_updated
+                "last_updated": last_updated,
+                "memory": self.get_memory_stats(),
             }
             
         except Exception as e:
@@ -312,9 +547,7 @@ class MasterdataCacheManager:
             return
         
         try:
-            cursor = self._memory_db.cursor()
-            cursor.execute("DELETE FROM masterdata_databricks")
-            self._memory_db.commit()
+            self._publish_generation(self._create_generation())
             logger.info("In-memory cache cleared")
             
         except Exception as e:
@@ -322,13 +555,38 @@ class MasterdataCacheManager:
             raise
     
     def close_cache(self) -> None:
-        """Close the in-memory database connection."""
-        if self._memory_db:
-            self._memory_db.close()
-            self._memory_db = None
+        """Release the in-memory database; readers still using it finish first."""
+        if self._generation is not None:
+            # The connection is closed when the last reader drops its reference
+            self._generation = None
             self._is_initialized = False
             logger.info("In-memory cache closed")
 
 
+def create_cache_manager(engine: Optional[str] = None):
+    """
+    Create the cache manager for the configured engine.
+
+    The engine is taken from the MASTERDATA_CACHE_ENGINE environment variable
+    when not given explicitly: "sqlite" (default) or "columnar". The columnar
+    engine shares its data between worker processes through the snapshot file
+    named by MASTERDATA_CACHE_SNAPSHOT, if set, compressed when
+    MASTERDATA_CACHE_SNAPSHOT_COMPRESSION is "zlib".
+    """
+    engine = (engine or os.getenv("MASTERDATA_CACHE_ENGINE", "sqlite")).strip().lower()
+    snapshot_path = os.getenv("MASTERDATA_CACHE_SNAPSHOT") or None
+    snapshot_compression = (os.getenv("MASTERDATA_CACHE_SNAPSHOT_COMPRESSION") or "").strip().lower() or None
+
+    if engine == "sqlite":
+        if snapshot_path:
+            logger.warning("MASTERDATA_CACHE_SNAPSHOT is only used by the columnar cache engine")
+        return MasterdataCacheManager()
+    if engine == "columnar":
+        from .columnar_cache import ColumnarMasterdataCacheManager
+        return ColumnarMasterdataCacheManager(snapshot_path=snapshot_path, snapshot_compression=snapshot_compression)
+
+    raise ValueError(f"Unknown masterdata cache engine '{engine}'. Use 'sqlite' or 'columnar'.")
+
+
 # Global cache manager instance
-cache_manager = MasterdataCacheManager()
\ No newline at end of file
+cache_manager = create_cache_manager()
@@ -0,0 +1,1157 @@
+"""
+Columnar in-memory cache engine for masterdata.
+Each column is stored as a compact array and MATNR8 lookups go through a hash
+index to the row offset, so point lookups never touch SQL.
+
+Text columns are frozen into the smallest of three encodings when a load
+finishes: sparse row maps for columns where nearly every row holds the same
+value, and otherwise dictionary codes or a plain UTF-8 buffer, whichever is
+estimated smaller. Values are decoded only when a record is materialized.
+
+With a snapshot path configured, every load is also written to a binary
+snapshot and the published generation reads its columns and indexes from the
+mapped file (see snapshot.py), so uvicorn workers on one host share a single
+copy of the data and a restart opens the snapshot instead of rebuilding the
+indexes. Each worker watches the snapshot and switches to a newer one written
+by another worker's refresh.
+"""
+import logging
+import operator
+import os
+import sqlite3
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from datetime import datetime, timezone
+from collections.abc import Sequence as SequenceABC
+from itertools import accumulate, compress, islice
+from typing import AbstractSet, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .base import BaseMasterdataCache, CacheGeneration
+from .facets import FACET_COLUMNS, FacetIndex
+from .memory import deep_sizeof
+from .reverse_index import ReverseIndex
+from .schema import INTEGER_COLUMNS, MASTERDATA_COLUMNS
+from .search import SEARCH_COLUMNS, InvertedIndex
+from .snapshot import COMPRESSIONS, Snapshot, SnapshotError, SnapshotWriter, exclusive_lock, file_identity
+from .typeahead import TypeaheadIndex
+
+logger = logging.getLogger(__name__)
+
+_KNOWN_COLUMNS = frozenset(MASTERDATA_COLUMNS)
+
+# Maps 0/1 flag bytes to their negation
+_NOT = bytes.maketrans(b"\x00\x01", b"\x01\x00")
+
+# Rows sampled to rule out a sparse encoding without a full scan
+_SAMPLE_SIZE = 1_024
+
+# Bytes of a str object on top of its characters (CPython, ASCII text)
+_STR_OVERHEAD = 49
+
+
+def _dictionary_is_smaller(distinct_bytes: int, distinct: int, value_bytes: int, rows: int) -> bool:
+    """
+    Whether a dictionary encoding is estimated smaller than a UTF-8 buffer.
+
+    distinct_bytes is the UTF-8 length of the distinct values and value_bytes
+    that of the values of all rows. A dictionary costs a str object per
+    distinct value plus a code per row, a buffer the text of every row plus a
+    4-byte offset.
+    """
+    code_width = 1 if distinct <= 1 << 8 else 2 if distinct <= 1 << 16 else 4
+    dictionary = distinct_bytes + _STR_OVERHEAD * distinct + code_width * rows
+    return dictionary < value_bytes + 4 * rows
+
+
+def _narrow(codes: array, typecode: str) -> array:
+    """Copy an array of small unsigned integers into a narrower typecode."""
+    if codes.typecode == typecode:
+        return codes
+    narrow = array(typecode)
+    if sys.byteorder != "little":
+        narrow.extend(codes)
+        return narrow
+    # Keep the low-order bytes of every item instead of converting item by item
+    data = codes.tobytes()
+    wide, size = codes.itemsize, narrow.itemsize
+    low = bytearray(len(codes) * size)
+    for byte in range(size):
+        low[byte::size] = data[byte::wide]
+    narrow.frombytes(low)
+    return narrow
+
+
+def _copy_runs(buffer, runs: Sequence[Tuple[int, int]]) -> array:
+    """Copy the items of the given [start, stop) runs of an array or typed view into one array."""
+    view = memoryview(buffer)
+    copied = array(view.format)
+    for start, stop in runs:
+        copied.frombytes(view[start:stop].cast("B"))
+    return copied
+
+
+def _copy_byte_runs(buffer, runs: Sequence[Tuple[int, int]]) -> bytearray:
+    view = memoryview(buffer)
+    return bytearray().join(view[start:stop] for start, stop in runs)
+
+
+class _IntColumn:
+    """Nullable 64-bit integer column (INTEGER affinity)."""
+
+    __slots__ = ("_values", "_nulls")
+
+    def __init__(self, values: Optional[array] = None, nulls: Optional[bytearray] = None):
+        self._values = array("q") if values is None else values
+        self._nulls = nulls
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def extend(self, values: Sequence) -> None:
+        """Append a batch of values."""
+        if None not in values and self._nulls is None:
+            # Converted in full first: array.extend keeps the items appended before a failure
+            try:
+                batch = array("q", values)
+            except (TypeError, OverflowError):
+                pass
+            else:
+                self._values.extend(batch)
+                return
+        for value in values:
+            self._append(value)
+
+    def _append(self, value) -> None:
+        if value is not None:
+            try:
+                self._values.append(int(value))
+                if self._nulls is not None:
+                    self._nulls.append(0)
+                return
+            except (TypeError, ValueError, OverflowError):
+                pass
+        if self._nulls is None:
+            self._nulls = bytearray(len(self._values))
+        self._values.append(0)
+        self._nulls.append(1)
+
+    def get(self, row: int) -> Optional[int]:
+        if self._nulls is not None and self._nulls[row]:
+            return None
+        return self._values[row]
+
+    def finish(self) -> "_IntColumn":
+        return self
+
+    def copy_runs(self, runs: Sequence[Tuple[int, int]]) -> "_IntColumn":
+        """Return a column under construction holding the rows of the given [start, stop) runs."""
+        nulls = None if self._nulls is None else _copy_byte_runs(self._nulls, runs)
+        return _IntColumn(_copy_runs(self._values, runs), nulls)
+
+    def dump(self, writer: SnapshotWriter) -> Dict:
+        """Write the column to a snapshot and return its directory entry."""
+        return {
+            "encoding": "int",
+            "values": writer.add(self._values),
+            "nulls": None if self._nulls is None else writer.add(self._nulls),
+        }
+
+
+class _StringColumn:
+    """
+    Nullable text column under construction.
+
+    Values are dictionary-encoded while that is estimated to be smaller than
+    plain text; otherwise the column switches to one UTF-8 buffer plus an
+    offsets array. finish() picks the final encoding.
+    """
+
+    __slots__ = ("_data", "_offsets", "_nulls", "_lookup", "_codes", "_distinct_bytes", "_value_bytes")
+
+    # Distinct values up to which a column stays dictionary-encoded
+    max_dictionary_size = 65_536
+    # Rows after which a column whose dictionary is estimated larger than its
+    # text no longer stays dictionary-encoded
+    dictionary_probe_rows = 4_096
+
+    def __init__(self):
+        self._data = bytearray()
+        # 32-bit offsets keep the index at 4 bytes per row; a single column
+        # would have to exceed 4GB of text before this overflows.
+        self._offsets = array("I", [0])
+        self._nulls: Optional[bytearray] = None
+        self._lookup: Optional[Dict[Optional[bytes], int]] = {}
+        self._codes = array("I")
+        # UTF-8 length of the distinct values and of the values of all rows,
+        # kept while dictionary-encoded
+        self._distinct_bytes = self._value_bytes = 0
+
+    @classmethod
+    def from_buffer(cls, data: bytearray, offsets: array, nulls: Optional[bytearray]) -> "_StringColumn":
+        """Continue a column from a UTF-8 buffer and its offsets."""
+        column = cls()
+        column._data, column._offsets, column._nulls = data, offsets, nulls
+        column._lookup = column._codes = None
+        return column
+
+    @classmethod
+    def from_codes(cls, lookup: Dict[Optional[bytes], int], codes: array) -> "_StringColumn":
+        """Continue a dictionary-encoded column from the code of every UTF-8 value and the codes."""
+        column = cls()
+        column._lookup = lookup
+        column._codes = codes if codes.typecode == "I" else array("I", codes)
+        lengths = [0 if value is None else len(value) for value in lookup]
+        column._distinct_bytes = sum(lengths)
+        column._value_bytes = sum(map(lengths.__getitem__, column._codes))
+        return column
+
+    def __len__(self) -> int:
+        if self._lookup is not None:
+            return len(self._codes)
+        return len(self._offsets) - 1
+
+    def extend(self, values: Sequence) -> None:
+        """Append a batch of values, storing non-text values as text like SQLite does."""
+        try:
+            encoded = [None if value is None else value.encode("utf-8") for value in values]
+        except AttributeError:
+            encoded = [None if value is None else str(value).encode("utf-8") for value in values]
+        self.extend_utf8(encoded)
+
+    def extend_utf8(self, values: Sequence[Optional[bytes]]) -> None:
+        """Append a batch of already UTF-8 encoded values."""
+        lookup = self._lookup
+        if lookup is not None:
+            codes = self._codes
+            known = len(lookup)
+            codes.extend([lookup.setdefault(value, len(lookup)) for value in values])
+            # New values are the last ones inserted
+            self._distinct_bytes += sum(
+                len(value) for value in islice(reversed(lookup), len(lookup) - known) if value is not None
+            )
+            self._value_bytes += sum(len(value) for value in values if value is not None)
+            if len(lookup) <= self.max_dictionary_size and (
+                len(codes) < self.dictionary_probe_rows
+                or _dictionary_is_smaller(self._distinct_bytes, len(lookup), self._value_bytes, len(codes))
+            ):
+                return
+            # The dictionary costs more than the text: re-append everything to the buffer
+            dictionary = list(lookup)
+            self._lookup = self._codes = None
+            self._extend_buffer([dictionary[code] for code in codes])
+            return
+        self._extend_buffer(values)
+
+    def _extend_buffer(self, values: Sequence[Optional[bytes]]) -> None:
+        if None in values:
+            if self._nulls is None:
+                self._nulls = bytearray(len(self._offsets) - 1)
+            self._nulls.extend([value is None for value in values])
+            values = [b"" if value is None else value for value in values]
+        elif self._nulls is not None:
+            self._nulls.extend(bytes(len(values)))
+
+        ends = accumulate(map(len, values), initial=self._offsets[-1])
+        next(ends)
+        self._offsets.extend(ends)
+        self._data += b"".join(values)
+
+    def finish(self):
+        """Freeze the column into its most compact read-only encoding."""
+        if self._lookup is None:
+            column = _TextColumn(bytes(self._data), self._offsets, self._nulls)
+            return _SparseColumn.encode(column) or column
+
+        dictionary = [None if value is None else value.decode("utf-8") for value in self._lookup]
+        column = _DictionaryColumn(dictionary, self._codes)
+        sparse = _SparseColumn.encode(column)
+        if sparse is not None:
+            return sparse
+        if not _dictionary_is_smaller(self._distinct_bytes, len(dictionary), self._value_bytes, len(column)):
+            # Too few rows to have left dictionary mode while loading
+            return _TextColumn.from_values([dictionary[code] for code in self._codes])
+        return column
+
+
+class _TextColumn:
+    """Nullable text column stored as one UTF-8 buffer plus an offsets array."""
+
+    __slots__ = ("_data", "_offsets", "_nulls")
+
+    def __init__(self, data: bytes, offsets: array, nulls: Optional[bytearray]):
+        self._data = data
+        self._offsets = offsets
+        self._nulls = nulls
+
+    @classmethod
+    def from_values(cls, values: Sequence[Optional[str]]) -> "_TextColumn":
+        encoded = [b"" if value is None else value.encode("utf-8") for value in values]
+        nulls = bytearray(value is None for value in values) if None in values else None
+        return cls(b"".join(encoded), array("I", accumulate(map(len, encoded), initial=0)), nulls)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def get(self, row: int) -> Optional[str]:
+        if self._nulls is not None and self._nulls[row]:
+            return None
+        offsets = self._offsets
+        return self._data[offsets[row]:offsets[row + 1]].decode("utf-8")
+
+    def sparse_rows(self, limit: int) -> Optional[Tuple[Optional[str], array]]:
+        """
+        Return the more frequent of '' and NULL and the rows holding anything
+        else, or None when more than limit rows do.
+        """
+        offsets, nulls = self._offsets, self._nulls
+        # Reject dense columns on a sample before counting every row
+        sample = range(0, len(self), max(1, len(self) // _SAMPLE_SIZE))
+        if sample:
+            non_null = sum(1 for row in sample if not nulls or not nulls[row])
+            not_empty = sum(1 for row in sample if offsets[row] != offsets[row + 1] or (nulls and nulls[row]))
+            if min(non_null, not_empty) > 2 * limit * len(sample) / len(self):
+                return None
+
+        not_null = bytes(len(self)).translate(_NOT) if nulls is None else nulls.translate(_NOT)
+        if sum(not_null) <= limit:
+            return None, array("I", compress(range(len(self)), not_null))
+        # NULL values are stored empty, so '' rows are the empty, non-NULL ones
+        empty_text = bytes(map(operator.and_, map(operator.eq, offsets, islice(offsets, 1, None)), not_null))
+        if len(self) - sum(empty_text) > limit:
+            return None
+        return "", array("I", compress(range(len(self)), empty_text.translate(_NOT)))
+
+    def take(self, rows: array) -> "_TextColumn":
+        """Return a column with the given rows only."""
+        data, offsets = self._data, self._offsets
+        values = [data[offsets[row]:offsets[row + 1]] for row in rows]
+        nulls = None if self._nulls is None else bytearray(self._nulls[row] for row in rows)
+        return _TextColumn(b"".join(values), array("I", accumulate(map(len, values), initial=0)), nulls)
+
+    def copy_runs(self, runs: Sequence[Tuple[int, int]]) -> _StringColumn:
+        """Return a column under construction holding the rows of the given [start, stop) runs."""
+        return self._copy_runs(runs, 0)
+
+    def _copy_runs(self, runs: Sequence[Tuple[int, int]], base: int) -> _StringColumn:
+        data, offsets = self._data, self._offsets
+        copied = bytearray()
+        copied_offsets = array("I", [0])
+        for start, stop in runs:
+            begin = offsets[start]
+            # Shift the run's end offsets to where its text lands in the copy
+            copied_offsets.extend(map((len(copied) - begin).__add__, offsets[start + 1:stop + 1]))
+            copied += data[base + begin:base + offsets[stop]]
+        nulls = None if self._nulls is None else _copy_byte_runs(self._nulls, runs)
+        return _StringColumn.from_buffer(copied, copied_offsets, nulls)
+
+    def dump(self, writer: SnapshotWriter) -> Dict:
+        """Write the column to a snapshot and return its directory entry."""
+        return {
+            "encoding": "text",
+            "data": writer.add(self._data),
+            "offsets": writer.add(self._offsets),
+            "nulls": None if self._nulls is None else writer.add(self._nulls),
+        }
+
+
+class _MappedTextColumn(_TextColumn):
+    """Text column reading its buffers from a snapshot."""
+
+    __slots__ = ("_base",)
+
+    def __init__(self, data, base: int, offsets: Sequence[int], nulls: Optional[Sequence[int]]):
+        # data is the mapping, or the inflated buffer of a compressed snapshot
+        super().__init__(data, offsets, nulls)
+        self._base = base
+
+    def get(self, row: int) -> Optional[str]:
+        if self._nulls is not None and self._nulls[row]:
+            return None
+        offsets, base = self._offsets, self._base
+        return self._data[base + offsets[row]:base + offsets[row + 1]].decode("utf-8")
+
+    def copy_runs(self, runs: Sequence[Tuple[int, int]]) -> _StringColumn:
+        """Return a column under construction holding the rows of the given [start, stop) runs."""
+        return self._copy_runs(runs, self._base)
+
+    def dump(self, writer: SnapshotWriter) -> Dict:
+        """Write the column to a snapshot and return its directory entry."""
+        return {
+            "encoding": "text",
+            "data": writer.add(memoryview(self._data)[self._base:self._base + self._offsets[-1]]),
+            "offsets": writer.add(self._offsets),
+            "nulls": None if self._nulls is None else writer.add(self._nulls),
+        }
+
+
+class _DictionaryColumn:
+    """Low-cardinality text column stored as one small integer code per row."""
+
+    __slots__ = ("_values", "_codes")
+
+    def __init__(self, values: List[Optional[str]], codes: array):
+        self._values = values
+        # One byte per row for up to 256 distinct values, two up to 65536.
+        # Codes mapped from a snapshot were narrowed before they were written.
+        typecode = "B" if len(values) <= 1 << 8 else "H" if len(values) <= 1 << 16 else "I"
+        self._codes = codes if isinstance(codes, memoryview) else _narrow(codes, typecode)
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def get(self, row: int) -> Optional[str]:
+        return self._values[self._codes[row]]
+
+    def sparse_rows(self, limit: int) -> Optional[Tuple[Optional[str], array]]:
+        """
+        Return the most frequent value and the rows holding any other value,
+        or None when more than limit rows do.
+        """
+        codes = self._codes
+        if not codes:
+            return None, array("I")
+        # Only a value held by nearly every row qualifies, so a sample finds it
+        code, _ = Counter(codes[::max(1, len(codes) // _SAMPLE_SIZE)]).most_common(1)[0]
+        if len(codes) - codes.count(code) > limit:
+            return None
+        return self._values[code], array("I", compress(range(len(codes)), map(code.__ne__, codes)))
+
+    def take(self, rows: array):
+        """Return a column with the given rows only."""
+        codes, values = self._codes, self._values
+        taken = array("I", [codes[row] for row in rows])
+        lengths = [0 if value is None else len(value.encode("utf-8")) for value in values]
+        if not _dictionary_is_smaller(sum(lengths), len(values), sum(map(lengths.__getitem__, taken)), len(taken)):
+            return _TextColumn.from_values([values[code] for code in taken])
+        return _DictionaryColumn(values, taken)
+
+    def copy_runs(self, runs: Sequence[Tuple[int, int]]) -> _StringColumn:
+        """Return a column under construction holding the rows of the given [start, stop) runs."""
+        lookup = {None if value is None else value.encode("utf-8"): code for code, value in enumerate(self._values)}
+        return _StringColumn.from_codes(lookup, _copy_runs(self._codes, runs))
+
+    def dump(self, writer: SnapshotWriter) -> Dict:
+        """Write the column to a snapshot and return its directory entry."""
+        return {
+            "encoding": "dictionary",
+            "values": _TextColumn.from_values(self._values).dump(writer),
+            "codes": writer.add(self._codes),
+        }
+
+
+class _SparseColumn:
+    """
+    Column in which almost every row holds the same value.
+
+    Only the rows with another value are stored: their sorted row numbers and
+    their values in a nested column. A bitmap with one bit per row answers
+    the common default case without searching the row numbers.
+    """
+
+    __slots__ = ("_default", "_rows", "_values", "_present")
+
+    # Share of rows at most holding a non-default value for a sparse encoding
+    max_density = 1 / 8
+
+    def __init__(self, default: Optional[str], rows: array, values, row_count: int,
+                 present: Optional[bytearray] = None):
+        self._default = default
+        self._rows = rows
+        self._values = values
+        self._present = present
+        if present is None:
+            self._present = bytearray((row_count >> 3) + 1)
+            for row in rows:
+                self._present[row >> 3] |= 1 << (row & 7)
+
+    @classmethod
+    def encode(cls, column) -> Optional["_SparseColumn"]:
+        """Return the sparse encoding of a column, or None when it is not sparse enough."""
+        sparse = column.sparse_rows(int(len(column) * cls.max_density))
+        if sparse is None:
+            return None
+        default, rows = sparse
+        return cls(default, rows, column.take(rows), len(column))
+
+    def get(self, row: int) -> Optional[str]:
+        if not self._present[row >> 3] & (1 << (row & 7)):
+            return self._default
+        return self._values.get(bisect_left(self._rows, row))
+
+    def copy_runs(self, runs: Sequence[Tuple[int, int]]) -> _StringColumn:
+        """Return a column under construction holding the rows of the given [start, stop) runs."""
+        # Every row starts with the default's code 0; only the other rows are decoded
+        lookup = {None if self._default is None else self._default.encode("utf-8"): 0}
+        codes = array("I", [0]) * sum(stop - start for start, stop in runs)
+        rows, get = self._rows, self._values.get
+        copied = 0
+        for start, stop in runs:
+            for position in range(bisect_left(rows, start), bisect_left(rows, stop)):
+                value = get(position)
+                value = None if value is None else value.encode("utf-8")
+                codes[copied + rows[position] - start] = lookup.setdefault(value, len(lookup))
+            copied += stop - start
+        return _StringColumn.from_codes(lookup, codes)
+
+    def dump(self, writer: SnapshotWriter) -> Dict:
+        """Write the column to a snapshot and return its directory entry."""
+        return {
+            "encoding": "sparse",
+            "default": self._default,
+            "rows": writer.add(self._rows),
+            "values": self._values.dump(writer),
+            "present": writer.add(self._present),
+        }
+
+
+class _ConstantColumn:
+    """Column with the same value in every row (absent or defaulted columns)."""
+
+    __slots__ = ("_value",)
+
+    def __init__(self, value=None):
+        self._value = value
+
+    def get(self, row: int):
+        return self._value
+
+    def dump(self, writer: SnapshotWriter) -> Dict:
+        """Return the directory entry of the column; it has no buffers."""
+        return {"encoding": "constant", "value": self._value}
+
+
+def _load_column(snapshot: Snapshot, entry: Dict):
+    """Rebuild a column from its snapshot directory entry, reading the buffers in place."""
+    encoding = entry["encoding"]
+    if encoding == "int":
+        return _IntColumn(snapshot.buffer(entry["values"]), snapshot.buffer(entry["nulls"]))
+    if encoding == "text":
+        data, base = snapshot.bytes_at(entry["data"])
+        return _MappedTextColumn(data, base, snapshot.buffer(entry["offsets"]), snapshot.buffer(entry["nulls"]))
+    if encoding == "dictionary":
+        # The distinct values are few; decode them once into this process
+        values = _load_column(snapshot, entry["values"])
+        return _DictionaryColumn([values.get(code) for code in range(len(values))], snapshot.buffer(entry["codes"]))
+    if encoding == "sparse":
+        rows = snapshot.buffer(entry["rows"])
+        present = snapshot.buffer(entry["present"])
+        return _SparseColumn(entry["default"], rows, _load_column(snapshot, entry["values"]), 0, present)
+    if encoding == "constant":
+        return _ConstantColumn(entry["value"])
+    raise SnapshotError(f"Unknown column encoding '{encoding}' in snapshot {snapshot.path}")
+
+
+class _SortedKeyIndex:
+    """
+    MATNR8 -> row offset index answered by binary search over the MATNR8 sort order.
+
+    Used for tables mapped from a snapshot instead of a per-process dict; like
+    the dict, it resolves duplicate MATNR8s to their first row.
+    """
+
+    __slots__ = ("_keys", "_rows", "_start")
+
+    def __init__(self, sorted_keys: Sequence[int], sorted_rows: Sequence[int], keyed_start: int):
+        self._keys = sorted_keys
+        self._rows = sorted_rows
+        self._start = keyed_start
+
+    def get(self, matnr8: int, default: Optional[int] = None) -> Optional[int]:
+        keys = self._keys
+        position = bisect_left(keys, matnr8)
+        if position < len(keys) and keys[position] == matnr8:
+            return self._rows[self._start + position]
+        return default
+
+    def __contains__(self, matnr8: int) -> bool:
+        return self.get(matnr8) is not None
+
+    def __getitem__(self, matnr8: int) -> int:
+        row = self.get(matnr8)
+        if row is None:
+            raise KeyError(matnr8)
+        return row
+
+
+class _TypeaheadRecords(SequenceABC):
+    """The (MATNR8, MATNR, MATERIAL_DESCRIPTION) typeahead record of every row, read from the columns."""
+
+    __slots__ = ("_row_count", "_getters")
+
+    def __init__(self, row_count: int, getters: Tuple[Callable[[int], object], ...]):
+        self._row_count = row_count
+        self._getters = getters
+
+    def __len__(self) -> int:
+        return self._row_count
+
+    def __getitem__(self, row: int) -> Tuple:
+        return tuple(get(row) for get in self._getters)
+
+
+class _ColumnarTable(CacheGeneration):
+    """Cache generation holding an immutable set of columns plus the MATNR8 -> row offset index."""
+
+    def __init__(self, columns, row_count: int, index: Dict[int, int], sorted_rows: array, sorted_keys: array,
+                 search_index: InvertedIndex, last_updated: Optional[str]):
+        super().__init__()
+        self.names = tuple(name for name, _ in columns)
+        self.getters = tuple(get for _, get in columns)
+        self.row_count = row_count
+        self.index = index
+        self.sorted_rows = sorted_rows
+        # MATNR8s of the non-NULL tail of sorted_rows, for binary search
+        self.sorted_keys = sorted_keys
+        self.keyed_start = len(sorted_rows) - len(sorted_keys)
+        self.search_index = search_index
+        self.last_updated = last_updated
+        # Mapped snapshot the columns read from, if any
+        self.snapshot: Optional[Snapshot] = None
+
+    @classmethod
+    def empty(cls) -> "_ColumnarTable":
+        columns = tuple((name, _ConstantColumn().get) for name in MASTERDATA_COLUMNS)
+        return cls(columns, 0, {}, array("I"), array("q"), InvertedIndex.empty(), None)
+
+    def build_indexes(self, keys: Sequence[Optional[int]]) -> None:
+        """Build the search, typeahead, facet and TPM indexes; keys holds the MATNR8 of every row."""
+        getters = dict(zip(self.names, self.getters))
+        sorted_rows = self.sorted_rows
+        self.search_index = InvertedIndex.build(self.row_count, (getters[name] for name in SEARCH_COLUMNS))
+        get_matnr, get_description = getters["MATNR"], getters["MATERIAL_DESCRIPTION"]
+        self.typeahead = TypeaheadIndex.build(
+            (keys[row], get_matnr(row), get_description(row)) for row in range(self.row_count)
+        )
+        self.facets = FacetIndex.build(
+            sorted_rows,
+            [keys[row] for row in sorted_rows],
+            [list(map(getters[column], sorted_rows)) for _, column in FACET_COLUMNS],
+        )
+        self.tpm_index = ReverseIndex.build(zip(map(getters["TPM"], sorted_rows), sorted_rows))
+
+    def write_snapshot(self, path: str, compression: Optional[str] = None) -> None:
+        """Write the columns, the MATNR8 sort order and the indexes to a snapshot file."""
+        with SnapshotWriter(path, compression) as writer:
+            writer.commit({
+                "row_count": self.row_count,
+                "last_updated": self.last_updated,
+                "columns": [[name, get.__self__.dump(writer)] for name, get in zip(self.names, self.getters)],
+                "sorted_rows": writer.add(self.sorted_rows),
+                "sorted_keys": writer.add(self.sorted_keys),
+                "indexes": {
+                    "search": self.search_index.dump(writer),
+                    "typeahead": self.typeahead.dump(writer),
+                    "facets": self.facets.dump(writer),
+                    "tpm": self.tpm_index.dump(writer),
+                },
+            })
+
+    def attach_snapshot(self, snapshot: Snapshot) -> None:
+        """
+        Read the columns, the MATNR8 index and the other indexes from a snapshot of this table.
+
+        The private arrays and indexes are freed once nothing else references
+        them.
+        """
+        directory = snapshot.directory
+        names = tuple(name for name, _ in directory["columns"])
+        if names != tuple(MASTERDATA_COLUMNS):
+            raise SnapshotError(f"Snapshot {snapshot.path} was written for different masterdata columns")
+        if directory["row_count"] != self.row_count:
+            raise SnapshotError(f"Snapshot {snapshot.path} does not match the table")
+
+        self.getters = tuple(_load_column(snapshot, entry).get for _, entry in directory["columns"])
+        self.sorted_rows = snapshot.buffer(directory["sorted_rows"])
+        self.sorted_keys = snapshot.buffer(directory["sorted_keys"])
+        self.keyed_start = len(self.sorted_rows) - len(self.sorted_keys)
+        self.index = _SortedKeyIndex(self.sorted_keys, self.sorted_rows, self.keyed_start)
+
+        indexes = directory["indexes"]
+        getters = dict(zip(self.names, self.getters))
+        self.search_index = InvertedIndex.load(snapshot, indexes["search"])
+        # Typeahead entries are row offsets, so its records are read from the columns
+        self.typeahead = TypeaheadIndex.load(snapshot, indexes["typeahead"], _TypeaheadRecords(
+            self.row_count, (getters["MATNR8"], getters["MATNR"], getters["MATERIAL_DESCRIPTION"])
+        ))
+        self.facets = FacetIndex.load(snapshot, indexes["facets"])
+        self.tpm_index = ReverseIndex.load(snapshot, indexes["tpm"])
+        self.snapshot = snapshot
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Snapshot) -> "_ColumnarTable":
+        """Open a table reading its columns and indexes from a snapshot."""
+        directory = snapshot.directory
+        table = cls(
+            tuple((name, _ConstantColumn().get) for name in MASTERDATA_COLUMNS), directory["row_count"], {},
+            array("I"), array("q"), InvertedIndex.empty(), directory["last_updated"],
+        )
+        table.attach_snapshot(snapshot)
+        return table
+
+    def projection(self, columns: Optional[AbstractSet[str]] = None) -> Tuple[Tuple[str, ...], Tuple]:
+        """Return the column names and getters of a projection (all columns for None)."""
+        if columns is None:
+            return self.names, self.getters
+        selected = [(name, get) for name, get in zip(self.names, self.getters) if name in columns]
+        return tuple(name for name, _ in selected), tuple(get for _, get in selected)
+
+    def materialize(self, row: int, projection: Optional[Tuple[Tuple[str, ...], Tuple]] = None) -> Dict:
+        """Decode a single row into a column-name -> value dictionary."""
+        names, getters = projection or (self.names, self.getters)
+        return dict(zip(names, [get(row) for get in getters]))
+
+
+class _ColumnarTableBuilder:
+    """Accumulates column batches and freezes them into a table."""
+
+    def __init__(self):
+        self._columns = {}
+
+    @property
+    def row_count(self) -> int:
+        lengths = {len(column) for column in self._columns.values()}
+        if len(lengths) > 1:
+            raise ValueError("Columnar cache columns have different lengths")
+        return lengths.pop() if lengths else 0
+
+    def _column(self, name: str):
+        column = self._columns.get(name)
+        if column is None:
+            column = _IntColumn() if name in INTEGER_COLUMNS else _StringColumn()
+            self._columns[name] = column
+        return column
+
+    def extend_column(self, name: str, values: Sequence) -> None:
+        """Append a batch of values to a column; unknown columns are ignored."""
+        if name in _KNOWN_COLUMNS:
+            self._column(name).extend(values)
+
+    def extend_utf8_column(self, name: str, values: Sequence[Optional[bytes]]) -> None:
+        """Append a batch of UTF-8 encoded values to a text column."""
+        if name in _KNOWN_COLUMNS:
+            self._column(name).extend_utf8(values)
+
+    def copy_rows(self, table: _ColumnarTable, runs: Sequence[Tuple[int, int]]) -> None:
+        """
+        Start every column with a table's rows in the given [start, stop) runs.
+
+        The rows are copied in their encoding, so only the values appended
+        afterwards are encoded. Call before appending anything else.
+        """
+        row_count = sum(stop - start for start, stop in runs)
+        for name, get in zip(table.names, table.getters):
+            column = get.__self__
+            if isinstance(column, _ConstantColumn):
+                self.extend_column(name, [column.get(0)] * row_count)
+            else:
+                self._columns[name] = column.copy_runs(runs)
+
+    def build(self) -> _ColumnarTable:
+        row_count = self.row_count
+        # Mirror the DEFAULT CURRENT_TIMESTAMP of the SQLite table for the
+        # audit columns when the source does not provide them.
+        load_timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        columns = []
+        for name in MASTERDATA_COLUMNS:
+            column = self._columns.get(name)
+            if column is not None:
+                column = self._columns[name] = column.finish()
+                columns.append((name, column.get))
+            elif name in ("created_at", "updated_at"):
+                columns.append((name, _ConstantColumn(load_timestamp).get))
+            else:
+                columns.append((name, _ConstantColumn().get))
+
+        matnr8 = self._columns.get("MATNR8")
+        index: Dict[int, int] = {}
+        keys: List = []
+        if matnr8 is not None:
+            for row in range(row_count):
+                key = matnr8.get(row)
+                keys.append(key)
+                if key is not None and key not in index:
+                    index[key] = row
+        else:
+            keys = [None] * row_count
+        # NULL keys sort first, matching SQLite's ORDER BY MATNR8
+        sorted_rows = array("I", sorted(range(row_count), key=lambda row: (keys[row] is not None, keys[row] or 0)))
+        sorted_keys = array("q", [keys[row] for row in sorted_rows if keys[row] is not None])
+
+        updated_at = self._columns.get("updated_at")
+        if updated_at is not None:
+            values = [value for value in (updated_at.get(row) for row in range(row_count)) if value is not None]
+            last_updated = max(values) if values else None
+        else:
+            last_updated = load_timestamp if row_count else None
+
+        table = _ColumnarTable(
+            tuple(columns), row_count, index, sorted_rows, sorted_keys, InvertedIndex.empty(), last_updated
+        )
+        table.build_indexes(keys)
+        return table
+
+
+class ColumnarMasterdataCacheManager(BaseMasterdataCache):
+    """Manages a columnar, array-backed masterdata cache with O(1) MATNR8 lookups."""
+
+    engine = "columnar"
+
+    # Rows transposed into the columns per step while loading from SQLite
+    load_batch_size = 2_000
+
+    # Seconds between checks for a snapshot written by another worker
+    snapshot_poll_interval = 5.0
+
+    def __init__(self, snapshot_path: Optional[str] = None, snapshot_compression: Optional[str] = None):
+        super().__init__()
+        if snapshot_compression is not None and snapshot_compression not in COMPRESSIONS:
+            raise ValueError(
+                f"Unknown snapshot compression '{snapshot_compression}'. Use one of: {', '.join(COMPRESSIONS)}"
+            )
+        self.snapshot_path = snapshot_path
+        # Compressed snapshots are inflated into every worker instead of shared
+        self.snapshot_compression = snapshot_compression
+        # Serializes writing, opening and switching snapshots within the process
+        self._snapshot_lock = threading.RLock()
+        self._snapshot_identity = None
+        self._stop_watching: Optional[threading.Event] = None
+
+    def _publish_table(self, table: _ColumnarTable, load) -> None:
+        """
+        Publish a freshly built table, through the snapshot when one is configured.
+
+        Writing and publishing the snapshot holds the lock shared with the
+        other workers, so a worker starting up never maps a half-published
+        refresh and two refreshing workers take turns.
+        """
+        if self.snapshot_path:
+            with exclusive_lock(self.snapshot_path), self._snapshot_lock:
+                try:
+                    table.write_snapshot(self.snapshot_path, self.snapshot_compression)
+                    snapshot = Snapshot(self.snapshot_path)
+                    table.attach_snapshot(snapshot)
+                    self._snapshot_identity = snapshot.identity
+                except (OSError, SnapshotError) as e:
+                    # Serve the private copy; other workers keep their data
+                    logger.error(f"Failed to write masterdata cache snapshot {self.snapshot_path}: {str(e)}")
+                self._publish_generation(table, load)
+            return
+        self._publish_generation(table, load)
+
+    def load_masterdata_from_snapshot(self, snapshot_path: str) -> int:
+        """
+        Load the cache from a snapshot file by mapping it.
+
+        The columns and indexes are read from the mapping and shared with
+        every process that maps the same file. Raises SnapshotError when the
+        file is not a valid snapshot.
+        """
+        if not self._is_initialized:
+            raise RuntimeError("Cache not initialized. Call initialize_cache() first.")
+
+        with self._snapshot_lock:
+            load = self._begin_load()
+            snapshot = Snapshot(snapshot_path)
+            table = _ColumnarTable.from_snapshot(snapshot)
+            self._snapshot_identity = snapshot.identity
+            self._publish_generation(table, load)
+        logger.info(f"Mapped {table.row_count} masterdata records from snapshot {snapshot_path}")
+        return table.row_count
+
+    def load_masterdata_on_startup(self, sqlite_db_path: str) -> int:
+        """
+        Load the cache when the application starts.
+
+        With a snapshot path, the first worker to start loads SQLite and
+        writes the snapshot while holding a lock; the workers after it map the
+        snapshot as long as it is newer than the database. Then the snapshot
+        is watched for refreshes done by other workers.
+        """
+        if not self.snapshot_path:
+            return self.load_masterdata_from_sqlite(sqlite_db_path)
+
+        try:
+            with exclusive_lock(self.snapshot_path):
+                snapshot_identity = file_identity(self.snapshot_path)
+                database_identity = file_identity(sqlite_db_path)
+                # identity[1] is the modification time
+                if snapshot_identity is not None and (
+                    database_identity is None or snapshot_identity[1] >= database_identity[1]
+                ):
+                    try:
+                        return self.load_masterdata_from_snapshot(self.snapshot_path)
+                    except (OSError, SnapshotError) as e:
+                        logger.warning(f"Ignoring masterdata cache snapshot: {str(e)}")
+                return self.load_masterdata_from_sqlite(sqlite_db_path)
+        finally:
+            self._watch_snapshot()
+
+    def save_snapshot(self) -> bool:
+        """
+        Write the current generation to the snapshot unless the snapshot already holds it.
+
+        Called at shutdown, so the next start can open the snapshot even when
+        writing it after the last refresh failed. Returns whether it was written.
+        """
+        table = self._generation
+        if not self.snapshot_path or table is None or not table.row_count:
+            return False
+        # Same order as _publish_table: the lock across workers first
+        with exclusive_lock(self.snapshot_path), self._snapshot_lock:
+            identity = file_identity(self.snapshot_path)
+            if table.snapshot is not None and table.snapshot.identity == identity:
+                return False
+            if identity is not None and identity != self._snapshot_identity:
+                # Written by another worker's refresh after this generation's
+                return False
+            table.write_snapshot(self.snapshot_path, self.snapshot_compression)
+            self._snapshot_identity = file_identity(self.snapshot_path)
+        logger.info(f"Saved masterdata cache snapshot {self.snapshot_path}")
+        return True
+
+    def _watch_snapshot(self) -> None:
+        """Start a thread switching to snapshots written by other workers' refreshes."""
+        if self._stop_watching is not None:
+            return
+        stop = self._stop_watching = threading.Event()
+
+        def watch():
+            while not stop.wait(self.snapshot_poll_interval):
+                try:
+                    with self._snapshot_lock:
+                        identity = file_identity(self.snapshot_path)
+                        if identity is not None and identity != self._snapshot_identity:
+                            self.load_masterdata_from_snapshot(self.snapshot_path)
+                except Exception as e:
+                    logger.error(f"Failed to switch to masterdata cache snapshot {self.snapshot_path}: {str(e)}")
+
+        threading.Thread(target=watch, name="masterdata-snapshot-watcher", daemon=True).start()
+
+    def initialize_cache(self) -> None:
+        """Initialize an empty columnar cache."""
+        self._publish_generation(_ColumnarTable.empty())
+        self._is_initialized = True
+        logger.info("Columnar masterdata cache initialized successfully")
+
+    def load_masterdata_from_sqlite(self, sqlite_db_path: str) -> int:
+        """Load masterdata from file-based SQLite into the columnar cache."""
+        if not self._is_initialized:
+            raise RuntimeError("Cache not initialized. Call initialize_cache() first.")
+
+        if not os.path.exists(sqlite_db_path):
+            logger.warning(f"SQLite database {sqlite_db_path} not found")
+            return 0
+
+        try:
+            load = self._begin_load()
+            file_db = sqlite3.connect(sqlite_db_path)
+            try:
+                columns = [
+                    row[1] for row in file_db.execute("PRAGMA table_info(masterdata_databricks)")
+                    if row[1] in _KNOWN_COLUMNS
+                ]
+                if not columns:
+                    logger.warning("masterdata_databricks table not found in SQLite database")
+                    return 0
+
+                # Scan the table once and transpose fixed-size batches into
+                # the columns, so the load never holds more than one batch of
+                # rows. Text is fetched as BLOB to skip the decode/encode round
+                # trip through Python strings.
+                select_list = ", ".join(
+                    name if name in INTEGER_COLUMNS else f"CAST({name} AS BLOB)" for name in columns
+                )
+                cursor = file_db.execute(f"SELECT {select_list} FROM masterdata_databricks")
+                builder = _ColumnarTableBuilder()
+                while True:
+                    rows = cursor.fetchmany(self.load_batch_size)
+                    if not rows:
+                        break
+                    for name, values in zip(columns, zip(*rows)):
+                        if name in INTEGER_COLUMNS:
+                            builder.extend_column(name, values)
+                        else:
+                            builder.extend_utf8_column(name, values)
+                    self.load_rows_read += len(rows)
+            finally:
+                file_db.close()
+
+            row_count = builder.row_count
+            if not row_count:
+                logger.warning("No data found in masterdata_databricks table")
+                return 0
+
+            self._publish_table(builder.build(), load)
+            logger.info(f"Loaded {row_count} masterdata records into columnar cache")
+
+            return row_count
+
+        except Exception as e:
+            logger.error(f"Failed to load masterdata from SQLite: {str(e)}")
+            raise
+
+    def bulk_insert_masterdata(self, masterdata_records: List[Dict]) -> int:
+        """Replace the columnar cache contents with the given masterdata records."""
+        if not self._is_initialized:
+            raise RuntimeError("Cache not initialized. Call initialize_cache() first.")
+
+        if not masterdata_records:
+            return 0
+
+        try:
+            load = self._begin_load()
+            builder = _ColumnarTableBuilder()
+            for name in masterdata_records[0].keys():
+                builder.extend_column(name, [record.get(name) for record in masterdata_records])
+
+            row_count = builder.row_count
+            self._publish_table(builder.build(), load)
+            logger.info(f"Bulk inserted {row_count} masterdata records into columnar cache")
+
+            return row_count
+
+        except Exception as e:
+            logger.error(f"Failed to bulk insert masterdata: {str(e)}")
+            raise
+
+    def apply_masterdata_changes(self, masterdata_records: List[Dict], deleted_matnrs: Iterable[str]) -> int:
+        """
+        Publish a new table with the records upserted by MATNR and deleted_matnrs removed.
+
+        The unchanged rows are copied from the current table column by column
+        in their encoding, so an incremental refresh only encodes the changed
+        records and never reloads the SQLite file. Returns the number of
+        records in the new table.
+        """
+        if not self._is_initialized:
+            raise RuntimeError("Cache not initialized. Call initialize_cache() first.")
+
+        try:
+            load = self._begin_load()
+            current = self._current_generation()
+            replaced = {record["MATNR"] for record in masterdata_records}
+            replaced.update(deleted_matnrs)
+            get_matnr = current.getters[current.names.index("MATNR")]
+            removed = [row for row in range(current.row_count) if get_matnr(row) in replaced]
+            # The unchanged rows as [start, stop) runs between the removed ones
+            runs = [
+                (start, stop)
+                for start, stop in zip([0] + [row + 1 for row in removed], removed + [current.row_count])
+                if start < stop
+            ]
+
+            builder = _ColumnarTableBuilder()
+            builder.copy_rows(current, runs)
+            if masterdata_records:
+                for name in current.names:
+                    builder.extend_column(name, [record.get(name) for record in masterdata_records])
+
+            row_count = builder.row_count
+            self._publish_table(builder.build(), load)
+            logger.info(
+                f"Applied {len(masterdata_records)} changed masterdata records to columnar cache ({row_count} records)"
+            )
+
+            return row_count
+
+        except Exception as e:
+            logger.error(f"Failed to apply masterdata changes: {str(e)}")
+            raise
+
+    def _lookup(self, generation: _ColumnarTable, matnr8: int,
+                columns: Optional[AbstractSet[str]] = None) -> Optional[Dict]:
+        row = generation.index.get(matnr8)
+        if row is None:
+            return None
+        return generation.materialize(row, generation.projection(columns))
+
+    def _lookup_many(self, generation: _ColumnarTable, matnr8s: List[int],
+                     columns: Optional[AbstractSet[str]] = None) -> Dict[int, Dict]:
+        projection = generation.projection(columns)
+        index = generation.index
+        return {
+            matnr8: generation.materialize(index[matnr8], projection)
+            for matnr8 in matnr8s if matnr8 in index
+        }
+
+    def get_all_masterdata(self, limit: Optional[int] = None) -> List[Dict]:
+        """Get all masterdata records from the columnar cache ordered by MATNR8."""
+        table = self._current_generation()
+        rows = table.sorted_rows[:limit] if limit else table.sorted_rows
+        return [table.materialize(row) for row in rows]
+
+    def _page(self, generation: _ColumnarTable, after: Optional[Tuple[int, int]], limit: int,
+              columns: Optional[AbstractSet[str]] = None) -> List[Tuple[int, Dict]]:
+        start = generation.keyed_start
+        if after is not None:
+            matnr8, position = after
+            # Rows with equal MATNR8 are in ascending row order (stable sort)
+            low = start + bisect_left(generation.sorted_keys, matnr8)
+            high = start + bisect_right(generation.sorted_keys, matnr8)
+            start = bisect_right(generation.sorted_rows, position, low, high)
+        projection = generation.projection(columns)
+        return [(row, generation.materialize(row, projection)) for row in generation.sorted_rows[start:start + limit]]
+
+    def _iter_records(self, generation: _ColumnarTable,
+                      columns: Optional[AbstractSet[str]] = None) -> Iterator[Dict]:
+        projection = generation.projection(columns)
+        for row in generation.sorted_rows:
+            yield generation.materialize(row, projection)
+
+    def _records_at(self, generation: _ColumnarTable, positions: List[int],
+                    columns: Optional[AbstractSet[str]] = None) -> List[Dict]:
+        projection = generation.projection(columns)
+        return [generation.materialize(row, projection) for row in positions]
+
+    def _search(self, generation: _ColumnarTable, terms: List[str], limit: int, prefix: bool,
+                columns: Optional[AbstractSet[str]] = None) -> List[Dict]:
+        projection = generation.projection(columns)
+        return [generation.materialize(row, projection) for row in generation.search_index.search(terms, limit, prefix)]
+
+    def _memory_usage(self, generation: _ColumnarTable) -> Tuple[Dict[str, int], int, Dict[str, int]]:
+        columns = {name: deep_sizeof(get) for name, get in zip(generation.names, generation.getters)}
+        indexes = {
+            "matnr8": deep_sizeof((generation.index, generation.sorted_rows, generation.sorted_keys)),
+            "search": deep_sizeof(generation.search_index),
+        }
+        return columns, sum(columns.values()), indexes
+
+    def get_cache_stats(self) -> Dict:
+        """Get cache statistics."""
+        table = self._generation
+        if not self._is_initialized or table is None:
+            return {"initialized": False, "record_count": 0}
+
+        stats = {
+            "initialized": True,
+            "engine": self.engine,
+            "generation": table.number,
+            "record_count": table.row_count,
+            "last_updated": table.last_updated,
+            "memory": self.get_memory_stats(),
+        }
+        if table.snapshot is not None:
+            # Shared with every worker mapping the file, not counted in memory
+            stats["snapshot"] = {"path": table.snapshot.path, "bytes": table.snapshot.size}
+        return stats
+
+    def clear_cache(self) -> None:
+        """Clear all data from the columnar cache."""
+        if not self._is_initialized:
+            return
+
+        self._publish_generation(_ColumnarTable.empty())
+        logger.info("Columnar cache cleared")
+
+    def close_cache(self) -> None:
+        """Release the columnar cache; readers still using it finish first."""
+        if self._stop_watching is not None:
+            self._stop_watching.set()
+            self._stop_watching = None
+        if self._generation is not None:
+            self._generation = None
+            self._is_initialized = False
+            logger.info("Columnar cache closed")
@@ -0,0 +1,267 @@
+"""
+Faceted filtering over the categorical masterdata columns.
+
+Every generation gets a FacetIndex with the members of every distinct value of
+each facet column. Records are numbered by ordinal in MATNR8 order and a
+bitmap is a Python int with bit n set when record n has the value, so filters
+and facet counts are bitwise AND/OR plus popcount and never scan the table.
+
+PLANTS holds a comma-separated list of WERKS per record. It is exploded into
+one posting list per plant, so a material counts under every plant it is
+produced at and filtering on a plant never matches a mere substring.
+"""
+from array import array
+from collections import Counter
+from heapq import nsmallest
+from itertools import compress
+from typing import Dict, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Tuple, Union
+
+from .snapshot import Snapshot, SnapshotWriter
+
+# Query parameter name -> masterdata column of the filterable facets
+FACET_COLUMNS = (
+    ("material_type", "MATERIAL_TYPE"),
+    ("xplant_status", "XPLANT_STATUS"),
+    ("tpm_status", "TPM_STATUS"),
+    ("eclass", "ECLASS"),
+    ("glpt", "GLPT"),
+    ("usage_prefix", "USAGE_PREFIX"),
+    ("acf_flag", "ACF_FLAG"),
+    ("plant", "PLANTS"),
+)
+
+# Facets whose column holds a comma-separated list of values
+MULTI_VALUED_FACETS = frozenset({"plant"})
+
+
+# Maps the ASCII digits of a binary string to 0/1 bytes
+_BINARY_DIGITS = bytes.maketrans(b"01", b"\x00\x01")
+
+
+def _count_bits(bitmap: int) -> int:
+    return bin(bitmap).count("1")
+
+
+# Number of records in a bitmap; int.bit_count needs Python 3.10
+popcount = getattr(int, "bit_count", _count_bits)
+
+
+class FilterResult(NamedTuple):
+    """One page of filtered records with the total match count and facet counts."""
+
+    records: List[bytes]
+    total: int
+    facets: Dict[str, List[Dict]]
+    next_page_token: Optional[str]
+
+
+def _facet_value(value) -> str:
+    # NULL and empty string are the same facet value
+    return "" if value is None else str(value)
+
+
+def _facet_values(value) -> List[str]:
+    # Distinct items of a comma-separated list; records without items get ""
+    items = dict.fromkeys(item.strip() for item in str(value).split(",")) if value else {}
+    items.pop("", None)
+    return list(items) or [""]
+
+
+class FacetIndex:
+    """
+    Per-value member sets of the facet columns, over records numbered in MATNR8 order.
+
+    Frequent values are stored as bitmaps. Rare values, which make up most of a
+    high-cardinality column, are stored as sorted ordinal arrays because a
+    bitmap costs N/8 bytes no matter how few records it holds. Facet counts
+    under a filter are taken from a per-column array of value ids, masked by
+    the filter bitmap in C (itertools.compress) and counted in one pass.
+    """
+
+    def __init__(self, members: Dict[str, Dict[str, Union[int, Sequence[int]]]], value_ids: Dict[str, Sequence[int]],
+                 positions: Sequence[int], matnr8s: Sequence[int], owners: Optional[Dict[str, Sequence[int]]] = None):
+        self._members = members
+        self._value_ids = value_ids
+        # For multi-valued facets, the ordinal each entry of value_ids belongs to
+        self._owners = owners or {}
+        self._values = {name: list(column) for name, column in members.items()}
+        # Engine position (rowid or row offset) and MATNR8 (0 for NULL) of every ordinal
+        self.positions = positions
+        self.matnr8s = matnr8s
+        self._all = (1 << len(positions)) - 1
+
+    @classmethod
+    def build(cls, positions: Sequence[int], matnr8s: Sequence[Optional[int]],
+              columns: Sequence[Sequence]) -> "FacetIndex":
+        """
+        Index records given column-wise in MATNR8 order.
+
+        positions and matnr8s hold the engine position and MATNR8 of every
+        record; columns holds the values of every facet column in FACET_COLUMNS
+        order.
+        """
+        members = {}
+        value_ids = {}
+        owners = {}
+        # A bitmap is smaller than a 4-byte ordinal array above N/32 members
+        dense_threshold = len(positions) // 32
+        for (name, _), values in zip(FACET_COLUMNS, columns):
+            lookup: Dict[str, int] = {}
+            if name in MULTI_VALUED_FACETS:
+                ids = array("I")
+                entry_owners = owners[name] = array("I")
+                for ordinal, value in enumerate(values):
+                    for item in _facet_values(value):
+                        ids.append(lookup.setdefault(item, len(lookup)))
+                        entry_owners.append(ordinal)
+            else:
+                ids = array("I", [lookup.setdefault(_facet_value(value), len(lookup)) for value in values])
+                entry_owners = range(len(ids))
+            ordinals = [array("I") for _ in lookup]
+            for ordinal, value_id in zip(entry_owners, ids):
+                ordinals[value_id].append(ordinal)
+            members[name] = {
+                value: cls._bitmap(value_ordinals) if len(value_ordinals) > dense_threshold else value_ordinals
+                for value, value_ordinals in zip(lookup, ordinals)
+            }
+            value_ids[name] = ids
+        return cls(members, value_ids, array("q", positions), array("q", [matnr8 or 0 for matnr8 in matnr8s]), owners)
+
+    @classmethod
+    def empty(cls) -> "FacetIndex":
+        return cls({name: {} for name, _ in FACET_COLUMNS}, {name: array("I") for name, _ in FACET_COLUMNS},
+                   array("q"), array("q"))
+
+    def dump(self, writer: SnapshotWriter) -> Dict:
+        """Write the index to a snapshot and return its directory entry."""
+        columns = {}
+        for name, column in self._members.items():
+            members = list(column.values())
+            columns[name] = {
+                # In value id order
+                "values": writer.add_strings(column),
+                "dense": writer.add(bytes(isinstance(value_members, int) for value_members in members)),
+                "bitmaps": writer.add_slices(
+                    (value_members.to_bytes((value_members.bit_length() + 7) // 8, "little")
+                     if isinstance(value_members, int) else b"" for value_members in members),
+                    "B",
+                ),
+                "ordinals": writer.add_slices(
+                    (() if isinstance(value_members, int) else value_members for value_members in members), "I"
+                ),
+                "value_ids": writer.add(self._value_ids[name]),
+                "owners": writer.add(self._owners[name]) if name in self._owners else None,
+            }
+        return {"positions": writer.add(self.positions), "matnr8s": writer.add(self.matnr8s), "columns": columns}
+
+    @classmethod
+    def load(cls, snapshot: Snapshot, entry: Dict) -> "FacetIndex":
+        """
+        Open an index written by dump().
+
+        Ordinal arrays and value ids are read in place; bitmaps are turned
+        back into ints in this process.
+        """
+        members = {}
+        value_ids = {}
+        owners = {}
+        for name, column in entry["columns"].items():
+            bitmaps = snapshot.slices(column["bitmaps"])
+            ordinals = snapshot.slices(column["ordinals"])
+            members[name] = {
+                value: int.from_bytes(bitmaps[value_id], "little") if dense else ordinals[value_id]
+                for value_id, (value, dense) in enumerate(
+                    zip(snapshot.strings(column["values"]), snapshot.buffer(column["dense"]))
+                )
+            }
+            value_ids[name] = snapshot.buffer(column["value_ids"])
+            if column["owners"] is not None:
+                owners[name] = snapshot.buffer(column["owners"])
+        return cls(members, value_ids, snapshot.buffer(entry["positions"]), snapshot.buffer(entry["matnr8s"]), owners)
+
+    @staticmethod
+    def _bitmap(ordinals: Sequence[int]) -> int:
+        # Set the bits in a bytearray; setting them on an int would copy the
+        # whole int on every assignment
+        bits = bytearray((ordinals[-1] >> 3) + 1)
+        for ordinal in ordinals:
+            bits[ordinal >> 3] |= 1 << (ordinal & 7)
+        return int.from_bytes(bits, "little")
+
+    def _flags(self, bitmap: int) -> bytes:
+        """One 0/1 byte per ordinal of a bitmap."""
+        return format(bitmap, f"0{len(self.positions)}b")[::-1].encode("ascii").translate(_BINARY_DIGITS)
+
+    def _column_filter(self, name: str, values: Sequence[str]) -> int:
+        column = self._members[name]
+        selected = 0
+        for value in values:
+            members = column.get(value)
+            if members is not None:
+                selected |= members if isinstance(members, int) else self._bitmap(members)
+        return selected
+
+    def _counts(self, name: str, others: Optional[int]) -> Iterator[Tuple[str, int]]:
+        """Count the members of every value of a facet within others (None: all records)."""
+        if others is None:
+            for value, members in self._members[name].items():
+                yield value, popcount(members) if isinstance(members, int) else len(members)
+            return
+
+        values = self._values[name]
+        flags = self._flags(others)
+        owners = self._owners.get(name)
+        if owners is not None:
+            # One flag per entry, taken from the record the entry belongs to
+            flags = bytes(map(flags.__getitem__, owners))
+        for value_id, count in Counter(compress(self._value_ids[name], flags)).items():
+            yield values[value_id], count
+
+    def filter(self, filters: Mapping[str, Sequence[str]],
+               facet_limit: Optional[int] = None) -> Tuple[int, Dict[str, List[Dict]]]:
+        """
+        Apply the filters and compute the facet counts.
+
+        Values of one facet are OR-ed, facets are AND-ed. Returns the bitmap of
+        matching ordinals and, for every facet, the count per value among the
+        records matching all other facets' filters, so the counts show what
+        selecting another value would return. Each facet lists its facet_limit
+        most frequent values.
+        """
+        column_filters = {name: self._column_filter(name, values) for name, values in filters.items() if values}
+
+        matches = self._all
+        for selected in column_filters.values():
+            matches &= selected
+
+        facets = {}
+        for name, _ in FACET_COLUMNS:
+            others = None
+            for other, selected in column_filters.items():
+                if other != name:
+                    others = selected if others is None else others & selected
+            counts = ((count, value) for value, count in self._counts(name, others) if count)
+            if facet_limit is None:
+                top = sorted(counts, key=lambda item: (-item[0], item[1]))
+            else:
+                top = nsmallest(facet_limit, counts, key=lambda item: (-item[0], item[1]))
+            facets[name] = [{"value": value, "count": count} for count, value in top]
+        return matches, facets
+
+    def value_counts(self, name: str) -> Dict[str, int]:
+        """Number of records per value of a facet over the whole generation."""
+        return dict(self._counts(name, None))
+
+    @staticmethod
+    def ordinals(bitmap: int, after: int = -1, limit: Optional[int] = None) -> List[int]:
+        """Return the set ordinals of a bitmap greater than after, lowest first."""
+        bitmap >>= after + 1
+        ordinals = []
+        base = after + 1
+        while bitmap and (limit is None or len(ordinals) < limit):
+            low = bitmap & -bitmap
+            offset = low.bit_length() - 1
+            ordinals.append(base + offset)
+            bitmap >>= offset + 1
+            base += offset + 1
+        return ordinals
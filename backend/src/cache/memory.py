@@ -0,0 +1,70 @@
+"""
+Memory accounting for the masterdata cache.
+
+Sizes are approximations meant for container sizing and for spotting
+regressions: Python structures are measured with sys.getsizeof over their
+object graph, SQLite structures by the pages they occupy. The process RSS is
+read from /proc and is unavailable on platforms without it.
+"""
+import os
+import sys
+from array import array
+from types import FunctionType, ModuleType
+from typing import Optional
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+# Objects whose size is fully reported by sys.getsizeof
+_FLAT_TYPES = (str, bytes, bytearray, array, int, float, bool, type(None))
+# Shared program objects, not data of the cache
+_SHARED_TYPES = (type, ModuleType, FunctionType)
+
+
+def current_rss_bytes() -> Optional[int]:
+    """Resident set size of this process, or None when it cannot be read."""
+    try:
+        with open("/proc/self/statm", "rb") as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def deep_sizeof(obj) -> int:
+    """
+    Approximate bytes held by an object and everything it references.
+
+    Follows containers, __dict__ and __slots__ attributes and bound methods;
+    objects referenced more than once are counted once.
+    """
+    seen = set()
+    total = 0
+    pending = [obj]
+    while pending:
+        current = pending.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        if isinstance(current, _SHARED_TYPES):
+            continue
+        total += sys.getsizeof(current)
+        if isinstance(current, _FLAT_TYPES):
+            continue
+        if isinstance(current, dict):
+            pending.extend(current.keys())
+            pending.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            pending.extend(current)
+        elif hasattr(current, "__self__"):
+            # Bound method, e.g. a column getter: measure the column
+            pending.append(current.__self__)
+        else:
+            if hasattr(current, "__dict__"):
+                pending.append(current.__dict__)
+            for cls in type(current).__mro__:
+                for name in getattr(cls, "__slots__", ()):
+                    if hasattr(current, name):
+                        pending.append(getattr(current, name))
+    return total
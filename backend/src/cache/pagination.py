@@ -0,0 +1,44 @@
+"""
+Keyset pagination over the masterdata cache.
+
+Pages are ordered by (MATNR8, position), where the position is the engine's
+stable row identifier within a generation. A continuation token records the
+last key of a page together with the generation it was read from, so fetching
+page N costs the same as fetching page 1 and a refresh between two pages is
+detected instead of silently skipping or repeating records.
+"""
+import base64
+import binascii
+from typing import NamedTuple
+
+# Position greater than any row identifier; combined with a MATNR8 it selects
+# everything strictly after that MATNR8
+AFTER_ALL_POSITIONS = 2 ** 63 - 1
+
+
+class PageCursor(NamedTuple):
+    """Last key of a page in the generation the page was read from."""
+
+    generation: int
+    matnr8: int
+    position: int
+
+
+class StalePageTokenError(ValueError):
+    """Raised when a page token belongs to a generation that is no longer published."""
+
+
+def encode_page_token(cursor: PageCursor) -> str:
+    """Encode a cursor into an opaque, URL-safe continuation token."""
+    raw = f"{cursor.generation}:{cursor.matnr8}:{cursor.position}".encode("ascii")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_page_token(token: str) -> PageCursor:
+    """Decode a continuation token; raises ValueError for malformed tokens."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode("ascii")
+        generation, matnr8, position = (int(part) for part in raw.split(":"))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid page token") from None
+    return PageCursor(generation, matnr8, position)
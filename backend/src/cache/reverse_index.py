@@ -0,0 +1,70 @@
+"""
+Reverse indexes from a linked key to the materials that reference it.
+
+Every generation gets a TPM -> materials index, so "all materials using TPM X"
+is a dictionary lookup followed by reading only the linked records, instead of
+a scan over the masterdata table.
+"""
+from array import array
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from .snapshot import Snapshot, SnapshotWriter
+
+
+_NO_POSITIONS = array("q")
+
+
+class LinkedMaterials(NamedTuple):
+    """One page of materials linked to a key, with their total number."""
+
+    records: List[bytes]
+    total: int
+    next_page_token: Optional[str]
+
+
+class ReverseIndex:
+    """Key -> engine positions of the records holding the key, in MATNR8 order."""
+
+    def __init__(self, postings: Dict[str, Sequence[int]]):
+        self._postings = postings
+
+    @classmethod
+    def build(cls, entries: Iterable[Tuple[Optional[str], int]]) -> "ReverseIndex":
+        """Index (key, position) entries given in MATNR8 order; empty keys are skipped."""
+        postings: Dict[str, array] = {}
+        for key, position in entries:
+            key = key.strip() if key else ""
+            if not key:
+                continue
+            posting = postings.get(key)
+            if posting is None:
+                posting = postings[key] = array("q")
+            posting.append(position)
+        return cls(postings)
+
+    @classmethod
+    def empty(cls) -> "ReverseIndex":
+        return cls({})
+
+    def dump(self, writer: SnapshotWriter) -> Dict:
+        """Write the index to a snapshot and return its directory entry."""
+        return {
+            "keys": writer.add_strings(self._postings),
+            "positions": writer.add_slices(self._postings.values(), "q"),
+        }
+
+    @classmethod
+    def load(cls, snapshot: Snapshot, entry: Dict) -> "ReverseIndex":
+        """Open an index written by dump(); the positions are read in place."""
+        return cls(dict(zip(snapshot.strings(entry["keys"]), snapshot.slices(entry["positions"]))))
+
+    def __len__(self) -> int:
+        return len(self._postings)
+
+    def count(self, key: str) -> int:
+        """Number of records holding the key."""
+        return len(self.positions(key))
+
+    def positions(self, key: str) -> Sequence[int]:
+        """Engine positions of the records holding the key, in MATNR8 order."""
+        return self._postings.get(key.strip(), _NO_POSITIONS)
@@ -0,0 +1,102 @@
+"""
+Column layout of the masterdata_databricks table shared by the cache engines.
+"""
+
+# Column order matches the masterdata_databricks table in the file-based and
+# in-memory SQLite databases.
+MASTERDATA_COLUMNS = (
+    "MATNR",
+    "MATNR8",
+    "MATERIAL_DESCRIPTION",
+    "MATERIAL_TYPE",
+    "XPLANT_STATUS",
+    "PRDHATXT",
+    "MAKEUP",
+    "PLANTS",
+    "PLANTS_TXT",
+    "CONTRACT_MANUFACTURER_CODETYPE",
+    "CONTRACT_MANUFACTURER_CODE",
+    "RESPONSIBLE_FOR_SPECIFICATION",
+    "CONTRACT_MANUFACTURER_MATERIAL",
+    "LAYOUT_APPROVED",
+    "USAGE_PREFIX",
+    "NUMBER_OF_PAGES",
+    "ACF_FLAG",
+    "VISIBLE_MARKINGS",
+    "CODE",
+    "COLORS",
+    "NUMBER_COLORS_FRONT",
+    "CONTRACT_MANUFACTURER",
+    "ARTICLE_CODETYPE",
+    "ARTICLE_CODE",
+    "CONTRACT_MAN_VISIBLE_MARKINGS",
+    "CONTRACT_MANUFACTURER_MT_INDEX",
+    "COMPONENT_SCRAB_KEY",
+    "REMARKS",
+    "PRINTED",
+    "NUMBER_COLORS_BACK",
+    "PRINT_CHARACTERISTICS",
+    "BRAILLE_TEXT",
+    "PRINTCHAR_BRAILLE",
+    "PRINTCHAR_FOILSTAMP",
+    "PRINTCHAR_GOLDHOTFOIL",
+    "PRINTCHAR_EMBOSSDEBOSS",
+    "PRINTCHAR_SPOTVARNISH",
+    "PRINTCHAR_SCRATCHOFF",
+    "PRINTCHAR_LAMINATION",
+    "PRINTCHAR_DIECUT",
+    "PRINTCHAR_PERFORATION",
+    "PRINTCHAR_GLOSSVARNISH",
+    "PRINTCHAR_LEAFLETING",
+    "PRINTCHAR_FOLDING",
+    "PRINTCHAR_RICHPALEGOLD",
+    "PRINTCHAR_SILVERHOTFOIL",
+    "PRINTCHAR_UNVARNISH",
+    "PRINTCHAR_SECURITYVARISH",
+    "PRINTCHAR_MATTVARNISH",
+    "PRINTCHAR_CODINGBYSUPPLIER",
+    "PRINTCHAR_BKLOGO",
+    "PRINTCHAR_S_DR",
+    "DRA_COMBINATION",
+    "DRA_COMBINATION_DKTXTUC",
+    "DRA_DIELINE",
+    "DRA_DIELINE_DKTXTUC",
+    "DRA_OTHER",
+    "DRA_OTHER_DKTXTUC",
+    "DRA_ALL",
+    "DRA_ALL_DKTXTUC",
+    "DRA_1",
+    "DRA_2",
+    "DRA_3",
+    "DRA_4",
+    "DRA_5",
+    "DRA_6",
+    "DRA_7",
+    "DRA_8",
+    "DRA_9",
+    "DRA_10",
+    "LRA",
+    "LRA_VERSION",
+    "LRA_DATE",
+    "LRA_FILENAME",
+    "HRL",
+    "HRL_VERSION",
+    "HRL_DATE",
+    "ACS",
+    "ACS_VERSION",
+    "TPM_DRAWING",
+    "TPM",
+    "TPMTXT",
+    "TPM_STATUS",
+    "GLPT",
+    "GLPTTXT",
+    "ECLASS",
+    "ECLASSTXT",
+    "ECLASS_S",
+    "ECLASS_S_TXT",
+    "created_at",
+    "updated_at",
+)
+
+# Columns stored with INTEGER affinity; every other column is stored as text.
+INTEGER_COLUMNS = frozenset({"MATNR8"})
@@ -0,0 +1,187 @@
+"""
+Full-text search over the masterdata text columns.
+
+The SQLite engine indexes the columns with FTS5; the columnar engine uses the
+InvertedIndex below. Both tokenize like FTS5's unicode61 tokenizer with
+remove_diacritics: lowercase runs of letters and digits, accents removed. A
+search matches records that contain every query term (each term also matches
+as a word prefix when prefix matching is on) and ranks them by BM25.
+"""
+import math
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from heapq import nlargest
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .snapshot import Snapshot, SnapshotWriter
+
+# Columns covered by the search index
+SEARCH_COLUMNS = ("MATERIAL_DESCRIPTION", "TPMTXT", "PRDHATXT", "PLANTS_TXT")
+
+# BM25 parameters, the FTS5 defaults
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+# Candidate rows are looked up in a posting list by bisection while there are
+# fewer than its length divided by this (two bisections cost about as much as
+# counting this many postings)
+_BISECT_FACTOR = 16
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Split text into lowercase, accent-free search tokens."""
+    if not text:
+        return []
+    if not text.isascii():
+        text = "".join(
+            char for char in unicodedata.normalize("NFKD", text) if not unicodedata.combining(char)
+        )
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+def fts5_match_expression(terms: Iterable[str], prefix: bool) -> str:
+    """Build an FTS5 MATCH expression requiring every term; terms are quoted, so no query syntax leaks through."""
+    suffix = "*" if prefix else ""
+    return " AND ".join(f'"{term}"{suffix}' for term in terms)
+
+
+class InvertedIndex:
+    """
+    Term -> rows index with BM25 ranking for the columnar engine.
+
+    Terms are kept sorted with their posting lists and their document
+    frequencies (the number of distinct rows) at the same positions. Each
+    posting list holds a row once per occurrence of the term, in ascending
+    row order, so term frequencies are counted from the list.
+    """
+
+    def __init__(self, terms: Sequence[str], postings: Sequence[Sequence[int]], lengths: Sequence[int],
+                 document_frequencies: Sequence[int]):
+        self._terms = terms
+        self._postings = postings
+        self._lengths = lengths
+        self._document_frequencies = document_frequencies
+        average_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+        # BM25 length normalization of every row, and the score factor of a
+        # term occurring once in the row
+        self._norms = array("d", (
+            BM25_K1 * (1 - BM25_B + BM25_B * length / average_length) if average_length else BM25_K1
+            for length in lengths
+        ))
+        self._single = array("d", (1 / (1 + norm) for norm in self._norms))
+
+    @classmethod
+    def build(cls, row_count: int, text_getters: Iterable[Callable[[int], Optional[str]]]) -> "InvertedIndex":
+        """Index the text returned by the getters for every row."""
+        text_getters = tuple(text_getters)
+        postings: Dict[str, array] = {}
+        frequencies: Dict[str, int] = {}
+        lengths = array("I")
+        for row in range(row_count):
+            tokens = []
+            for get in text_getters:
+                tokens.extend(tokenize(get(row)))
+            lengths.append(len(tokens))
+            for token in tokens:
+                posting = postings.get(token)
+                if posting is None:
+                    posting = postings[token] = array("I")
+                    frequencies[token] = 0
+                if not posting or posting[-1] != row:
+                    frequencies[token] += 1
+                posting.append(row)
+        terms = sorted(postings)
+        return cls(
+            terms, [postings[term] for term in terms], lengths, array("I", (frequencies[term] for term in terms))
+        )
+
+    @classmethod
+    def empty(cls) -> "InvertedIndex":
+        return cls([], [], array("I"), array("I"))
+
+    def dump(self, writer: SnapshotWriter) -> Dict:
+        """Write the index to a snapshot and return its directory entry."""
+        return {
+            "terms": writer.add_strings(self._terms),
+            "postings": writer.add_slices(self._postings, "I"),
+            "lengths": writer.add(self._lengths),
+            "document_frequencies": writer.add(array("I", self._document_frequencies)),
+        }
+
+    @classmethod
+    def load(cls, snapshot: Snapshot, entry: Dict) -> "InvertedIndex":
+        """Open an index written by dump(), reading it in place."""
+        return cls(
+            snapshot.strings(entry["terms"]), snapshot.slices(entry["postings"]), snapshot.buffer(entry["lengths"]),
+            snapshot.buffer(entry["document_frequencies"]),
+        )
+
+    @property
+    def term_count(self) -> int:
+        return len(self._terms)
+
+    def _expand(self, term: str, prefix: bool) -> range:
+        """Positions of the term, or of every term it is a prefix of."""
+        terms = self._terms
+        start = bisect_left(terms, term)
+        if not prefix:
+            return range(start, start + 1) if start < len(terms) and terms[start] == term else range(0)
+        end = start
+        while end < len(terms) and terms[end].startswith(term):
+            end += 1
+        return range(start, end)
+
+    def search(self, terms: List[str], limit: int, prefix: bool = True) -> List[int]:
+        """Return up to limit rows matching all terms, best BM25 score first."""
+        row_count = len(self._lengths)
+        if not terms or not row_count:
+            return []
+
+        frequencies = self._document_frequencies
+        expanded = [self._expand(term, prefix) for term in terms]
+        # Score the rarest term first; later terms only score the rows still matching
+        expanded.sort(key=lambda positions: sum(frequencies[position] for position in positions))
+
+        scores: Optional[Dict[int, float]] = None
+        for positions in expanded:
+            term_scores: Dict[int, float] = {}
+            for position in positions:
+                frequency = frequencies[position]
+                weight = math.log(1 + (row_count - frequency + 0.5) / (frequency + 0.5)) * (BM25_K1 + 1)
+                position_scores = self._term_scores(position, weight, scores)
+                if not term_scores:
+                    term_scores = position_scores
+                    continue
+                for row, score in position_scores.items():
+                    term_scores[row] = term_scores.get(row, 0.0) + score
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {row: score + term_scores[row] for row, score in scores.items() if row in term_scores}
+            if not scores:
+                return []
+
+        ranked: List[Tuple[float, int]] = nlargest(limit, ((score, -row) for row, score in scores.items()))
+        return [-negative_row for _, negative_row in ranked]
+
+    def _term_scores(self, position: int, weight: float, candidates: Optional[Dict[int, float]]) -> Dict[int, float]:
+        """Row -> BM25 score of the term at position, for the candidate rows only when given."""
+        posting = self._postings[position]
+        norms = self._norms
+        if candidates is not None and len(candidates) * _BISECT_FACTOR < len(posting):
+            # Few candidates: look them up in the sorted posting list instead of reading all of it
+            counted = ((row, bisect_right(posting, row) - bisect_left(posting, row)) for row in candidates)
+            return {row: weight * frequency / (frequency + norms[row]) for row, frequency in counted if frequency}
+        if self._document_frequencies[position] == len(posting):
+            # Every row holds the term once: nothing to count
+            rows = posting if candidates is None else candidates.keys() & set(posting)
+            return dict(zip(rows, map(weight.__mul__, map(self._single.__getitem__, rows))))
+        return {
+            row: weight * frequency / (frequency + norms[row]) for row, frequency in Counter(posting).items()
+            if candidates is None or row in candidates
+        }
@@ -0,0 +1,111 @@
+"""
+JSON serialization of cached masterdata records.
+Produces the same bytes FastAPI renders for MasterdataConfig responses, without
+going through Pydantic validation for data that already lives in the cache.
+"""
+import hashlib
+import json
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+from ..models.models import MASTERDATA_FIELD_COLUMNS
+
+# Projection of a response: (alias, column) pairs in MasterdataConfig field order
+MasterdataFields = Tuple[Tuple[str, str], ...]
+
+# Response fields are accepted by alias ("tpmStatus") or column name
+# ("TPM_STATUS"), case-insensitively
+_FIELDS_BY_NAME = {
+    name.lower(): pair for pair in MASTERDATA_FIELD_COLUMNS for name in pair
+}
+
+
+def resolve_masterdata_fields(names: Optional[Iterable[str]]) -> Optional[MasterdataFields]:
+    """
+    Resolve requested response fields to (alias, column) pairs.
+
+    The pairs keep the MasterdataConfig field order. Returns None (all fields)
+    when no names are given and raises ValueError for unknown names.
+    """
+    requested = {name.strip().lower() for name in names or () if name.strip()}
+    if not requested:
+        return None
+
+    unknown = sorted(name for name in requested if name not in _FIELDS_BY_NAME)
+    if unknown:
+        raise ValueError(f"Unknown masterdata fields: {', '.join(unknown)}")
+
+    selected = {_FIELDS_BY_NAME[name] for name in requested}
+    return tuple(pair for pair in MASTERDATA_FIELD_COLUMNS if pair in selected)
+
+
+def projected_columns(fields: Optional[MasterdataFields]) -> Optional[FrozenSet[str]]:
+    """Cache columns needed to serialize the given fields; MATNR8 is always included."""
+    if fields is None:
+        return None
+    return frozenset(column for _, column in fields) | {"MATNR8"}
+
+
+def serialize_masterdata_record(record: Dict, fields: MasterdataFields = MASTERDATA_FIELD_COLUMNS) -> bytes:
+    """Serialize a cache record to the JSON object of a MasterdataConfig response."""
+    return json.dumps(
+        {alias: record.get(column) for alias, column in fields},
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def record_etag(serialized: bytes) -> str:
+    """
+    Strong entity tag of a serialized record, derived from its content.
+
+    Unchanged records keep their ETag across cache refreshes and processes.
+    """
+    return f'"r{hashlib.blake2b(serialized, digest_size=8).hexdigest()}"'
+
+
+def masterdata_response_body(serialized_records) -> bytes:
+    """Wrap serialized records into a MasterdataConfigResponse JSON document."""
+    return b'{"masterdata":[' + b",".join(serialized_records) + b"]}"
+
+
+def masterdata_batch_response_body(serialized_records, missing) -> bytes:
+    """Wrap serialized records and missing keys into a MasterdataBatchResponse JSON document."""
+    return (
+        b'{"masterdata":[' + b",".join(serialized_records) + b'],"missing":'
+        + json.dumps(list(missing), separators=(",", ":")).encode("utf-8") + b"}"
+    )
+
+
+def masterdata_page_response_body(serialized_records, next_page_token) -> bytes:
+    """Wrap one page of serialized records into a MasterdataPageResponse JSON document."""
+    return (
+        b'{"masterdata":[' + b",".join(serialized_records) + b'],"next_page_token":'
+        + json.dumps(next_page_token).encode("utf-8") + b"}"
+    )
+
+
+def typeahead_response_body(completions) -> bytes:
+    """Wrap serialized completions into a MasterdataTypeaheadResponse JSON document."""
+    return b'{"completions":[' + b",".join(completions) + b"]}"
+
+
+def masterdata_filter_response_body(serialized_records, total, facets, next_page_token) -> bytes:
+    """Wrap a page of filtered records into a MasterdataFilterResponse JSON document."""
+    return (
+        b'{"masterdata":[' + b",".join(serialized_records) + b'],"total":' + str(total).encode("ascii")
+        + b',"facets":' + json.dumps(facets, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        + b',"next_page_token":' + json.dumps(next_page_token).encode("utf-8") + b"}"
+    )
+
+
+def masterdata_tpm_response_body(tpm, serialized_records, total, next_page_token, tpm_configs=None) -> bytes:
+    """Wrap a page of materials linked to a TPM into a MasterdataTpmResponse JSON document."""
+    return (
+        b'{"masterdata":[' + b",".join(serialized_records) + b'],"next_page_token":'
+        + json.dumps(next_page_token).encode("utf-8")
+        + b',"tpm":' + json.dumps(tpm, ensure_ascii=False).encode("utf-8")
+        + b',"total":' + str(total).encode("ascii")
+        + b',"tpm_configs":' + json.dumps(tpm_configs, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        + b"}"
+    )
@@ -0,0 +1,307 @@
+"""
+Binary snapshots of the columnar cache.
+
+A snapshot holds the arrays of a cache generation (columns and indexes) as
+flat buffers at 8-byte aligned offsets, followed by a JSON directory that
+records where each buffer starts (the offset index). The header carries the
+format version and the directory's CRC-32, and every buffer carries its own,
+so a truncated or corrupted file is rejected instead of served.
+
+Opening an uncompressed snapshot maps the file read-only and hands out views
+into the mapping, so nothing is copied: every worker process that opens the
+same file shares one copy of the data in the page cache. Buffers of a
+compressed snapshot are inflated into private memory when it is opened, in
+exchange for a file about a quarter of the size.
+
+Snapshots are replaced atomically. A process that still maps an older file
+keeps reading it until it opens the new one; the old file is freed once the
+last mapping is gone.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from collections.abc import Sequence as SequenceABC
+from contextlib import contextmanager
+from itertools import accumulate
+from typing import Dict, Iterable, Iterator, Optional, Sequence, Tuple, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+MAGIC = b"SCRIPTA-SNAPSHOT"
+FORMAT_VERSION = 3
+
+# Supported values of the compression option
+COMPRESSIONS = ("zlib",)
+
+# Magic, format version, directory CRC-32, directory offset and length
+_HEADER = struct.Struct(f"<{len(MAGIC)}sIIQQ")
+_ALIGNMENT = 8
+# Fastest zlib level: higher levels shrink snapshots by a few percent at
+# several times the write time
+_ZLIB_LEVEL = 1
+
+# Reference to a buffer in the snapshot: offset and length in the file, size
+# and CRC-32 of the uncompressed bytes, array typecode and compression
+BufferRef = Dict[str, Union[int, str]]
+
+Buffer = Union[array, bytes, bytearray, memoryview]
+
+# Paths whose exclusive_lock the current thread holds
+_held_locks = threading.local()
+
+
+class SnapshotError(ValueError):
+    """Raised when a file is not a readable snapshot of this format version."""
+
+
+def file_identity(path: str) -> Optional[Tuple[int, int, int]]:
+    """Identify the file currently at path, or None when there is none."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+@contextmanager
+def exclusive_lock(path: str) -> Iterator[None]:
+    """
+    Hold an exclusive lock on path across processes, e.g. uvicorn workers.
+
+    The lock is taken on a separate path + ".lock" file so the snapshot itself
+    can be replaced while it is held. A thread already holding it takes it
+    again without waiting; other threads of the process wait like other
+    processes. Without fcntl (Windows) it does nothing.
+    """
+    held = getattr(_held_locks, "paths", None)
+    if held is None:
+        held = _held_locks.paths = set()
+    if fcntl is None or path in held:
+        yield
+        return
+    with open(f"{path}.lock", "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        held.add(path)
+        try:
+            yield
+        finally:
+            held.discard(path)
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class MappedStrings(SequenceABC):
+    """Read-only sequence of strings stored as one UTF-8 buffer plus offsets."""
+
+    __slots__ = ("_data", "_base", "_offsets")
+
+    def __init__(self, data, base: int, offsets: Sequence[int]):
+        self._data = data
+        self._base = base
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("string index out of range")
+        base = self._base
+        return self._data[base + self._offsets[index]:base + self._offsets[index + 1]].decode("utf-8")
+
+
+class Slices(SequenceABC):
+    """Read-only sequence of integer arrays stored as one values buffer plus offsets."""
+
+    __slots__ = ("_values", "_offsets")
+
+    def __init__(self, values: Sequence[int], offsets: Sequence[int]):
+        self._values = values
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index: int) -> Sequence[int]:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("slice index out of range")
+        return self._values[self._offsets[index]:self._offsets[index + 1]]
+
+
+class SnapshotWriter:
+    """
+    Writes a snapshot to a temporary file and moves it into place on commit.
+
+    Use as a context manager: add() every buffer, then commit() with the
+    directory that references them. The target is left untouched when the
+    block raises.
+    """
+
+    def __init__(self, path: str, compression: Optional[str] = None):
+        if compression is not None and compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown snapshot compression '{compression}'. Use one of: {', '.join(COMPRESSIONS)}")
+        self.path = path
+        self.compression = compression
+        self._temporary_path = f"{path}.{os.getpid()}.tmp"
+        self._file = None
+        self._position = 0
+
+    def __enter__(self) -> "SnapshotWriter":
+        self._file = open(self._temporary_path, "wb")
+        self._file.write(bytes(_HEADER.size))
+        self._position = _HEADER.size
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            os.remove(self._temporary_path)
+
+    def _pad(self) -> None:
+        padding = -self._position % _ALIGNMENT
+        if padding:
+            self._file.write(bytes(padding))
+            self._position += padding
+
+    def add(self, data: Buffer) -> BufferRef:
+        """Append a buffer and return its reference."""
+        self._pad()
+        view = memoryview(data)
+        # The format of an array's or a typed view's memoryview is its typecode
+        ref = {"offset": self._position, "size": view.nbytes, "typecode": view.format, "crc32": zlib.crc32(view)}
+        stored = view
+        if self.compression == "zlib" and view.nbytes:
+            compressed = zlib.compress(view, _ZLIB_LEVEL)
+            # Incompressible buffers are stored as they are
+            if len(compressed) < view.nbytes:
+                stored = memoryview(compressed)
+                ref["compression"] = "zlib"
+        self._file.write(stored)
+        ref["length"] = stored.nbytes
+        self._position += stored.nbytes
+        return ref
+
+    def add_strings(self, values: Iterable[Optional[str]]) -> Dict:
+        """Append strings, None stored as '', to be read back with Snapshot.strings()."""
+        encoded = [value.encode("utf-8") if value else b"" for value in values]
+        return {
+            "data": self.add(b"".join(encoded)),
+            "offsets": self.add(array("Q", accumulate(map(len, encoded), initial=0))),
+        }
+
+    def add_slices(self, arrays: Iterable[Iterable[int]], typecode: str) -> Dict:
+        """Append integer arrays to be read back with Snapshot.slices()."""
+        values = array(typecode)
+        offsets = array("Q", [0])
+        for items in arrays:
+            values.extend(items)
+            offsets.append(len(values))
+        return {"values": self.add(values), "offsets": self.add(offsets)}
+
+    def commit(self, directory: Dict) -> None:
+        """Write the directory and header and atomically replace the target file."""
+        self._pad()
+        # Arrays are written in native byte order
+        directory = {**directory, "byteorder": sys.byteorder}
+        encoded = json.dumps(directory, separators=(",", ":")).encode("utf-8")
+        self._file.write(encoded)
+        self._file.seek(0)
+        self._file.write(_HEADER.pack(MAGIC, FORMAT_VERSION, zlib.crc32(encoded), self._position, len(encoded)))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        os.replace(self._temporary_path, self.path)
+
+
+class Snapshot:
+    """A snapshot file mapped read-only into memory."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            stat = os.fstat(file.fileno())
+            # Identity of the file actually mapped, even if path is replaced meanwhile
+            self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            try:
+                self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:
+                raise SnapshotError(f"Snapshot {path} is empty") from e
+
+        if len(self._map) < _HEADER.size:
+            raise SnapshotError(f"Snapshot {path} is truncated")
+        magic, version, directory_crc32, directory_offset, directory_length = _HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise SnapshotError(f"{path} is not a masterdata cache snapshot")
+        if version != FORMAT_VERSION:
+            raise SnapshotError(f"Snapshot {path} has format version {version}, expected {FORMAT_VERSION}")
+        if directory_offset + directory_length > len(self._map):
+            raise SnapshotError(f"Snapshot {path} is truncated")
+
+        encoded = self._map[directory_offset:directory_offset + directory_length]
+        if zlib.crc32(encoded) != directory_crc32:
+            raise SnapshotError(f"Snapshot {path} has a corrupt directory")
+        self.directory = json.loads(encoded)
+        if self.directory.get("byteorder") != sys.byteorder:
+            raise SnapshotError(f"Snapshot {path} was written on a machine with another byte order")
+        # Bytes inflated from compressed buffers, held privately by this process
+        self.inflated_bytes = 0
+
+    @property
+    def size(self) -> int:
+        """Size of the mapped file in bytes."""
+        return len(self._map)
+
+    def bytes_at(self, ref: BufferRef) -> Tuple[Union[mmap.mmap, bytes], int]:
+        """
+        A byte buffer as an object whose slices are bytes, and the buffer's offset in it.
+
+        That is the mapping itself for uncompressed buffers and the inflated
+        bytes otherwise; slicing either is faster than decoding memoryview
+        slices. The buffer's CRC-32 is checked.
+        """
+        offset, length = ref["offset"], ref["length"]
+        if offset + length > len(self._map):
+            raise SnapshotError(f"Snapshot {self.path} is truncated")
+        stored = memoryview(self._map)[offset:offset + length]
+        if ref.get("compression") == "zlib":
+            try:
+                data = zlib.decompress(stored)
+            except zlib.error as e:
+                raise SnapshotError(f"Snapshot {self.path} has a corrupt buffer at offset {offset}") from e
+            checked, base = data, 0
+            self.inflated_bytes += len(data)
+        else:
+            checked, data, base = stored, self._map, offset
+        if len(checked) != ref["size"] or zlib.crc32(checked) != ref["crc32"]:
+            raise SnapshotError(f"Snapshot {self.path} has a corrupt buffer at offset {offset}")
+        return data, base
+
+    def buffer(self, ref: Optional[BufferRef]) -> Optional[memoryview]:
+        """Read-only view of a buffer, typed like the array it was written from."""
+        if ref is None:
+            return None
+        data, base = self.bytes_at(ref)
+        view = memoryview(data)[base:base + ref["size"]]
+        return view if ref["typecode"] == "B" else view.cast(ref["typecode"])
+
+    def strings(self, entry: Dict) -> MappedStrings:
+        """Strings written with SnapshotWriter.add_strings()."""
+        data, base = self.bytes_at(entry["data"])
+        return MappedStrings(data, base, self.buffer(entry["offsets"]))
+
+    def slices(self, entry: Dict) -> Slices:
+        """Integer arrays written with SnapshotWriter.add_slices()."""
+        return Slices(self.buffer(entry["values"]), self.buffer(entry["offsets"]))
@@ -0,0 +1,94 @@
+"""
+Typeahead index for material numbers.
+
+Every record is reachable through its MATNR8 as a string, its 18-character
+MATNR and the MATNR without leading zeros, so "9196", "91967086" and
+"0000000000919" all complete to the same material. The keys live in one sorted
+list; a completion is a binary search for the prefix followed by a short
+forward scan, independent of the number of records. Only the returned
+entries are serialized.
+"""
+import json
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .snapshot import Snapshot, SnapshotWriter
+
+
+def serialize_completion(matnr8: Optional[int], matnr: Optional[str], description: Optional[str]) -> bytes:
+    """Serialize one completion entry."""
+    return json.dumps(
+        {"MATNR8": matnr8, "MATNR": matnr, "materialDescription": description},
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class TypeaheadIndex:
+    """Sorted string keys -> completion entries."""
+
+    def __init__(self, keys: Sequence[str], entries: Sequence[int], records: Sequence[Tuple]):
+        self._keys = keys
+        # entries[i] is the index into records of the completion for keys[i]
+        self._entries = entries
+        self._records = records
+
+    @classmethod
+    def build(cls, rows: Iterable[Tuple[Optional[int], Optional[str], Optional[str]]]) -> "TypeaheadIndex":
+        """Index (MATNR8, MATNR, MATERIAL_DESCRIPTION) rows."""
+        records = list(rows)
+        keyed = []
+        for entry, (matnr8, matnr, _) in enumerate(records):
+            matnr8_key = str(matnr8) if matnr8 is not None else ""
+            if matnr8_key:
+                keyed.append((matnr8_key, entry))
+            if matnr:
+                matnr = matnr.upper()
+                stripped = matnr.lstrip("0")
+                if matnr != matnr8_key:
+                    keyed.append((matnr, entry))
+                if stripped and stripped != matnr and stripped != matnr8_key:
+                    keyed.append((stripped, entry))
+
+        keyed.sort()
+        return cls([key for key, _ in keyed], [entry for _, entry in keyed], records)
+
+    @classmethod
+    def empty(cls) -> "TypeaheadIndex":
+        return cls([], [], [])
+
+    def dump(self, writer: SnapshotWriter) -> Dict:
+        """
+        Write the keys to a snapshot and return the directory entry.
+
+        The records are not written: the caller passes them to load(), e.g.
+        read from the snapshot's columns.
+        """
+        return {"keys": writer.add_strings(self._keys), "entries": writer.add(array("I", self._entries))}
+
+    @classmethod
+    def load(cls, snapshot: Snapshot, entry: Dict, records: Sequence[Tuple]) -> "TypeaheadIndex":
+        """Open an index written by dump() over the records it was built from."""
+        return cls(snapshot.strings(entry["keys"]), snapshot.buffer(entry["entries"]), records)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def complete(self, prefix: str, limit: int) -> List[bytes]:
+        """Return up to limit serialized completions whose keys start with prefix, in key order."""
+        prefix = prefix.strip().upper()
+        if not prefix:
+            return []
+
+        keys = self._keys
+        position = bisect_left(keys, prefix)
+        seen = set()
+        completions = []
+        while position < len(keys) and len(completions) < limit and keys[position].startswith(prefix):
+            entry = self._entries[position]
+            if entry not in seen:
+                seen.add(entry)
+                completions.append(serialize_completion(*self._records[entry]))
+            position += 1
+        return completions
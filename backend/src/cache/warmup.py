@@ -0,0 +1,129 @@
+"""
+Background warm-up of the masterdata cache at application startup.
+
+The application accepts requests as soon as the cache is initialized; the
+masterdata is loaded on a background thread. Until the load has finished,
+/ready answers 503 with the load's progress and the masterdata endpoints
+answer 503 instead of reporting materials as missing. All other routes are
+served right away.
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from .base import BaseMasterdataCache
+from .cache_manager import cache_manager
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class CacheWarmup:
+    """State of the startup load of one cache manager."""
+
+    def __init__(self, manager: BaseMasterdataCache):
+        self._manager = manager
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.state = PENDING
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.records_expected: Optional[int] = None
+        self.records_loaded: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def start(self, load: Callable[[], int], records_expected: Optional[int] = None) -> None:
+        """Run load (returning the number of records loaded) on a background thread."""
+        with self._lock:
+            if self.state == LOADING:
+                raise RuntimeError("Masterdata cache warm-up is already running")
+            self.state = LOADING
+            self.started_at = time.time()
+            self.finished_at = None
+            self.records_expected = records_expected
+            self.records_loaded = None
+            self.error = None
+            self._thread = threading.Thread(target=self._run, args=(load,), name="masterdata-warmup", daemon=True)
+        self._thread.start()
+
+    def _run(self, load: Callable[[], int]) -> None:
+        try:
+            records = load()
+        except Exception as e:
+            logger.error(f"Masterdata cache warm-up failed: {str(e)}")
+            self._finish(FAILED, error=str(e))
+            return
+        logger.info(f"Masterdata cache warm-up loaded {records} records in {time.time() - self.started_at:.1f}s")
+        self._finish(READY, records=records)
+
+    def _finish(self, state: str, records: Optional[int] = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            self.state = state
+            self.records_loaded = records
+            self.error = error
+            self.finished_at = time.time()
+
+    def mark_ready(self) -> None:
+        """Record that there was nothing to load; the (empty) cache is servable."""
+        self._finish(READY, records=0)
+
+    def mark_failed(self, error: str) -> None:
+        """Record that the warm-up could not be started."""
+        self._finish(FAILED, error=error)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for a running warm-up to finish; returns False on timeout."""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+
+    @property
+    def loading(self) -> bool:
+        """Whether the startup load is still running."""
+        return self.state == LOADING
+
+    @property
+    def ready(self) -> bool:
+        """
+        Whether masterdata is servable.
+
+        A failed warm-up becomes ready once a later refresh publishes data.
+        """
+        if self.state == READY:
+            return True
+        if self.state == FAILED:
+            loaded_at = self._manager.loaded_at
+            return loaded_at is not None and self.finished_at is not None and loaded_at > self.finished_at
+        return False
+
+    def status(self) -> Dict:
+        """Readiness with the progress of the startup load."""
+        with self._lock:
+            state, started_at, finished_at = self.state, self.started_at, self.finished_at
+            expected, loaded, error = self.records_expected, self.records_loaded, self.error
+        if state == LOADING:
+            # Engines that load in batches report their progress
+            loaded = self._manager.load_rows_read
+        status = {
+            "ready": self.ready,
+            "state": state,
+            "records_expected": expected,
+            "records_loaded": loaded,
+            "progress": round(min(loaded / expected, 1.0), 3) if expected and loaded is not None else None,
+            "elapsed_seconds": round((finished_at or time.time()) - started_at, 3) if started_at else None,
+            "cache_generation": self._manager.generation,
+        }
+        if error is not None:
+            status["error"] = error
+        return status
+
+
+# Global warm-up of the global cache manager
+cache_warmup = CacheWarmup(cache_manager)
@@ -2,7 +2,9 @@
 Databricks connection configuration and utilities.
 """
 import os
-from typing import Optional
+import queue
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, TypeVar
 
 from databricks import sql
 from dotenv import load_dotenv
@@ -10,6 +12,11 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+# Rows per chunk of a streamed query, overridable with DATABRICKS_FETCH_SIZE
+DEFAULT_FETCH_SIZE = 10000
+
+T = TypeVar("T")
+
 
 class DatabricksConfig:
     """Configuration class for Databricks connection."""
@@ -51,33 +58,118 @@ def get_databricks_connection():
     return databricks_config.get_connection()
 
 
-def execute_databricks_query(query: str, params: Optional[list] = None):
-    """
-    Execute a query on Databricks and return results.
+def fetch_size() -> int:
+    """Rows per chunk of a streamed query."""
+    size = int(os.getenv("DATABRICKS_FETCH_SIZE", DEFAULT_FETCH_SIZE))
+    if size < 1:
+        raise ValueError(f"DATABRICKS_FETCH_SIZE must be positive, got {size}")
+    return size
 
-    Args:
-        query (str): SQL query to execute
-        params (list, optional): Parameters for parameterized queries
 
-    Returns:
-        List of dictionaries representing rows
+def stream_databricks_query(query: str, params: Optional[list] = None,
+                            chunk_size: Optional[int] = None) -> Iterator[List[Dict]]:
     """
+    Execute a query on Databricks and yield its rows in chunks.
+
+    Only one chunk of rows is held at a time: the cursor fetches chunk_size
+    rows (default DATABRICKS_FETCH_SIZE) per round trip with fetchmany, and
+    they become dictionaries one chunk at a time. The connection is closed
+    when the generator is exhausted or closed.
+    """
+    chunk_size = chunk_size or fetch_size()
     connection = get_databricks_connection()
     try:
-        cursor = connection.cursor()
+        # The cursor buffers arraysize rows; keep that at the chunk size
+        cursor = connection.cursor(arraysize=chunk_size)
 
         if params:
             cursor.execute(query, params)
         else:
             cursor.execute(query)
-        # Get column names
         columns = [desc[0] for desc in cursor.description]
-        # Fetch all rows and convert to list of dictionaries
-        rows = cursor.fetchall()
-        result = []
-        for row in rows:
-            result.append(dict(zip(columns, row)))
-
-        return result
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield [dict(zip(columns, row)) for row in rows]
     finally:
         connection.close()
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_END = object()
+
+
+def prefetch(chunks: Iterable[T], depth: int = 1) -> Iterator[T]:
+    """
+    Iterate chunks on a background thread, up to depth chunks ahead.
+
+    The next chunk is fetched while the consumer processes the current one,
+    and the bounded buffer keeps memory at a few chunks. Errors of the
+    producer are raised in the consumer; closing the iterator stops the
+    producer before its next fetch and closes chunks in the producer thread.
+    """
+    buffer: queue.Queue = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            iterator = iter(chunks)
+            # Checked before every fetch, so a closed consumer never waits for another round trip
+            while not stopped.is_set():
+                chunk = next(iterator, _END)
+                if not put(chunk) or chunk is _END:
+                    return
+        except BaseException as e:
+            put(_Failure(e))
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+
+    producer = threading.Thread(target=produce, name="databricks-prefetch", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stopped.set()
+        # Free a producer waiting on a full buffer right away
+        try:
+            while True:
+                buffer.get_nowait()
+        except queue.Empty:
+            pass
+        producer.join()
+
+
+def execute_databricks_query(query: str, params: Optional[list] = None):
+    """
+    Execute a query on Databricks and return results.
+
+    Args:
+        query (str): SQL query to execute
+        params (list, optional): Parameters for parameterized queries
+
+    Returns:
+        List of dictionaries representing rows
+    """
+    return [row for chunk in stream_databricks_query(query, params) for row in chunk]
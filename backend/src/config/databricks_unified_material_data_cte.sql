@@ -1017,6 +1017,7 @@ WITH
             relation.TPM,
             relation.PNGUID
     )
+    -- @incremental_ctes: the incremental refresh appends its CTEs here
     -- Final SELECT statement with all joins
 SELECT
     -- Material Data
@@ -1147,6 +1148,7 @@ FROM
             efdataonelh_prd.generaldiscovery_masterdata_r.pmd_mara_view mara
             LEFT JOIN efdataonelh_prd.generaldiscovery_masterdata_r.pmd_makt_view makt ON mara.MATNR = makt.MATNR
             AND makt.SPRAS = 'E' -- English language
+        -- @incremental_filter: the incremental refresh restricts the materials here
     ) MATDATA
     -- Makeup
     LEFT JOIN y08_makeup MAKEUP ON MATDATA.MATNR = MAKEUP.MATNR18
@@ -0,0 +1,174 @@
+"""
+Queries for the incremental masterdata refresh.
+
+The unified CTE selects every material. An incremental refresh restricts it to
+the materials whose source rows changed after the stored watermarks: the
+markers in databricks_unified_material_data_cte.sql are replaced with a
+changed_materials CTE and a filter on it, so Databricks only joins the
+changed materials.
+
+Watched views and how their rows lead to a material:
+
+    pmd_mara_view   the material itself (MATNR)
+    p2r_ausp_view   characteristic values, through p2r_inob_view (CUOBJ -> OBJEK)
+    p2r_drad_view   documents linked to the material (DOKOB 'MARA', OBJKY)
+
+Changes elsewhere (TPM nodes, document texts and versions, plants, ...) are
+picked up by the periodic full reconcile.
+"""
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Mapping, Optional
+
+from .databricks import databricks_config
+
+SQL_FILE_PATH = os.path.join(os.path.dirname(__file__), "databricks_unified_material_data_cte.sql")
+
+# Views whose change dates decide which materials an incremental refresh reads
+WATCHED_VIEWS = ("pmd_mara_view", "p2r_ausp_view", "p2r_drad_view")
+
+# Change-date column of every watched view, overridable with
+# DATABRICKS_CHANGE_DATE_COLUMNS="pmd_mara_view=LAEDA,p2r_ausp_view=..."
+DEFAULT_CHANGE_DATE_COLUMN = "OPTIMESTAMP"
+
+# Hours after which an incremental refresh runs a full reconcile instead
+DEFAULT_RECONCILE_HOURS = 24.0
+
+_CTE_MARKER = re.compile(r"^[ \t]*-- @incremental_ctes\b.*$", re.MULTILINE)
+_FILTER_MARKER = re.compile(r"^[ \t]*-- @incremental_filter\b.*$", re.MULTILINE)
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+# Watermarks are inlined into the query, so only date and time characters pass
+_WATERMARK = re.compile(r"^[0-9][0-9 :.T+Z-]*$")
+
+
+def change_date_columns() -> Dict[str, str]:
+    """Change-date column of every watched view."""
+    columns = {view: DEFAULT_CHANGE_DATE_COLUMN for view in WATCHED_VIEWS}
+    setting = os.getenv("DATABRICKS_CHANGE_DATE_COLUMNS", "")
+    for item in filter(None, (part.strip() for part in setting.split(","))):
+        view, _, column = (value.strip() for value in item.partition("="))
+        if view not in columns:
+            raise ValueError(
+                f"DATABRICKS_CHANGE_DATE_COLUMNS names unknown view '{view}'. Use one of: {', '.join(WATCHED_VIEWS)}"
+            )
+        if not _IDENTIFIER.match(column):
+            raise ValueError(f"DATABRICKS_CHANGE_DATE_COLUMNS has an invalid column for '{view}': '{column}'")
+        columns[view] = column
+    return columns
+
+
+def reconcile_interval() -> timedelta:
+    """Maximum age of the last full refresh before an incremental refresh reconciles."""
+    return timedelta(hours=float(os.getenv("MASTERDATA_FULL_RECONCILE_HOURS", DEFAULT_RECONCILE_HOURS)))
+
+
+def load_unified_query() -> str:
+    """Read the unified CTE that selects every material."""
+    with open(SQL_FILE_PATH, "r", encoding="utf-8") as file:
+        return file.read()
+
+
+def _watermark_literal(value: str) -> str:
+    if not isinstance(value, str) or not _WATERMARK.match(value):
+        raise ValueError(f"Invalid masterdata refresh watermark: {value!r}")
+    return f"'{value}'"
+
+
+def watermark_query(columns: Optional[Mapping[str, str]] = None) -> str:
+    """Latest change date of every watched view; a full refresh stores them as watermarks."""
+    columns = columns or change_date_columns()
+    return "\nUNION ALL\n".join(
+        f"SELECT '{view}' AS SOURCE, CAST(MAX({columns[view]}) AS STRING) AS WATERMARK "
+        f"FROM {databricks_config.get_full_table_name(view)}"
+        for view in WATCHED_VIEWS
+    )
+
+
+def changed_materials_cte(watermarks: Mapping[str, str], columns: Optional[Mapping[str, str]] = None) -> str:
+    """
+    The changed_materials CTE: one row per changed source row with the MATNR
+    it belongs to, the view (SOURCE) and its change date (CHANGED_AT).
+
+    Deleted source rows (OPTYPE 'D') are included, so materials that lost
+    their data are read again and dropped when the CTE no longer returns them.
+    """
+    columns = columns or change_date_columns()
+    mara, ausp, drad = (columns[view] for view in WATCHED_VIEWS)
+    since = {view: _watermark_literal(watermarks[view]) for view in WATCHED_VIEWS}
+    table = databricks_config.get_full_table_name
+    return f"""changed_materials AS (
+        SELECT mara.MATNR, 'pmd_mara_view' AS SOURCE, CAST(mara.{mara} AS STRING) AS CHANGED_AT
+        FROM {table('pmd_mara_view')} mara
+        WHERE mara.{mara} > {since['pmd_mara_view']}
+        UNION ALL
+        SELECT inob.OBJEK AS MATNR, 'p2r_ausp_view' AS SOURCE, CAST(ausp.{ausp} AS STRING) AS CHANGED_AT
+        FROM {table('p2r_ausp_view')} ausp
+            JOIN {table('p2r_inob_view')} inob ON inob.CUOBJ = ausp.OBJEK
+            AND inob.KLART = ausp.KLART
+            AND inob.MANDT = ausp.MANDT
+            AND inob.OPSYS = ausp.OPSYS
+        WHERE ausp.{ausp} > {since['p2r_ausp_view']}
+            AND ausp.OPSYS = 'P2R'
+            AND ausp.MANDT = '508'
+        UNION ALL
+        SELECT drad.OBJKY AS MATNR, 'p2r_drad_view' AS SOURCE, CAST(drad.{drad} AS STRING) AS CHANGED_AT
+        FROM {table('p2r_drad_view')} drad
+        WHERE drad.{drad} > {since['p2r_drad_view']}
+            AND drad.DOKOB = 'MARA'
+            AND drad.OPSYS = 'P2R'
+            AND drad.MANDT = '508'
+    )"""
+
+
+def changed_materials_query(watermarks: Mapping[str, str], columns: Optional[Mapping[str, str]] = None) -> str:
+    """The changed materials per view with their latest change date."""
+    return (
+        f"WITH {changed_materials_cte(watermarks, columns)}\n"
+        "SELECT SOURCE, MATNR, MAX(CHANGED_AT) AS CHANGED_AT\n"
+        "FROM changed_materials\n"
+        "GROUP BY SOURCE, MATNR"
+    )
+
+
+def incremental_query(watermarks: Mapping[str, str], columns: Optional[Mapping[str, str]] = None,
+                      unified_query: Optional[str] = None) -> str:
+    """The unified CTE restricted to the materials changed after the watermarks."""
+    query = unified_query if unified_query is not None else load_unified_query()
+    if len(_CTE_MARKER.findall(query)) != 1 or len(_FILTER_MARKER.findall(query)) != 1:
+        raise ValueError("The unified CTE query lacks the @incremental_ctes and @incremental_filter markers")
+    cte = changed_materials_cte(watermarks, columns)
+    query = _CTE_MARKER.sub(lambda _: f"    ,\n    {cte}", query)
+    return _FILTER_MARKER.sub(
+        lambda _: "        WHERE mara.MATNR IN (SELECT MATNR FROM changed_materials)", query
+    )
+
+
+def advance_watermarks(watermarks: Mapping[str, str], changes: Iterable[Mapping]) -> Dict[str, str]:
+    """Move every view's watermark to the latest change date read from it."""
+    advanced = dict(watermarks)
+    for change in changes:
+        source, changed_at = change["SOURCE"], change["CHANGED_AT"]
+        if changed_at is not None and (advanced.get(source) is None or changed_at > advanced[source]):
+            advanced[source] = changed_at
+    return advanced
+
+
+def full_refresh_reason(state: Mapping, now: Optional[datetime] = None) -> Optional[str]:
+    """
+    Why an incremental refresh has to read everything instead, or None.
+
+    state is the stored refresh state: the watermarks per view and the UTC
+    time of the last full refresh.
+    """
+    watermarks = state.get("watermarks") or {}
+    missing = [view for view in WATCHED_VIEWS if not watermarks.get(view)]
+    if missing:
+        return f"no watermark for {', '.join(missing)}"
+    last_full_refresh = state.get("last_full_refresh")
+    if not last_full_refresh:
+        return "no full refresh recorded"
+    refreshed_at = datetime.strptime(last_full_refresh, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    if (now or datetime.now(timezone.utc)) - refreshed_at >= reconcile_interval():
+        return f"last full refresh at {last_full_refresh} UTC is due for reconcile"
+    return None
@@ -0,0 +1,232 @@
+"""
+In-process metrics exposed in the Prometheus text format.
+
+Recording is lock-free: every thread counts into its own shard, and shards
+are only summed when /metrics is scraped. The event loop and each threadpool
+worker therefore never contend on a lock, and an observation costs a dict
+lookup and an increment. The shards of threads that have exited are folded
+into one, so short-lived threads do not accumulate.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Upper bounds in seconds of the latency histograms
+ROUTE_LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+REFRESH_PHASE_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Shard:
+    """Metric values recorded by one thread."""
+
+    __slots__ = ("counters", "histograms")
+
+    def __init__(self):
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        # (name, labels) -> [count per bucket..., count above the last bucket, sum]
+        self.histograms: Dict[Tuple[str, Labels], List[float]] = {}
+
+    def add(self, other: "_Shard") -> None:
+        """Add the values of another shard."""
+        # Copies are atomic under the GIL while the owning thread keeps recording
+        for key, value in other.counters.copy().items():
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, counts in other.histograms.copy().items():
+            total = self.histograms.setdefault(key, [0] * len(counts))
+            for index, count in enumerate(list(counts)):
+                total[index] += count
+
+
+class MetricsRegistry:
+    """Counters, histograms and scrape-time gauges."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[Tuple[threading.Thread, _Shard]] = []
+        # Values recorded by threads that have exited; replaced, never updated in place
+        self._retired = _Shard()
+        self._shards_lock = threading.Lock()
+        # name -> (type, help) in registration order
+        self._descriptions: Dict[str, Tuple[str, str]] = {}
+        self._buckets: Dict[str, Sequence[float]] = {}
+        self._gauges: Dict[str, Callable[[], Optional[float]]] = {}
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            # Taken once per thread, never while recording
+            with self._shards_lock:
+                self._retire_exited()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _retire_exited(self) -> None:
+        """Fold the shards of exited threads into the retired shard; needs the shards lock."""
+        live, exited = [], []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                exited.append(shard)
+        if not exited:
+            return
+        retired = _Shard()
+        for shard in (self._retired, *exited):
+            retired.add(shard)
+        self._retired = retired
+        self._shards = live
+
+    def counter(self, name: str, help_text: str) -> None:
+        """Declare a counter."""
+        self._descriptions[name] = ("counter", help_text)
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float]) -> None:
+        """Declare a histogram with the given bucket upper bounds."""
+        self._descriptions[name] = ("histogram", help_text)
+        self._buckets[name] = tuple(buckets)
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], Optional[float]]) -> None:
+        """Declare a gauge whose value is read when metrics are scraped; None omits it."""
+        self._descriptions[name] = ("gauge", help_text)
+        self._gauges[name] = read
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1) -> None:
+        """Increase a counter."""
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: Labels = ()) -> None:
+        """Record one observation of a histogram."""
+        histograms = self._shard().histograms
+        key = (name, labels)
+        counts = histograms.get(key)
+        buckets = self._buckets[name]
+        if counts is None:
+            counts = histograms[key] = [0] * (len(buckets) + 2)
+        counts[bisect_left(buckets, value)] += 1
+        counts[-1] += value
+
+    @contextmanager
+    def timer(self, name: str, labels: Labels = ()) -> Iterator[None]:
+        """Observe the duration of the block in a histogram, also when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, labels)
+
+    def _collect(self) -> Tuple[Dict[Tuple[str, Labels], float], Dict[Tuple[str, Labels], List[float]]]:
+        """Sum all shards."""
+        with self._shards_lock:
+            self._retire_exited()
+            shards = [self._retired] + [shard for _, shard in self._shards]
+        total = _Shard()
+        for shard in shards:
+            total.add(shard)
+        return total.counters, total.histograms
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        counters, histograms = self._collect()
+        lines = []
+        for name, (kind, help_text) in self._descriptions.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            elif kind == "histogram":
+                buckets = self._buckets[name]
+                for (metric, labels), counts in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip((*buckets, float("inf")), counts):
+                        cumulative += count
+                        bucket_labels = labels + (("le", "+Inf" if bound == float("inf") else repr(bound)),)
+                        lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(counts[-1])}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+            else:
+                value = self._gauges[name]()
+                if value is not None:
+                    lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(
+        f'{key}="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for key, value in labels
+    ) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+metrics = MetricsRegistry()
+
+metrics.histogram(
+    "scripta_http_request_duration_seconds",
+    "Latency of HTTP requests by method, route template and status code.",
+    ROUTE_LATENCY_BUCKETS,
+)
+metrics.counter(
+    "scripta_masterdata_lookups_total",
+    "MATNR8 lookups in the masterdata cache by result (hit, not_found); hits by source "
+    "(serialized: JSON kept from an earlier hit, engine: read from the cache engine).",
+)
+metrics.histogram(
+    "scripta_refresh_phase_duration_seconds",
+    "Duration of masterdata refresh phases: databricks_fetch, sqlite_save and cache_load.",
+    REFRESH_PHASE_BUCKETS,
+)
+metrics.counter(
+    "scripta_refresh_runs_total",
+    "Masterdata refresh runs by mode (full, incremental), trigger (request, schedule) and result "
+    "(success, failure); requests attached to a run in flight are not counted.",
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware observing the latency of every HTTP request per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = ["500"]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            # Unmatched paths share one label so clients cannot create series
+            path = getattr(route, "path", None) or "unmatched"
+            metrics.observe(
+                "scripta_http_request_duration_seconds",
+                time.perf_counter() - started,
+                (("method", scope["method"]), ("route", path), ("status", status[0])),
+            )
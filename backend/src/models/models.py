@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 from enum import Enum
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from pydantic import BaseModel, ConfigDict, Field
 
@@ -251,3 +251,185 @@ class MasterdataConfig(BaseModel):
 
 class MasterdataConfigResponse(BaseModel):
     masterdata: List[MasterdataConfig]
+
+
+# Default and upper bound for records per page of the masterdata listing
+MASTERDATA_PAGE_DEFAULT_SIZE = 1000
+MASTERDATA_PAGE_MAX_SIZE = 5000
+
+
+class MasterdataPageResponse(MasterdataConfigResponse):
+    next_page_token: Optional[str] = Field(
+        None, description="Token for the next page; null on the last page"
+    )
+
+
+class FacetCount(BaseModel):
+    value: str = Field(..., description="Facet value; empty string for records without a value")
+    count: int = Field(..., description="Number of matching records with this value")
+
+
+class MasterdataFilterResponse(MasterdataPageResponse):
+    total: int = Field(..., description="Number of records matching all filters")
+    facets: Dict[str, List[FacetCount]] = Field(
+        ..., description="Per facet, the counts of its values among records matching the other facets' filters"
+    )
+
+
+class PlantCount(BaseModel):
+    plant: str = Field(..., description="Plant (WERKS)")
+    count: int = Field(..., description="Number of materials produced at the plant")
+
+
+class MasterdataPlantsResponse(BaseModel):
+    plants: List[PlantCount] = Field(..., description="Plants ordered by plant code")
+
+
+class MasterdataTpmResponse(MasterdataPageResponse):
+    tpm: str = Field(..., description="TPM the materials are linked to")
+    total: int = Field(..., description="Number of materials linked to the TPM")
+    tpm_configs: Optional[List[TpmConfig]] = Field(
+        None, description="Matching rows of the local tpm table when include_tpm_config is set"
+    )
+
+
+# Default and upper bound for values listed per facet
+MASTERDATA_FACET_DEFAULT_LIMIT = 50
+MASTERDATA_FACET_MAX_LIMIT = 1000
+
+
+# Default and upper bound for results of one full-text search
+MASTERDATA_SEARCH_DEFAULT_LIMIT = 20
+MASTERDATA_SEARCH_MAX_LIMIT = 500
+
+
+class MasterdataCompletion(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    matnr8: Optional[int] = Field(None, alias="MATNR8", description="8-digit material number")
+    matnr: Optional[str] = Field(None, alias="MATNR", description="Material number")
+    material_description: Optional[str] = Field(None, alias="materialDescription", description="Material description")
+
+
+class MasterdataTypeaheadResponse(BaseModel):
+    completions: List[MasterdataCompletion]
+
+
+# Default and upper bound for typeahead completions
+MASTERDATA_TYPEAHEAD_DEFAULT_LIMIT = 10
+MASTERDATA_TYPEAHEAD_MAX_LIMIT = 100
+
+
+# Upper bound for MATNR8s resolved by one batch request
+MASTERDATA_BATCH_MAX_SIZE = 5000
+
+
+class MasterdataBatchRequest(BaseModel):
+    matnr8s: List[int] = Field(
+        ...,
+        min_length=1,
+        max_length=MASTERDATA_BATCH_MAX_SIZE,
+        description="MATNR8 values to look up (e.g., [91967086, 81234567])",
+    )
+    fields: Optional[List[str]] = Field(
+        None, description="Response fields to return (e.g., [\"MATNR8\", \"tpm\"]); all fields when omitted"
+    )
+
+
+class MasterdataBatchResponse(MasterdataConfigResponse):
+    missing: List[int] = Field(default_factory=list, description="Requested MATNR8 values not found in the cache")
+
+
+# Response key (MasterdataConfig alias) -> masterdata_databricks column, in
+# MasterdataConfig field order. Keys without a matching column serialize as null.
+MASTERDATA_FIELD_COLUMNS = (
+    ("MATNR", "MATNR"),
+    ("MATNR8", "MATNR8"),
+    ("materialDescription", "MATERIAL_DESCRIPTION"),
+    ("materialType", "MATERIAL_TYPE"),
+    ("xplantStatus", "XPLANT_STATUS"),
+    ("prdhatxt", "PRDHATXT"),
+    ("makeup", "MAKEUP"),
+    ("plants", "PLANTS"),
+    ("plantsTxt", "PLANTS_TXT"),
+    ("principleTradename", "PRINCIPLE_TRADENAME"),
+    ("contractManufacturerCodetype", "CONTRACT_MANUFACTURER_CODETYPE"),
+    ("contractManufacturerCode", "CONTRACT_MANUFACTURER_CODE"),
+    ("responsibleForSpecification", "RESPONSIBLE_FOR_SPECIFICATION"),
+    ("contractManufacturerMaterial", "CONTRACT_MANUFACTURER_MATERIAL"),
+    ("layoutApproved", "LAYOUT_APPROVED"),
+    ("usagePrefix", "USAGE_PREFIX"),
+    ("numberOfPages", "NUMBER_OF_PAGES"),
+    ("acfFlag", "ACF_FLAG"),
+    ("visibleMarkings", "VISIBLE_MARKINGS"),
+    ("code", "CODE"),
+    ("colors", "COLORS"),
+    ("numberColorsFront", "NUMBER_COLORS_FRONT"),
+    ("contractManufacturer", "CONTRACT_MANUFACTURER"),
+    ("articleCodetype", "ARTICLE_CODETYPE"),
+    ("articleCode", "ARTICLE_CODE"),
+    ("contractManVisibleMarkings", "CONTRACT_MAN_VISIBLE_MARKINGS"),
+    ("contractManufacturerMtIndex", "CONTRACT_MANUFACTURER_MT_INDEX"),
+    ("componentScrabKey", "COMPONENT_SCRAB_KEY"),
+    ("remarks", "REMARKS"),
+    ("printed", "PRINTED"),
+    ("numberColorsBack", "NUMBER_COLORS_BACK"),
+    ("printCharacteristics", "PRINT_CHARACTERISTICS"),
+    ("brailleText", "BRAILLE_TEXT"),
+    ("printcharBraille", "PRINTCHAR_BRAILLE"),
+    ("printcharFoilstamp", "PRINTCHAR_FOILSTAMP"),
+    ("printcharVarnish", "PRINTCHAR_VARNISH"),
+    ("printcharCryptoglyph", "PRINTCHAR_CRYPTOGLYPH"),
+    ("printcharPseudocryptoglyph", "PRINTCHAR_PSEUDOCRYPTOGLYPH"),
+    ("printcharPeak", "PRINTCHAR_PEAK"),
+    ("printcharEmbossing", "PRINTCHAR_EMBOSSING"),
+    ("printcharCoinreactiveink", "PRINTCHAR_COINREACTIVEINK"),
+    ("printcharIriodinlacquer", "PRINTCHAR_IRIODINLACQUER"),
+    ("printcharUvlacquer", "PRINTCHAR_UVLACQUER"),
+    ("printcharPerlmuttlacquer", "PRINTCHAR_PERLMUTTLACQUER"),
+    ("printcharRichpalegold", "PRINTCHAR_RICHPALEGOLD"),
+    ("printcharSilverhotfoil", "PRINTCHAR_SILVERHOTFOIL"),
+    ("printcharUnvarnish", "PRINTCHAR_UNVARNISH"),
+    ("printcharSecurityvarish", "PRINTCHAR_SECURITYVARISH"),
+    ("printcharMattvarnish", "PRINTCHAR_MATTVARNISH"),
+    ("printcharCodingbysupplier", "PRINTCHAR_CODINGBYSUPPLIER"),
+    ("printcharBklogo", "PRINTCHAR_BKLOGO"),
+    ("printcharSDr", "PRINTCHAR_S_DR"),
+    ("draCombination", "DRA_COMBINATION"),
+    ("draCombinationDktxtuc", "DRA_COMBINATION_DKTXTUC"),
+    ("draDieline", "DRA_DIELINE"),
+    ("draDielineDktxtuc", "DRA_DIELINE_DKTXTUC"),
+    ("draOther", "DRA_OTHER"),
+    ("draOtherDktxtuc", "DRA_OTHER_DKTXTUC"),
+    ("draAll", "DRA_ALL"),
+    ("draAllDktxtuc", "DRA_ALL_DKTXTUC"),
+    ("dra1", "DRA_1"),
+    ("dra2", "DRA_2"),
+    ("dra3", "DRA_3"),
+    ("dra4", "DRA_4"),
+    ("dra5", "DRA_5"),
+    ("dra6", "DRA_6"),
+    ("dra7", "DRA_7"),
+    ("dra8", "DRA_8"),
+    ("dra9", "DRA_9"),
+    ("dra10", "DRA_10"),
+    ("lra", "LRA"),
+    ("lraVersion", "LRA_VERSION"),
+    ("lraDate", "LRA_DATE"),
+    ("lraFilename", "LRA_FILENAME"),
+    ("hrl", "HRL"),
+    ("hrlVersion", "HRL_VERSION"),
+    ("hrlDate", "HRL_DATE"),
+    ("acs", "ACS"),
+    ("acsVersion", "ACS_Version"),
+    ("tpmDrawing", "TPM_DRAWING"),
+    ("tpm", "TPM"),
+    ("tpmtxt", "TPMTXT"),
+    ("tpmStatus", "TPM_STATUS"),
+    ("glpt", "GLPT"),
+    ("glpttxt", "GLPTTXT"),
+    ("eclass", "ECLASS"),
+    ("eclasstxt", "ECLASSTXT"),
+    ("eclassS", "ECLASS_S"),
+    ("eclassSText", "ECLASS_S_TXT"),
+)
@@ -1,11 +1,12 @@
 """
 Database utility functions for ScriPTA API.
 """
+import hashlib
 import json
 import logging
 import os
 import sqlite3
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
 
 from fastapi import HTTPException
 from pydantic import ValidationError
@@ -815,11 +816,9 @@ def create_masterdata_databricks_table():
     try:
         cursor = conn.cursor()
         
-        # Drop existing table to recreate with correct schema
-        cursor.execute("DROP TABLE IF EXISTS masterdata_databricks")
-        
+        # Keep existing data: the cache is preloaded from this table on startup
         create_table_sql = """
-        CREATE TABLE masterdata_databricks (
+        CREATE TABLE IF NOT EXISTS masterdata_databricks (
             MATNR TEXT PRIMARY KEY,
             MATNR8 INTEGER,
             MATERIAL_DESCRIPTION TEXT,
@@ -910,19 +909,35 @@ def create_masterdata_databricks_table():
             ECLASS_S TEXT,
             ECLASS_S_TXT TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            content_hash TEXT
         )
         """
         
         cursor.execute(create_table_sql)
         
+        # Tables created before content hashing get the column; their rows are
+        # rewritten once by the next refresh
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(masterdata_databricks)")]
+        if "content_hash" not in columns:
+            cursor.execute("ALTER TABLE masterdata_databricks ADD COLUMN content_hash TEXT")
+        
         # Create indexes for better performance
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_masterdata_databricks_matnr8 ON masterdata_databricks (MATNR8)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_masterdata_databricks_matnr ON masterdata_databricks (MATNR)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_masterdata_databricks_material_type ON masterdata_databricks (MATERIAL_TYPE)")
         
+        # Watermarks and times of the refreshes, one value per name
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS masterdata_refresh_state (
+            name TEXT PRIMARY KEY,
+            value TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        
         conn.commit()
-        logging.info("masterdata_databricks table created successfully with updated schema")
+        logging.info("masterdata_databricks table ensured")
         
     except Exception as e:
         logging.error(f"Failed to create masterdata_databricks table: {str(e)}")
@@ -931,50 +946,274 @@ def create_masterdata_databricks_table():
         conn.close()
 
 
-def save_masterdata_to_sqlite(masterdata_records: List[Dict]) -> int:
-    """Save masterdata records to the SQLite database."""
-    if not masterdata_records:
-        return 0
+# Columns left out of a record's content hash
+_UNHASHED_COLUMNS = frozenset(("created_at", "updated_at", "content_hash"))
+# Keys listed per kind of change in a refresh's change report
+DIFF_SAMPLE_SIZE = 10
+
+
+def _content_hasher(columns: Iterable[str]) -> Callable[[Dict], str]:
+    """
+    Build the content hash function for records with the given columns.
+
+    The hash covers the column names once and the values in column order;
+    the audit columns are left out.
+    """
+    hashed = sorted(column for column in columns if column not in _UNHASHED_COLUMNS)
+    prefix = hashlib.blake2b(json.dumps(hashed).encode("utf-8"), digest_size=16)
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=str).encode
+    
+    def content_hash(record: Dict) -> str:
+        digest = prefix.copy()
+        digest.update(encode([record.get(column) for column in hashed]).encode("utf-8"))
+        return digest.hexdigest()
     
+    return content_hash
+
+
+def masterdata_content_hash(record: Dict) -> str:
+    """Hash of a masterdata record's content, without the audit columns."""
+    return _content_hasher(record)(record)
+
+
+def _write_masterdata_rows(cursor: sqlite3.Cursor, incoming: Dict[str, Dict],
+                           stored: Dict[str, str]) -> Tuple[List[str], List[str]]:
+    """
+    Write the incoming records (by MATNR) that are new or whose content hash
+    differs from the stored one. Returns the inserted and the updated MATNRs.
+    """
+    if not incoming:
+        return [], []
+    first = next(iter(incoming.values()))
+    content_hash = _content_hasher(first)
+    hashes = {matnr: content_hash(record) for matnr, record in incoming.items()}
+    inserted = [matnr for matnr in incoming if matnr not in stored]
+    updated = [matnr for matnr in incoming if matnr in stored and stored[matnr] != hashes[matnr]]
+    written = inserted + updated
+    
+    if written:
+        columns = [col for col in first.keys() if col not in _UNHASHED_COLUMNS] + ["content_hash"]
+        placeholders = ','.join(['?' for _ in columns])
+        assignments = ', '.join(f"{col} = excluded.{col}" for col in columns if col != "MATNR")
+        cursor.executemany(
+            f"INSERT INTO masterdata_databricks ({','.join(columns)}) VALUES ({placeholders}) "
+            f"ON CONFLICT (MATNR) DO UPDATE SET {assignments}, updated_at = CURRENT_TIMESTAMP",
+            [(*(incoming[matnr].get(col) for col in columns[:-1]), hashes[matnr]) for matnr in written],
+        )
+    return inserted, updated
+
+
+def _stored_hashes(cursor: sqlite3.Cursor, matnrs: Iterable[str]) -> Dict[str, str]:
+    # JSON parameters keep the statements independent of SQLite's variable limit
+    return dict(cursor.execute(
+        "SELECT MATNR, content_hash FROM masterdata_databricks WHERE MATNR IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(matnrs)),),
+    ).fetchall())
+
+
+def _write_masterdata_changes(cursor: sqlite3.Cursor, masterdata_records: List[Dict],
+                              removable: Iterable[str]) -> Tuple[Dict, List[str], List[str]]:
+    """
+    Write the records that are new or whose content hash changed, and delete
+    the removable MATNRs without a record.
+
+    Unchanged rows are not touched, so updated_at is the time a material's
+    content last changed. Returns the change report, the written and the
+    deleted MATNRs.
+    """
+    # Later records replace earlier ones with the same MATNR
+    incoming = {record["MATNR"]: record for record in masterdata_records}
+    removable = set(removable)
+    stored = _stored_hashes(cursor, sorted(removable.union(incoming)))
+    removed = sorted(matnr for matnr in removable if matnr in stored and matnr not in incoming)
+    inserted, updated = _write_masterdata_rows(cursor, incoming, stored)
+    if removed:
+        cursor.execute(
+            "DELETE FROM masterdata_databricks WHERE MATNR IN (SELECT value FROM json_each(?))",
+            (json.dumps(removed),),
+        )
+    
+    report = _change_report(len(incoming), _ChangeCount(inserted), _ChangeCount(updated), _ChangeCount(removed))
+    return report, inserted + updated, removed
+
+
+class _ChangeCount:
+    """Number of changes of one kind with the first DIFF_SAMPLE_SIZE MATNRs."""
+    
+    def __init__(self, matnrs: Sequence[str] = ()):
+        self.count = 0
+        self.sample: List[str] = []
+        self.add(matnrs)
+    
+    def add(self, matnrs: Sequence[str]) -> None:
+        self.count += len(matnrs)
+        self.sample.extend(matnrs[:DIFF_SAMPLE_SIZE - len(self.sample)])
+
+
+def _change_report(record_count: int, inserted: _ChangeCount, updated: _ChangeCount, removed: _ChangeCount) -> Dict:
+    return {
+        "records": record_count,
+        "inserted": inserted.count,
+        "updated": updated.count,
+        "deleted": removed.count,
+        "unchanged": record_count - inserted.count - updated.count,
+        "sample_keys": {
+            "inserted": inserted.sample,
+            "updated": updated.sample,
+            "deleted": removed.sample,
+        },
+    }
+
+
+def save_masterdata_to_sqlite(masterdata_records: List[Dict]) -> Dict:
+    """
+    Save a full masterdata fetch to the SQLite database.
+
+    Only inserted, changed and deleted rows are written. Returns the change
+    report: counts per kind of change and up to DIFF_SAMPLE_SIZE MATNRs of
+    each.
+    """
+    return save_masterdata_chunks_to_sqlite([masterdata_records])
+
+
+def save_masterdata_chunks_to_sqlite(chunks: Iterable[List[Dict]]) -> Dict:
+    """
+    Save a full masterdata fetch arriving in chunks to the SQLite database.
+
+    Every chunk is compared with the stored content hashes of its MATNRs, and
+    its new and changed rows are committed before the next chunk is read, so
+    memory is bounded by the chunk size and other writers wait for one chunk
+    at most. The fetched MATNRs are collected in a temporary table; stored
+    materials the fetch did not return are deleted once it is complete. A
+    fetch that fails midway keeps the chunks written so far and deletes
+    nothing.
+
+    Returns the change report like save_masterdata_to_sqlite.
+    """
     conn = get_db_connection()
     try:
         cursor = conn.cursor()
+        cursor.execute("CREATE TEMP TABLE masterdata_fetched (MATNR TEXT PRIMARY KEY)")
+        inserted, updated = _ChangeCount(), _ChangeCount()
+        
+        for chunk in chunks:
+            # Later records replace earlier ones with the same MATNR
+            incoming = {record["MATNR"]: record for record in chunk}
+            matnrs = json.dumps(list(incoming))
+            # A MATNR repeated in a later chunk is written again but counted once
+            repeated = {row[0] for row in cursor.execute(
+                "SELECT MATNR FROM temp.masterdata_fetched WHERE MATNR IN (SELECT value FROM json_each(?))",
+                (matnrs,),
+            )}
+            chunk_inserted, chunk_updated = _write_masterdata_rows(cursor, incoming, _stored_hashes(cursor, incoming))
+            cursor.execute("INSERT OR IGNORE INTO temp.masterdata_fetched SELECT value FROM json_each(?)", (matnrs,))
+            conn.commit()
+            inserted.add([matnr for matnr in chunk_inserted if matnr not in repeated])
+            updated.add([matnr for matnr in chunk_updated if matnr not in repeated])
+        
+        record_count = cursor.execute("SELECT COUNT(*) FROM temp.masterdata_fetched").fetchone()[0]
+        removed = _ChangeCount()
+        # An empty fetch never clears the table
+        if record_count:
+            missing = "FROM masterdata_databricks WHERE MATNR NOT IN (SELECT MATNR FROM temp.masterdata_fetched)"
+            removed.count = cursor.execute(f"SELECT COUNT(*) {missing}").fetchone()[0]
+            removed.sample = [row[0] for row in cursor.execute(
+                f"SELECT MATNR {missing} ORDER BY MATNR LIMIT ?", (DIFF_SAMPLE_SIZE,)
+            )]
+            cursor.execute(f"DELETE {missing}")
+            conn.commit()
+        report = _change_report(record_count, inserted, updated, removed)
+        
+        logging.info(
+            f"Saved {report['records']} masterdata records to SQLite database: {report['inserted']} inserted, "
+            f"{report['updated']} updated, {report['deleted']} deleted, {report['unchanged']} unchanged"
+        )
         
-        # Clear existing data
-        cursor.execute("DELETE FROM masterdata_databricks")
-        
-        # Prepare insert statement - using the first record to determine columns
-        first_record = masterdata_records[0]
-        columns = list(first_record.keys())
-        placeholders = ','.join(['?' for _ in columns])
-        insert_sql = f"INSERT OR REPLACE INTO masterdata_databricks ({','.join(columns)}) VALUES ({placeholders})"
-        
-        # Convert records to tuples
-        record_tuples = []
-        for record in masterdata_records:
-            tuple_data = tuple(record.get(col) for col in columns)
-            record_tuples.append(tuple_data)
+        return report
         
-        # Bulk insert
-        cursor.executemany(insert_sql, record_tuples)
+    except sqlite3.Error as e:
+        # Errors of the fetch feeding the chunks are raised as they are
+        logging.error(f"Failed to save masterdata to SQLite: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    finally:
+        conn.close()
+
+
+def upsert_masterdata_in_sqlite(masterdata_records: List[Dict],
+                                changed_matnrs: Iterable[str]) -> Tuple[List[Dict], List[str], Dict]:
+    """
+    Apply an incremental refresh to the masterdata_databricks table.
+
+    Records that are new or changed are written by MATNR; created_at is kept
+    for existing materials. Changed MATNRs without a record are deleted.
+    Returns the written rows as stored, the deleted MATNRs and the change
+    report.
+    """
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        report, written, removed = _write_masterdata_changes(cursor, masterdata_records, changed_matnrs)
         
-        # Update the updated_at timestamp for all records
-        cursor.execute("UPDATE masterdata_databricks SET updated_at = CURRENT_TIMESTAMP")
+        cursor.execute(
+            "SELECT * FROM masterdata_databricks WHERE MATNR IN (SELECT value FROM json_each(?))",
+            (json.dumps(written),),
+        )
+        column_names = [description[0] for description in cursor.description]
+        stored = [dict(zip(column_names, row)) for row in cursor.fetchall()]
         
         conn.commit()
+        logging.info(
+            f"Incremental masterdata refresh in SQLite database: {report['inserted']} inserted, "
+            f"{report['updated']} updated, {report['deleted']} deleted, {report['unchanged']} unchanged"
+        )
         
-        rows_saved = len(record_tuples)
-        logging.info(f"Saved {rows_saved} masterdata records to SQLite database")
-        
-        return rows_saved
+        return stored, removed, report
         
     except Exception as e:
-        logging.error(f"Failed to save masterdata to SQLite: {str(e)}")
+        logging.error(f"Failed to upsert masterdata in SQLite: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     finally:
         conn.close()
 
 
+def get_masterdata_refresh_state() -> Dict:
+    """Return the stored watermarks per Databricks view and the times of the last refreshes."""
+    conn = get_db_connection()
+    try:
+        rows = dict(conn.execute("SELECT name, value FROM masterdata_refresh_state").fetchall())
+    except sqlite3.OperationalError:
+        # Table not created yet: nothing was refreshed
+        rows = {}
+    finally:
+        conn.close()
+    
+    return {
+        "watermarks": {
+            name[len("watermark:"):]: value for name, value in rows.items() if name.startswith("watermark:")
+        },
+        "last_full_refresh": rows.get("last_full_refresh"),
+        "last_incremental_refresh": rows.get("last_incremental_refresh"),
+    }
+
+
+def save_masterdata_refresh_state(watermarks: Dict[str, str], full_refresh: bool) -> None:
+    """Store the watermarks reached by a refresh and record when it ran (UTC)."""
+    conn = get_db_connection()
+    try:
+        conn.executemany(
+            "INSERT OR REPLACE INTO masterdata_refresh_state (name, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
+            [(f"watermark:{view}", value) for view, value in watermarks.items()],
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO masterdata_refresh_state (name, value, updated_at) "
+            "VALUES (?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)",
+            ("last_full_refresh" if full_refresh else "last_incremental_refresh",),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
 def get_masterdata_databricks_stats():
     """Get statistics about the masterdata_databricks table."""
     conn = get_db_connection()
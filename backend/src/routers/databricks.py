@@ -2,19 +2,47 @@
 Databricks router for testing connections and querying data.
 """
 import logging
-from typing import Any, Dict, List
+import time
+from contextlib import closing, contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional
 
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 
-from ..cache import cache_manager
-from ..config.databricks import databricks_config, execute_databricks_query
-from .database import create_masterdata_databricks_table, save_masterdata_to_sqlite
+from ..cache import cache_manager, cache_warmup
+from ..config.databricks import (
+    databricks_config,
+    execute_databricks_query,
+    prefetch,
+    stream_databricks_query,
+)
+from ..config.masterdata_delta import (
+    advance_watermarks,
+    changed_materials_query,
+    full_refresh_reason,
+    incremental_query,
+    load_unified_query,
+    watermark_query,
+)
+from ..metrics import metrics
+from ..scheduler import RefreshInProgressError, RefreshScheduler
+from .database import (
+    DB_PATH,
+    create_masterdata_databricks_table,
+    get_masterdata_refresh_state,
+    save_masterdata_chunks_to_sqlite,
+    save_masterdata_refresh_state,
+    upsert_masterdata_in_sqlite,
+)
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/databricks", tags=["databricks"])
 
+# The cache_load phase is recorded by the cache when it publishes a generation
+_REFRESH_PHASE = "scripta_refresh_phase_duration_seconds"
+
 
 class QueryRequest(BaseModel):
     query: str
@@ -113,18 +141,8 @@ async def get_all_masterdata_from_databricks_before_startup():
     Should be called once daily or during backend startup.
     """
     try:
-        import os
-
         # Read the unified CTE query from file
-        sql_file_path = os.path.join(
-            os.path.dirname(__file__),
-            "..",
-            "config",
-            "databricks_unified_material_data_cte.sql"
-        )
-        
-        with open(sql_file_path, 'r', encoding='utf-8') as file:
-            query = file.read()
+        query = load_unified_query()
         
         logger.info("Starting to fetch all masterdata from Databricks (this may take 15-20 seconds)...")
         
@@ -159,32 +177,62 @@ async def save_masterdata_to_sqlite_and_cache():
     """
     Fetch all masterdata from Databricks and save it to SQLite database and in-memory cache.
     This is the main endpoint for daily data refresh.
+
+    A request made while a full refresh is running gets that run's result
+    instead of starting another one.
     """
+    return await _run_refresh("full")
+
+
+async def _run_refresh(mode: str) -> Dict:
+    try:
+        return await refresh_scheduler.run(mode)
+    except RefreshInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+async def _refresh_full() -> Dict:
     try:
         # First, ensure the masterdata_databricks table exists
         create_masterdata_databricks_table()
         
-        # Fetch data from Databricks
-        response = await get_all_masterdata_from_databricks_before_startup()
+        # The watermarks are read first, so changes made during the fetch are
+        # read again by the next incremental refresh
+        fetch_seconds = [0.0]
+        with _elapsed(fetch_seconds):
+            watermarks = await _read_watermarks()
         
-        if not response["success"]:
-            raise HTTPException(status_code=500, detail="Failed to fetch data from Databricks")
+        # Stream the rows from Databricks into SQLite chunk by chunk: the next
+        # chunk is fetched while the current one is written, and only the
+        # changed rows are written
+        chunks = prefetch(_timed_chunks(stream_databricks_query(load_unified_query()), fetch_seconds))
+        try:
+            with metrics.timer(_REFRESH_PHASE, (("phase", "sqlite_save"),)):
+                sqlite_changes = await run_in_threadpool(_save_chunks, chunks)
+        finally:
+            metrics.observe(_REFRESH_PHASE, fetch_seconds[0], (("phase", "databricks_fetch"),))
+        saved_count = sqlite_changes["records"]
         
-        masterdata_records = response["data"]
+        if watermarks is not None:
+            save_masterdata_refresh_state(watermarks, full_refresh=True)
         
-        # Save to SQLite database
-        saved_count = save_masterdata_to_sqlite(masterdata_records)
-        
-        # Update in-memory cache
-        cache_loaded = cache_manager.bulk_insert_masterdata(masterdata_records)
+        # Build a new cache generation off the event loop; lookups keep being
+        # served from the current generation until it is swapped in. It is
+        # loaded from SQLite so the cache carries the same updated_at, and kept
+        # when nothing changed.
+        changed_count = sqlite_changes["inserted"] + sqlite_changes["updated"] + sqlite_changes["deleted"]
+        cache_loaded = None
+        if changed_count or not cache_warmup.ready:
+            cache_loaded = await run_in_threadpool(cache_manager.load_masterdata_from_sqlite, DB_PATH)
         
         logger.info(f"Successfully saved {saved_count} records to SQLite and loaded {cache_loaded} records into cache")
         
         return {
             "success": True,
-            "message": f"Successfully fetched {len(masterdata_records)} records from Databricks, saved {saved_count} to SQLite, and loaded {cache_loaded} into cache",
-            "databricks_records": len(masterdata_records),
+            "message": f"Successfully streamed {saved_count} records from Databricks into SQLite ({changed_count} changed) and loaded {cache_loaded} into cache",
+            "databricks_records": saved_count,
             "sqlite_records_saved": saved_count,
+            "sqlite_changes": sqlite_changes,
             "cache_records_loaded": cache_loaded
         }
     
@@ -196,6 +244,148 @@ async def save_masterdata_to_sqlite_and_cache():
         )
 
 
+@contextmanager
+def _elapsed(seconds: List[float]) -> Iterator[None]:
+    """Add the duration of the block to seconds[0]."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds[0] += time.perf_counter() - started
+
+
+def _save_chunks(chunks: Iterator[List[Dict]]) -> Dict:
+    """Save streamed chunks, closing them in the same worker thread also when the save fails."""
+    with closing(chunks):
+        return save_masterdata_chunks_to_sqlite(chunks)
+
+
+def _timed_chunks(chunks: Iterable[List[Dict]], seconds: List[float]) -> Iterator[List[Dict]]:
+    """Pass the chunks through, adding the time spent waiting for each to seconds[0]."""
+    iterator = iter(chunks)
+    try:
+        while True:
+            with _elapsed(seconds):
+                chunk = next(iterator, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+
+
+async def _read_watermarks() -> Optional[Dict[str, str]]:
+    """Latest change date per watched view, or None when they cannot be read."""
+    try:
+        rows = await run_in_threadpool(execute_databricks_query, watermark_query())
+    except Exception as e:
+        # The full refresh still succeeds; incremental refreshes keep reconciling
+        logger.warning(f"Failed to read masterdata change watermarks: {str(e)}")
+        return None
+    return {row["SOURCE"]: row["WATERMARK"] for row in rows if row["WATERMARK"] is not None}
+
+
+@router.post("/refresh_masterdata_incremental")
+async def refresh_masterdata_incremental(full: bool = False):
+    """
+    Refresh only the materials whose source rows changed since the last refresh.
+
+    The unified CTE is restricted to materials with changes in pmd_mara_view,
+    p2r_ausp_view or p2r_drad_view after the stored watermarks; those rows are
+    upserted into SQLite and the cache, and materials the CTE no longer returns
+    are deleted. Without watermarks, or once the last full refresh is older
+    than MASTERDATA_FULL_RECONCILE_HOURS, a full refresh runs instead;
+    full=true forces it.
+
+    Like the full refresh, a request made while an incremental refresh is
+    running attaches to it; a refresh of the other kind runs after it.
+    """
+    if full:
+        result = await _run_refresh("full")
+        return {**result, "mode": "full", "full_refresh_reason": "requested"}
+    return await _run_refresh("incremental")
+
+
+async def _refresh_incremental() -> Dict:
+    try:
+        create_masterdata_databricks_table()
+        state = get_masterdata_refresh_state()
+        reason = full_refresh_reason(state)
+        if reason is not None:
+            logger.info(f"Running a full masterdata refresh instead of an incremental one: {reason}")
+            result = await _refresh_full()
+            return {**result, "mode": "full", "full_refresh_reason": reason}
+        
+        watermarks = state["watermarks"]
+        with metrics.timer(_REFRESH_PHASE, (("phase", "databricks_fetch"),)):
+            changes = await run_in_threadpool(execute_databricks_query, changed_materials_query(watermarks))
+            changed_matnrs = {change["MATNR"] for change in changes}
+            records = []
+            if changed_matnrs:
+                records = await run_in_threadpool(execute_databricks_query, incremental_query(watermarks))
+        
+        with metrics.timer(_REFRESH_PHASE, (("phase", "sqlite_save"),)):
+            stored, removed, sqlite_changes = await run_in_threadpool(
+                upsert_masterdata_in_sqlite, records, changed_matnrs
+            )
+        new_watermarks = advance_watermarks(watermarks, changes)
+        save_masterdata_refresh_state(new_watermarks, full_refresh=False)
+        
+        # Source changes that leave a material's content as it was write nothing
+        cache_records = None
+        if stored or removed:
+            if cache_warmup.ready:
+                cache_records = await run_in_threadpool(cache_manager.apply_masterdata_changes, stored, removed)
+            else:
+                # A cache without the full data set cannot take a delta
+                cache_records = await run_in_threadpool(cache_manager.load_masterdata_from_sqlite, DB_PATH)
+        
+        logger.info(
+            f"Incremental masterdata refresh: {len(changed_matnrs)} changed materials, "
+            f"{len(stored)} upserted, {len(removed)} deleted"
+        )
+        
+        return {
+            "success": True,
+            "mode": "incremental",
+            "message": f"Upserted {len(stored)} and deleted {len(removed)} of {len(changed_matnrs)} changed materials",
+            "changed_materials": len(changed_matnrs),
+            "databricks_records": len(records),
+            "sqlite_records_upserted": len(stored),
+            "sqlite_records_deleted": len(removed),
+            "sqlite_changes": sqlite_changes,
+            "cache_records_loaded": cache_records,
+            "watermarks": new_watermarks,
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to refresh masterdata incrementally: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to refresh masterdata incrementally: {str(e)}"
+        )
+
+
+# Runs the refreshes one at a time; MASTERDATA_REFRESH_SCHEDULE is started in the lifespan
+refresh_scheduler = RefreshScheduler(
+    {"full": _refresh_full, "incremental": _refresh_incremental},
+    lock_path=lambda: f"{DB_PATH}.refresh.lock",
+)
+
+
+@router.get("/refresh_status")
+async def get_refresh_status():
+    """
+    The refresh schedule, the next scheduled run, the run in flight and the
+    last finished run with its duration, as seen by this worker.
+    """
+    return refresh_scheduler.status()
+
+
 @router.post("/refresh_cache_from_sqlite")
 async def refresh_cache_from_sqlite():
     """
@@ -207,10 +397,10 @@ async def refresh_cache_from_sqlite():
 
         # Load data from SQLite into cache
         db_path = os.path.join(os.path.dirname(__file__), "..", "..", "scripta-db.sqlite3")
-        rows_loaded = cache_manager.load_masterdata_from_sqlite(db_path)
+        rows_loaded = await run_in_threadpool(cache_manager.load_masterdata_from_sqlite, db_path)
         
         # Get cache stats
-        cache_stats = cache_manager.get_cache_stats()
+        cache_stats = await run_in_threadpool(cache_manager.get_cache_stats)
         
         logger.info(f"Refreshed cache with {rows_loaded} records from SQLite")
         
@@ -2,113 +2,155 @@
 Masterdata configuration endpoints for the ScriPTA API.
 """
 import logging
-from typing import Optional
+import os
+import zlib
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Iterator, List, Optional
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from pydantic import ValidationError
 
-from ..cache import cache_manager
-from ..models.models import MasterdataConfig, MasterdataConfigResponse
+from ..cache import cache_manager, cache_warmup
+from ..cache.pagination import StalePageTokenError
+from ..cache.serialization import (
+    masterdata_batch_response_body,
+    masterdata_filter_response_body,
+    masterdata_page_response_body,
+    masterdata_response_body,
+    masterdata_tpm_response_body,
+    record_etag,
+    resolve_masterdata_fields,
+    typeahead_response_body,
+)
+from ..models.models import (
+    MASTERDATA_FACET_DEFAULT_LIMIT,
+    MASTERDATA_FACET_MAX_LIMIT,
+    MASTERDATA_FIELD_COLUMNS,
+    MASTERDATA_PAGE_DEFAULT_SIZE,
+    MASTERDATA_PAGE_MAX_SIZE,
+    MASTERDATA_SEARCH_DEFAULT_LIMIT,
+    MASTERDATA_SEARCH_MAX_LIMIT,
+    MASTERDATA_TYPEAHEAD_DEFAULT_LIMIT,
+    MASTERDATA_TYPEAHEAD_MAX_LIMIT,
+    MasterdataBatchRequest,
+    MasterdataBatchResponse,
+    MasterdataConfig,
+    MasterdataConfigResponse,
+    MasterdataFilterResponse,
+    MasterdataPageResponse,
+    MasterdataPlantsResponse,
+    MasterdataTpmResponse,
+    MasterdataTypeaheadResponse,
+)
+from .database import get_tpms_from_db
 
 logger = logging.getLogger(__name__)
 
+# The endpoints reading the cache are plain functions: FastAPI runs them in its
+# threadpool, so reads are served by several threads (each with its own cache
+# connection) and a slow one never holds up the event loop.
 router = APIRouter(tags=["Masterdata"])
 
+FIELDS_DESCRIPTION = (
+    "Comma-separated response fields to return, by response name or column name "
+    "(e.g., MATNR8,tpm,colors,PRINTCHAR_BRAILLE). All fields when omitted."
+)
+
+
+# Seconds clients may reuse a masterdata response without revalidating it. The
+# default of 0 makes them revalidate every time, which is answered with 304
+# until the cache is refreshed.
+MASTERDATA_HTTP_MAX_AGE = int(os.getenv("MASTERDATA_HTTP_MAX_AGE", "0"))
+CACHE_CONTROL = f"max-age={MASTERDATA_HTTP_MAX_AGE}, must-revalidate" if MASTERDATA_HTTP_MAX_AGE > 0 else "no-cache"
+
+
+# Seconds clients are asked to wait before retrying while the cache warms up
+WARMUP_RETRY_AFTER = "5"
+
+
+async def _require_warm_cache() -> None:
+    """Answer 503 while the startup warm-up is still loading the masterdata, instead of 404 for every material."""
+    # async, so the check does not take a threadpool hop on every request
+    if cache_warmup.loading:
+        raise HTTPException(
+            status_code=503,
+            detail="Masterdata cache is warming up, see /ready",
+            headers={"Retry-After": WARMUP_RETRY_AFTER},
+        )
+
+
+_WARM_CACHE = [Depends(_require_warm_cache)]
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header value against an entity tag."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    # Weak comparison: W/"x" matches "x"
+    return "*" in candidates or any(
+        (candidate[2:] if candidate.startswith("W/") else candidate) == etag for candidate in candidates
+    )
+
+
+def _not_modified(if_none_match: Optional[str], if_modified_since: Optional[str],
+                  etag: Optional[str], loaded_at: float) -> bool:
+    """
+    Evaluate the conditional request headers against a response's validators.
+
+    If-Modified-Since is only evaluated without If-None-Match. Masterdata can
+    only change when a new cache generation is published, so the generation's
+    publish time is the last modification of every response served from it.
+    """
+    if if_none_match:
+        return etag is not None and _etag_matches(if_none_match, etag)
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        # HTTP dates have whole seconds
+        return since >= int(loaded_at)
+    return False
+
+
+def _validator_headers(etag: Optional[str], loaded_at: float) -> Dict[str, str]:
+    """ETag, Last-Modified and Cache-Control headers of a masterdata response."""
+    headers = {"Last-Modified": formatdate(int(loaded_at), usegmt=True), "Cache-Control": CACHE_CONTROL}
+    if etag is not None:
+        headers["ETag"] = etag
+    return headers
+
+
+def _accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Check whether an Accept-Encoding header value allows gzip."""
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() != "gzip":
+            continue
+        key, _, quality = params.strip().lower().partition("=")
+        try:
+            return not key or (key == "q" and float(quality) > 0)
+        except ValueError:
+            return False
+    return False
+
+
+def _gzip_stream(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Compress a stream of chunks into one gzip member."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
 
 def _convert_dict_to_masterdata_config(data_dict: dict) -> MasterdataConfig:
     """Convert a dictionary to MasterdataConfig model."""
     try:
-        return MasterdataConfig(
-            MATNR=data_dict.get('MATNR'),
-            MATNR8=data_dict.get('MATNR8'),
-            materialDescription=data_dict.get('MATERIAL_DESCRIPTION'),
-            materialType=data_dict.get('MATERIAL_TYPE'),
-            xplantStatus=data_dict.get('XPLANT_STATUS'),
-            prdhatxt=data_dict.get('PRDHATXT'),
-            makeup=data_dict.get('MAKEUP'),
-            plants=data_dict.get('PLANTS'),
-            plantsTxt=data_dict.get('PLANTS_TXT'),
-            principleTradename=data_dict.get('PRINCIPLE_TRADENAME'),
-            contractManufacturerCodetype=data_dict.get('CONTRACT_MANUFACTURER_CODETYPE'),
-            contractManufacturerCode=data_dict.get('CONTRACT_MANUFACTURER_CODE'),
-            responsibleForSpecification=data_dict.get('RESPONSIBLE_FOR_SPECIFICATION'),
-            contractManufacturerMaterial=data_dict.get('CONTRACT_MANUFACTURER_MATERIAL'),
-            layoutApproved=data_dict.get('LAYOUT_APPROVED'),
-            usagePrefix=data_dict.get('USAGE_PREFIX'),
-            numberOfPages=data_dict.get('NUMBER_OF_PAGES'),
-            acfFlag=data_dict.get('ACF_FLAG'),
-            visibleMarkings=data_dict.get('VISIBLE_MARKINGS'),
-            code=data_dict.get('CODE'),
-            colors=data_dict.get('COLORS'),
-            numberColorsFront=data_dict.get('NUMBER_COLORS_FRONT'),
-            contractManufacturer=data_dict.get('CONTRACT_MANUFACTURER'),
-            articleCodetype=data_dict.get('ARTICLE_CODETYPE'),
-            articleCode=data_dict.get('ARTICLE_CODE'),
-            contractManVisibleMarkings=data_dict.get('CONTRACT_MAN_VISIBLE_MARKINGS'),
-            contractManufacturerMtIndex=data_dict.get('CONTRACT_MANUFACTURER_MT_INDEX'),
-            componentScrabKey=data_dict.get('COMPONENT_SCRAB_KEY'),
-            remarks=data_dict.get('REMARKS'),
-            printed=data_dict.get('PRINTED'),
-            numberColorsBack=data_dict.get('NUMBER_COLORS_BACK'),
-            printCharacteristics=data_dict.get('PRINT_CHARACTERISTICS'),
-            brailleText=data_dict.get('BRAILLE_TEXT'),
-            printcharBraille=data_dict.get('PRINTCHAR_BRAILLE'),
-            printcharFoilstamp=data_dict.get('PRINTCHAR_FOILSTAMP'),
-            printcharVarnish=data_dict.get('PRINTCHAR_VARNISH'),
-            printcharCryptoglyph=data_dict.get('PRINTCHAR_CRYPTOGLYPH'),
-            printcharPseudocryptoglyph=data_dict.get('PRINTCHAR_PSEUDOCRYPTOGLYPH'),
-            printcharPeak=data_dict.get('PRINTCHAR_PEAK'),
-            printcharEmbossing=data_dict.get('PRINTCHAR_EMBOSSING'),
-            printcharCoinreactiveink=data_dict.get('PRINTCHAR_COINREACTIVEINK'),
-            printcharIriodinlacquer=data_dict.get('PRINTCHAR_IRIODINLACQUER'),
-            printcharUvlacquer=data_dict.get('PRINTCHAR_UVLACQUER'),
-            printcharPerlmuttlacquer=data_dict.get('PRINTCHAR_PERLMUTTLACQUER'),
-            printcharRichpalegold=data_dict.get('PRINTCHAR_RICHPALEGOLD'),
-            printcharSilverhotfoil=data_dict.get('PRINTCHAR_SILVERHOTFOIL'),
-            printcharUnvarnish=data_dict.get('PRINTCHAR_UNVARNISH'),
-            printcharSecurityvarish=data_dict.get('PRINTCHAR_SECURITYVARISH'),
-            printcharMattvarnish=data_dict.get('PRINTCHAR_MATTVARNISH'),
-            printcharCodingbysupplier=data_dict.get('PRINTCHAR_CODINGBYSUPPLIER'),
-            printcharBklogo=data_dict.get('PRINTCHAR_BKLOGO'),
-            printcharSDr=data_dict.get('PRINTCHAR_S_DR'),
-            draCombination=data_dict.get('DRA_COMBINATION'),
-            draCombinationDktxtuc=data_dict.get('DRA_COMBINATION_DKTXTUC'),
-            draDieline=data_dict.get('DRA_DIELINE'),
-            draDielineDktxtuc=data_dict.get('DRA_DIELINE_DKTXTUC'),
-            draOther=data_dict.get('DRA_OTHER'),
-            draOtherDktxtuc=data_dict.get('DRA_OTHER_DKTXTUC'),
-            draAll=data_dict.get('DRA_ALL'),
-            draAllDktxtuc=data_dict.get('DRA_ALL_DKTXTUC'),
-            dra1=data_dict.get('DRA_1'),
-            dra2=data_dict.get('DRA_2'),
-            dra3=data_dict.get('DRA_3'),
-            dra4=data_dict.get('DRA_4'),
-            dra5=data_dict.get('DRA_5'),
-            dra6=data_dict.get('DRA_6'),
-            dra7=data_dict.get('DRA_7'),
-            dra8=data_dict.get('DRA_8'),
-            dra9=data_dict.get('DRA_9'),
-            dra10=data_dict.get('DRA_10'),
-            lra=data_dict.get('LRA'),
-            lraVersion=data_dict.get('LRA_VERSION'),
-            lraDate=data_dict.get('LRA_DATE'),
-            lraFilename=data_dict.get('LRA_FILENAME'),
-            hrl=data_dict.get('HRL'),
-            hrlVersion=data_dict.get('HRL_VERSION'),
-            hrlDate=data_dict.get('HRL_DATE'),
-            acs=data_dict.get('ACS'),
-            acsVersion=data_dict.get('ACS_Version'),
-            tpmDrawing=data_dict.get('TPM_DRAWING'),
-            tpm=data_dict.get('TPM'),
-            tpmtxt=data_dict.get('TPMTXT'),
-            tpmStatus=data_dict.get('TPM_STATUS'),
-            glpt=data_dict.get('GLPT'),
-            glpttxt=data_dict.get('GLPTTXT'),
-            eclass=data_dict.get('ECLASS'),
-            eclasstxt=data_dict.get('ECLASSTXT'),
-            eclassS=data_dict.get('ECLASS_S'),
-            eclassSText=data_dict.get('ECLASS_S_TXT')
-        )
+        return MasterdataConfig(**{alias: data_dict.get(column) for alias, column in MASTERDATA_FIELD_COLUMNS})
     except ValidationError as e:
         logger.error(f"Validation error converting dict to MasterdataConfig: {e}")
         raise
@@ -117,53 +159,86 @@ def _convert_dict_to_masterdata_config(data_dict: dict) -> MasterdataConfig:
         raise
 
 
-@router.get("/get_masterdata_from_sqlite", response_model=MasterdataConfigResponse)
-async def get_masterdata_from_sqlite(matnr8: Optional[int] = Query(None, description="Filter by MATNR8", alias="matnr8")) -> MasterdataConfigResponse:
+@router.get("/get_masterdata_from_sqlite", response_model=MasterdataPageResponse, dependencies=_WARM_CACHE)
+def get_masterdata_from_sqlite(
+    matnr8: Optional[int] = Query(None, description="Filter by MATNR8", alias="matnr8"),
+    after_matnr8: Optional[int] = Query(None, description="List records with a MATNR8 greater than this value"),
+    page_size: int = Query(
+        MASTERDATA_PAGE_DEFAULT_SIZE, ge=1, le=MASTERDATA_PAGE_MAX_SIZE, description="Records per page"
+    ),
+    page_token: Optional[str] = Query(None, description="next_page_token of the previous page"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+) -> MasterdataPageResponse:
     """
     Get masterdata configuration from in-memory cache, optionally filtered by MATNR8.
     
-    This endpoint uses the ultra-fast in-memory SQLite cache for instantaneous responses.
+    This endpoint uses the ultra-fast in-memory cache for instantaneous responses.
+    Single MATNR8 lookups are answered with pre-serialized JSON straight from the cache.
+
+    Without matnr8 the records are listed ordered by MATNR8 in pages. Pass the
+    returned next_page_token to get the following page; it is null on the last
+    page. Tokens are tied to the cache generation they were issued for and are
+    rejected with 410 after a cache refresh, so restart the listing then.
+
+    Responses carry an ETag and Last-Modified; send them back in If-None-Match
+    or If-Modified-Since to get 304 Not Modified while the data is unchanged.
+    A single record's ETag is a hash of its content and survives refreshes
+    that do not change the record; listings are tagged with the cache
+    generation.
 
     Args:
         matnr8: Optional MATNR8 (8-digit material number) to filter results (e.g., 91967086)
+        after_matnr8: Start the listing after this MATNR8 (ignored when page_token is given)
+        page_size: Number of records per page (1-5000, default 1000)
+        page_token: Continuation token from the previous page
+        fields: Optional comma-separated response fields (e.g., MATNR8,tpm,colors)
 
     Returns masterdata configuration including all material information.
     """
     try:
+        projection = resolve_masterdata_fields(fields.split(",") if fields else None)
+        # Read before the data so the validators are never newer than the response
+        etag, loaded_at = cache_manager.get_generation_validators()
+
         if matnr8:
-            # Get specific masterdata record from cache
-            cache_result = cache_manager.get_masterdata_by_matnr8(matnr8)
+            # A known content hash proves the record exists, so answer from it
+            # without reading the record; otherwise a missing one must get 404
+            known_etag = cache_manager.get_masterdata_etag_by_matnr8(matnr8) if projection is None else None
+            if known_etag is not None and _not_modified(if_none_match, if_modified_since, known_etag, loaded_at):
+                return Response(status_code=304, headers=_validator_headers(known_etag, loaded_at))
+
+            # Cached data is trusted, so skip model validation and return the
+            # record's pre-serialized JSON directly
+            record_json = cache_manager.get_masterdata_json_by_matnr8(matnr8, fields=projection)
             
-            if not cache_result:
+            if record_json is None:
                 raise HTTPException(status_code=404, detail=f"MATNR8 '{matnr8}' not found in cache")
-            
-            # Convert to MasterdataConfig model
-            masterdata_config = _convert_dict_to_masterdata_config(cache_result)
-            masterdata = [masterdata_config]
-            
-        else:
-            # Get all masterdata from cache (limit to 1000 for performance)
-            cache_results = cache_manager.get_all_masterdata(limit=1000)
-            
-            if not cache_results:
-                # Cache is empty, return empty list
-                masterdata = []
-            else:
-                # Convert all records to MasterdataConfig models
-                masterdata = []
-                for cache_result in cache_results:
-                    try:
-                        masterdata_config = _convert_dict_to_masterdata_config(cache_result)
-                        masterdata.append(masterdata_config)
-                    except Exception as e:
-                        logger.error(f"Error converting record MATNR8 {cache_result.get('MATNR8', 'unknown')}: {e}")
-                        continue
-
-        return MasterdataConfigResponse(masterdata=masterdata)
+
+            headers = _validator_headers(record_etag(record_json), loaded_at)
+            if _not_modified(if_none_match, if_modified_since, headers["ETag"], loaded_at):
+                return Response(status_code=304, headers=headers)
+            return Response(content=masterdata_response_body([record_json]), media_type="application/json", headers=headers)
+
+        headers = _validator_headers(etag, loaded_at)
+        if _not_modified(if_none_match, if_modified_since, etag, loaded_at):
+            return Response(status_code=304, headers=headers)
+
+        page, next_page_token = cache_manager.get_masterdata_page_json(
+            page_size, after_matnr8=after_matnr8, page_token=page_token, fields=projection
+        )
+        return Response(
+            content=masterdata_page_response_body(page, next_page_token), media_type="application/json", headers=headers
+        )
         
     except HTTPException:
         # Re-raise HTTP exceptions (like 404)
         raise
+    except StalePageTokenError as e:
+        raise HTTPException(status_code=410, detail=f"{str(e)}. Restart the listing without page_token.")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error getting masterdata from cache: {str(e)}")
         raise HTTPException(
@@ -172,8 +247,308 @@ async def get_masterdata_from_sqlite(matnr8: Optional[int] = Query(None, descrip
         )
 
 
+@router.post("/get_masterdata_from_sqlite/batch", response_model=MasterdataBatchResponse, dependencies=_WARM_CACHE)
+def get_masterdata_batch_from_sqlite(request: MasterdataBatchRequest) -> MasterdataBatchResponse:
+    """
+    Get masterdata configurations for many MATNR8s with a single request.
+
+    All MATNR8s are resolved in one pass over the in-memory cache. Records are
+    returned in request order (duplicates collapsed); MATNR8s that are not in
+    the cache are listed in `missing` instead of failing the request.
+
+    Args:
+        request: MATNR8 values to look up (at most 5000) and optional response fields
+    """
+    try:
+        projection = resolve_masterdata_fields(request.fields)
+        found, missing = cache_manager.get_masterdata_json_by_matnr8s(request.matnr8s, fields=projection)
+        return Response(content=masterdata_batch_response_body(found, missing), media_type="application/json")
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error getting masterdata batch from cache: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error retrieving masterdata from cache: {str(e)}"
+        )
+
+
+@router.get("/filter_masterdata", response_model=MasterdataFilterResponse, dependencies=_WARM_CACHE)
+def filter_masterdata(
+    material_type: List[str] = Query([], description="MATERIAL_TYPE values (e.g., YPM)"),
+    xplant_status: List[str] = Query([], description="XPLANT_STATUS values"),
+    tpm_status: List[str] = Query([], description="TPM_STATUS values"),
+    eclass: List[str] = Query([], description="ECLASS values"),
+    glpt: List[str] = Query([], description="GLPT values"),
+    usage_prefix: List[str] = Query([], description="USAGE_PREFIX values"),
+    acf_flag: List[str] = Query([], description="ACF_FLAG values"),
+    plant: List[str] = Query([], description="Plants (WERKS) the material is produced at (e.g., DE01)"),
+    page_size: int = Query(
+        MASTERDATA_PAGE_DEFAULT_SIZE, ge=1, le=MASTERDATA_PAGE_MAX_SIZE, description="Records per page"
+    ),
+    page_token: Optional[str] = Query(None, description="next_page_token of the previous page"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    facet_limit: int = Query(
+        MASTERDATA_FACET_DEFAULT_LIMIT, ge=1, le=MASTERDATA_FACET_MAX_LIMIT,
+        description="Most frequent values listed per facet"
+    ),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+) -> MasterdataFilterResponse:
+    """
+    Filter masterdata on categorical columns and get facet counts.
+
+    Repeat a parameter to accept several values (material_type=YPM&material_type=YTXT);
+    values of one facet are combined with OR, different facets with AND. An
+    empty value (tpm_status=) selects records without a value. plant matches
+    any of the comma-separated plants in PLANTS, so plant=DE01 returns every
+    material produced at DE01.
+
+    The response holds one page of matching records ordered by MATNR8, the
+    total number of matches and, for every facet, the counts per value among
+    the records matching the other facets' filters (the facet_limit most
+    frequent values per facet). Send the same filters
+    again together with page_token to get the following page.
+    """
+    filters = {
+        "material_type": material_type,
+        "xplant_status": xplant_status,
+        "tpm_status": tpm_status,
+        "eclass": eclass,
+        "glpt": glpt,
+        "usage_prefix": usage_prefix,
+        "acf_flag": acf_flag,
+        "plant": plant,
+    }
+    try:
+        projection = resolve_masterdata_fields(fields.split(",") if fields else None)
+        etag, loaded_at = cache_manager.get_generation_validators()
+        headers = _validator_headers(etag, loaded_at)
+        if _not_modified(if_none_match, if_modified_since, etag, loaded_at):
+            return Response(status_code=304, headers=headers)
+
+        result = cache_manager.filter_masterdata_json(
+            filters, page_size, page_token=page_token, fields=projection, facet_limit=facet_limit
+        )
+        return Response(
+            content=masterdata_filter_response_body(result.records, result.total, result.facets, result.next_page_token),
+            media_type="application/json",
+            headers=headers,
+        )
+
+    except StalePageTokenError as e:
+        raise HTTPException(status_code=410, detail=f"{str(e)}. Restart the listing without page_token.")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error filtering masterdata in cache: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error filtering masterdata in cache: {str(e)}"
+        )
+
+
+@router.get("/masterdata_plants", response_model=MasterdataPlantsResponse, dependencies=_WARM_CACHE)
+def get_masterdata_plants() -> MasterdataPlantsResponse:
+    """
+    List all plants with the number of materials produced at each.
+
+    Use /filter_masterdata?plant=... to browse the materials of a plant.
+    """
+    try:
+        return MasterdataPlantsResponse(plants=cache_manager.get_plant_counts())
+
+    except Exception as e:
+        logger.error(f"Error getting plant counts from cache: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error getting plant counts from cache: {str(e)}"
+        )
+
+
+@router.get("/get_masterdata_by_tpm", response_model=MasterdataTpmResponse, dependencies=_WARM_CACHE)
+def get_masterdata_by_tpm(
+    tpm: str = Query(..., min_length=1, description="TPM name (e.g., TPM-0002)"),
+    page_size: int = Query(
+        MASTERDATA_PAGE_DEFAULT_SIZE, ge=1, le=MASTERDATA_PAGE_MAX_SIZE, description="Records per page"
+    ),
+    page_token: Optional[str] = Query(None, description="next_page_token of the previous page"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    include_tpm_config: bool = Query(False, description="Also return the TPM's rows of the local tpm table"),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+) -> MasterdataTpmResponse:
+    """
+    Get the materials linked to a TPM, ordered by MATNR8.
+
+    Served from the cache's TPM -> materials index, so the masterdata table is
+    never scanned. total is the number of linked materials; pages continue
+    with next_page_token. With include_tpm_config the TPM's configurations
+    from the local tpm table (as returned by /get_tpm_config) are included.
+
+    Without include_tpm_config responses carry the cache generation's ETag
+    and Last-Modified for conditional requests; the tpm table changes
+    independently of the cache, so responses including it do not.
+    """
+    try:
+        projection = resolve_masterdata_fields(fields.split(",") if fields else None)
+        headers = None
+        if not include_tpm_config:
+            etag, loaded_at = cache_manager.get_generation_validators()
+            headers = _validator_headers(etag, loaded_at)
+            if _not_modified(if_none_match, if_modified_since, etag, loaded_at):
+                return Response(status_code=304, headers=headers)
+
+        result = cache_manager.get_masterdata_json_by_tpm(tpm, page_size, page_token=page_token, fields=projection)
+
+        tpm_configs = None
+        if include_tpm_config:
+            tpm_configs = [config.model_dump(by_alias=True) for config in get_tpms_from_db(tpm)]
+
+        return Response(
+            content=masterdata_tpm_response_body(
+                tpm, result.records, result.total, result.next_page_token, tpm_configs
+            ),
+            media_type="application/json",
+            headers=headers,
+        )
+
+    except HTTPException:
+        raise
+    except StalePageTokenError as e:
+        raise HTTPException(status_code=410, detail=f"{str(e)}. Restart the listing without page_token.")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error getting masterdata by TPM from cache: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error getting masterdata by TPM from cache: {str(e)}"
+        )
+
+
+@router.get("/search_masterdata", response_model=MasterdataConfigResponse, dependencies=_WARM_CACHE)
+def search_masterdata(
+    q: str = Query(..., min_length=1, description="Search words (e.g., 'xarelto faltschachtel')"),
+    limit: int = Query(
+        MASTERDATA_SEARCH_DEFAULT_LIMIT, ge=1, le=MASTERDATA_SEARCH_MAX_LIMIT, description="Maximum number of results"
+    ),
+    prefix: bool = Query(True, description="Match query words as word prefixes"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+) -> MasterdataConfigResponse:
+    """
+    Full-text search over material description, TPM text, product hierarchy text and plant texts.
+
+    Returns the materials containing every query word, best match (BM25) first.
+    Matching ignores case and accents; with prefix=true (default) "xare"
+    also finds "Xarelto".
+
+    Args:
+        q: Search words
+        limit: Maximum number of results (1-500, default 20)
+        prefix: Match query words as word prefixes
+        fields: Optional comma-separated response fields (e.g., MATNR8,materialDescription)
+    """
+    try:
+        projection = resolve_masterdata_fields(fields.split(",") if fields else None)
+        etag, loaded_at = cache_manager.get_generation_validators()
+        headers = _validator_headers(etag, loaded_at)
+        if _not_modified(if_none_match, if_modified_since, etag, loaded_at):
+            return Response(status_code=304, headers=headers)
+
+        records = cache_manager.search_masterdata_json(q, limit=limit, prefix=prefix, fields=projection)
+        return Response(content=masterdata_response_body(records), media_type="application/json", headers=headers)
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error searching masterdata in cache: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error searching masterdata in cache: {str(e)}"
+        )
+
+
+@router.get("/typeahead_masterdata", response_model=MasterdataTypeaheadResponse, dependencies=_WARM_CACHE)
+def typeahead_masterdata(
+    prefix: str = Query(..., min_length=1, max_length=18, description="Beginning of a MATNR8 or MATNR (e.g., 9196)"),
+    limit: int = Query(
+        MASTERDATA_TYPEAHEAD_DEFAULT_LIMIT, ge=1, le=MASTERDATA_TYPEAHEAD_MAX_LIMIT,
+        description="Maximum number of completions"
+    ),
+) -> MasterdataTypeaheadResponse:
+    """
+    Autocomplete material numbers as the user types.
+
+    Matches the prefix against MATNR8, the 18-character MATNR and the MATNR
+    without leading zeros, and returns the first completions in material
+    number order together with their description.
+
+    Args:
+        prefix: Beginning of a MATNR8 or MATNR (e.g., 9196)
+        limit: Maximum number of completions (1-100, default 10)
+    """
+    try:
+        completions = cache_manager.get_typeahead_completions(prefix, limit)
+        return Response(content=typeahead_response_body(completions), media_type="application/json")
+
+    except Exception as e:
+        logger.error(f"Error completing material number prefix '{prefix}': {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error completing material number: {str(e)}"
+        )
+
+
+@router.get("/get_masterdata_from_sqlite/export", dependencies=_WARM_CACHE)
+def export_masterdata_from_sqlite(
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+):
+    """
+    Export the complete masterdata cache as newline-delimited JSON.
+
+    Streams one JSON object per line (same fields as /get_masterdata_from_sqlite),
+    ordered by MATNR8, in constant memory. The export reads a single cache
+    generation from start to end even if the cache is refreshed meanwhile.
+
+    - The ETag identifies the cache generation; send it back in If-None-Match
+      (or Last-Modified in If-Modified-Since) to get 304 Not Modified when
+      nothing was reloaded since the last pull.
+    - The stream is gzip-compressed when the client sends Accept-Encoding: gzip.
+    - fields limits every line to the given comma-separated response fields.
+    """
+    try:
+        projection = resolve_masterdata_fields(fields.split(",") if fields else None)
+        _, loaded_at = cache_manager.get_generation_validators()
+        etag, chunks = cache_manager.export_masterdata_ndjson(fields=projection)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error exporting masterdata from cache: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error exporting masterdata from cache: {str(e)}"
+        )
+
+    headers = {**_validator_headers(etag, loaded_at), "Vary": "Accept-Encoding"}
+    if _not_modified(if_none_match, if_modified_since, etag, loaded_at):
+        return Response(status_code=304, headers=headers)
+
+    if _accepts_gzip(accept_encoding):
+        headers["Content-Encoding"] = "gzip"
+        chunks = _gzip_stream(chunks)
+
+    return StreamingResponse(chunks, media_type="application/x-ndjson", headers=headers)
+
+
 @router.get("/cache_stats")
-async def get_cache_stats():
+def get_cache_stats():
     """Get statistics about the in-memory masterdata cache."""
     try:
         stats = cache_manager.get_cache_stats()
@@ -1,10 +1,40 @@
 """
 Utility endpoints for the ScriPTA API.
 """
-from fastapi import APIRouter
+import time
+
+from fastapi import APIRouter, Response
+
+from ..cache import cache_manager, cache_warmup
+from ..metrics import metrics
 
 router = APIRouter(tags=["Health"])
 
+# Prometheus text exposition format
+METRICS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _cache_age_seconds():
+    loaded_at = cache_manager.loaded_at
+    return time.time() - loaded_at if loaded_at is not None else None
+
+
+metrics.gauge(
+    "scripta_cache_generation",
+    "Number of the masterdata cache generation currently served.",
+    lambda: cache_manager.generation,
+)
+metrics.gauge(
+    "scripta_cache_age_seconds",
+    "Seconds since the current masterdata cache generation was published.",
+    _cache_age_seconds,
+)
+metrics.gauge(
+    "scripta_cache_ready",
+    "1 once masterdata is servable after startup, 0 while the cache is warming up or failed to load.",
+    lambda: int(cache_warmup.ready),
+)
+
 
 @router.get("/")
 async def root():
@@ -14,5 +44,24 @@ async def root():
 
 @router.get("/health")
 async def health_check():
-    """Health check endpoint."""
+    """Health check endpoint (liveness); does not depend on the masterdata cache."""
     return {"status": "healthy", "service": "ScriPTA API"}
+
+
+@router.get("/ready")
+async def readiness_check(response: Response):
+    """
+    Readiness endpoint: 200 once masterdata is servable, 503 while the cache is warming up.
+
+    Reports the state and progress of the startup load of the masterdata cache.
+    """
+    status = cache_warmup.status()
+    if not status["ready"]:
+        response.status_code = 503
+    return status
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Request, cache and refresh metrics in the Prometheus text format."""
+    return Response(metrics.render(), media_type=METRICS_MEDIA_TYPE)
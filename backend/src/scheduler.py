@@ -0,0 +1,309 @@
+"""
+Scheduled and single-flight masterdata refreshes.
+
+Every refresh, whether requested over HTTP or started by the schedule, runs
+through a RefreshScheduler:
+
+- A request for a refresh that is already running attaches to it and gets its
+  result instead of starting another run.
+- A request for a different kind of refresh waits for the running one to
+  finish, so two refreshes never write SQLite at the same time.
+- A lock file keeps uvicorn workers from refreshing concurrently; a worker that
+  finds it held reports RefreshInProgressError.
+
+The schedule is a five-field cron expression (minute hour day-of-month month
+day-of-week) evaluated in the server's local time.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, FrozenSet, Mapping, Optional
+
+from .metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+}
+_MONTH_NAMES = ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+_DAY_NAMES = ("sun", "mon", "tue", "wed", "thu", "fri", "sat")
+
+# How far ahead next_after looks before deciding an expression never matches
+_SEARCH_YEARS = 5
+# Longest sleep of the schedule loop, so clock changes delay a run by at most this
+_MAX_SLEEP_SECONDS = 60.0
+
+_RUNS = "scripta_refresh_runs_total"
+
+
+def _parse_field(text: str, name: str, low: int, high: int, names: Optional[tuple] = None) -> FrozenSet[int]:
+    def value(token: str) -> int:
+        token = token.strip().lower()
+        if names is not None and token in names:
+            return names.index(token) + (1 if low == 1 else 0)
+        if not token.isdigit():
+            raise ValueError(f"Invalid {name} '{token}' in cron expression")
+        return int(token)
+
+    values = set()
+    for part in text.split(","):
+        base, slash, step_text = part.partition("/")
+        step = 1
+        if slash:
+            if not step_text.isdigit() or int(step_text) == 0:
+                raise ValueError(f"Invalid {name} step '{step_text}' in cron expression")
+            step = int(step_text)
+        if base == "*":
+            start, end = low, high
+        elif "-" in base:
+            first, _, last = base.partition("-")
+            start, end = value(first), value(last)
+        else:
+            start = value(base)
+            # "5/15" means from 5 to the end of the range in steps of 15
+            end = high if slash else start
+        if not low <= start <= end <= high:
+            raise ValueError(f"The {name} '{part}' is outside {low}-{high} in cron expression")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronSchedule:
+    """
+    A five-field cron expression: minute hour day-of-month month day-of-week.
+
+    Fields take *, numbers, ranges (1-5), lists (1,15) and steps (*/15, 8-18/2);
+    months and weekdays also take names (jan, mon). Sunday is 0 or 7. As in
+    cron, when both day fields are restricted a day matching either one
+    matches. @hourly, @daily, @midnight, @weekly and @monthly are accepted.
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression.strip()
+        fields = _ALIASES.get(self.expression.lower(), self.expression).split()
+        if len(fields) != 5:
+            raise ValueError(
+                f"Cron expression '{expression}' needs 5 fields (minute hour day-of-month month day-of-week)"
+            )
+        minute, hour, day, month, weekday = fields
+        self.minutes = _parse_field(minute, "minute", 0, 59)
+        self.hours = _parse_field(hour, "hour", 0, 23)
+        self.days = _parse_field(day, "day of month", 1, 31)
+        self.months = _parse_field(month, "month", 1, 12, _MONTH_NAMES)
+        self.weekdays = frozenset(day % 7 for day in _parse_field(weekday, "day of week", 0, 7, _DAY_NAMES))
+        self._any_day = day.startswith("*")
+        self._any_weekday = weekday.startswith("*")
+
+    def _day_matches(self, moment: datetime) -> bool:
+        in_days = moment.day in self.days
+        # datetime counts Monday as 0, cron counts Sunday as 0
+        in_weekdays = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return in_days and in_weekdays
+        return in_days or in_weekdays
+
+    def next_after(self, moment: datetime) -> datetime:
+        """The first matching minute after moment."""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        last_year = candidate.year + _SEARCH_YEARS
+        while candidate.year <= last_year:
+            if candidate.month not in self.months:
+                year, month = divmod(candidate.month, 12)
+                candidate = candidate.replace(year=candidate.year + year, month=month + 1, day=1, hour=0, minute=0)
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression '{self.expression}' never matches")
+
+
+class RefreshInProgressError(RuntimeError):
+    """Another worker is running a refresh."""
+
+
+def _try_process_lock(path: str):
+    """Open and exclusively lock path without waiting; None when another process holds it."""
+    lock_file = open(path, "a")
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+    return lock_file
+
+
+def _release_process_lock(lock_file) -> None:
+    if fcntl is not None:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    lock_file.close()
+
+
+def _local_time(timestamp: Optional[float]) -> Optional[str]:
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp).astimezone().isoformat(timespec="seconds")
+
+
+class _Run:
+    def __init__(self, mode: str, trigger: str):
+        self.mode = mode
+        self.trigger = trigger
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.attached_requests = 0
+        self.task: Optional[asyncio.Future] = None
+
+
+class RefreshScheduler:
+    """
+    Runs the refreshes by mode, one at a time, on request and on a schedule.
+
+    refreshes maps every mode to the coroutine function running it and
+    returning its result; lock_path returns the lock file shared by the workers.
+    """
+
+    def __init__(self, refreshes: Mapping[str, Callable[[], Awaitable[Dict]]], lock_path: Callable[[], str]):
+        self._refreshes = dict(refreshes)
+        self._lock_path = lock_path
+        self._current: Optional[_Run] = None
+        self._last_run: Optional[Dict] = None
+        self._schedule: Optional[CronSchedule] = None
+        self._scheduled_mode: Optional[str] = None
+        self._next_run: Optional[datetime] = None
+        self._loop_task: Optional[asyncio.Task] = None
+
+    async def run(self, mode: str, trigger: str = "request") -> Dict:
+        """
+        Run the refresh of mode, or attach to its run in flight.
+
+        Attached requests get the in-flight run's result with "attached": True.
+        Raises RefreshInProgressError when another worker is refreshing.
+        """
+        if mode not in self._refreshes:
+            raise ValueError(f"Unknown refresh mode '{mode}'. Use one of: {', '.join(self._refreshes)}")
+        while self._current is not None:
+            current = self._current
+            if current.mode == mode:
+                current.attached_requests += 1
+                logger.info(f"Attaching {trigger} to the running {mode} masterdata refresh")
+                # Shielded, so a disconnecting client does not cancel the run
+                result = await asyncio.shield(current.task)
+                return {**result, "attached": True}
+            await asyncio.wait([current.task])
+
+        lock_file = _try_process_lock(self._lock_path())
+        if lock_file is None:
+            raise RefreshInProgressError("A masterdata refresh is already running in another worker")
+        run = _Run(mode, trigger)
+        self._current = run
+        run.task = asyncio.ensure_future(self._execute(run, lock_file))
+        # Failures reach the requests awaiting the run; keep asyncio from logging them again
+        run.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return await asyncio.shield(run.task)
+
+    async def _execute(self, run: _Run, lock_file) -> Dict:
+        outcome: Dict = {}
+        try:
+            result = await self._refreshes[run.mode]()
+            outcome = {"success": True, "message": result.get("message")}
+            return result
+        except BaseException as e:
+            outcome = {"success": False, "error": str(e)}
+            raise
+        finally:
+            self._current = None
+            _release_process_lock(lock_file)
+            self._last_run = {
+                "mode": run.mode,
+                "trigger": run.trigger,
+                "started_at": _local_time(run.started_at),
+                "finished_at": _local_time(time.time()),
+                "duration_seconds": round(time.perf_counter() - run.started, 3),
+                "attached_requests": run.attached_requests,
+                **outcome,
+            }
+            metrics.inc(_RUNS, (
+                ("mode", run.mode), ("trigger", run.trigger), ("result", "success" if outcome.get("success") else "failure"),
+            ))
+
+    def start(self, expression: Optional[str], mode: str = "incremental") -> bool:
+        """
+        Run the refresh of mode whenever the cron expression matches.
+
+        Returns False without a schedule; raises ValueError for an invalid one.
+        Must be called on the running event loop.
+        """
+        if not expression or not expression.strip():
+            return False
+        if mode not in self._refreshes:
+            raise ValueError(f"Unknown refresh mode '{mode}'. Use one of: {', '.join(self._refreshes)}")
+        schedule = CronSchedule(expression)
+        self._next_run = schedule.next_after(datetime.now())
+        self._schedule, self._scheduled_mode = schedule, mode
+        self._loop_task = asyncio.ensure_future(self._run_schedule())
+        logger.info(f"Scheduled {mode} masterdata refreshes at '{schedule.expression}', next at {self._next_run}")
+        return True
+
+    async def _run_schedule(self) -> None:
+        while True:
+            delay = (self._next_run - datetime.now()).total_seconds()
+            if delay > 0:
+                await asyncio.sleep(min(delay, _MAX_SLEEP_SECONDS))
+                continue
+            try:
+                await self.run(self._scheduled_mode, trigger="schedule")
+            except RefreshInProgressError as e:
+                logger.info(f"Skipping the scheduled masterdata refresh: {str(e)}")
+            except Exception as e:
+                logger.error(f"Scheduled masterdata refresh failed: {str(e)}")
+            self._next_run = self._schedule.next_after(datetime.now())
+
+    async def stop(self) -> None:
+        """Stop the schedule; a refresh in flight is left to finish."""
+        task, self._loop_task = self._loop_task, None
+        self._schedule = self._scheduled_mode = self._next_run = None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    @property
+    def running(self) -> bool:
+        """Whether a refresh is in flight in this worker."""
+        return self._current is not None
+
+    def status(self) -> Dict:
+        """The schedule, the run in flight and the last finished run."""
+        current = self._current
+        return {
+            "schedule": self._schedule.expression if self._schedule else None,
+            "scheduled_mode": self._scheduled_mode,
+            "next_run": self._next_run.astimezone().isoformat(timespec="seconds") if self._next_run else None,
+            "running": current is not None,
+            "current_run": {
+                "mode": current.mode,
+                "trigger": current.trigger,
+                "started_at": _local_time(current.started_at),
+                "elapsed_seconds": round(time.perf_counter() - current.started, 3),
+                "attached_requests": current.attached_requests,
+            } if current is not None else None,
+            "last_run": self._last_run,
+        }
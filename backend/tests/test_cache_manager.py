@@ -0,0 +1,1026 @@
+"""
+Tests for the in-memory masterdata cache engines.
+Both engines are exercised against the same data to make sure they are interchangeable.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from ..src.cache import base, facets
+from ..src.cache.cache_manager import MasterdataCacheManager, create_cache_manager
+from ..src.cache.columnar_cache import ColumnarMasterdataCacheManager, _IntColumn
+from ..src.cache.memory import deep_sizeof
+from ..src.cache.pagination import StalePageTokenError
+from ..src.cache.schema import INTEGER_COLUMNS, MASTERDATA_COLUMNS
+from ..src.cache.snapshot import SnapshotError
+from ..src.models.models import MASTERDATA_FIELD_COLUMNS
+
+ENGINES = ["sqlite", "columnar"]
+
+
+def make_record(matnr8: int, **overrides) -> dict:
+    """Build a masterdata record the way the Databricks CTE returns it."""
+    record = {column: "" for column in MASTERDATA_COLUMNS if column not in ("created_at", "updated_at")}
+    record.update({
+        "MATNR": f"0000000000{matnr8}",
+        "MATNR8": matnr8,
+        "MATERIAL_DESCRIPTION": f"Folding box {matnr8}",
+        "MATERIAL_TYPE": "YPM",
+        "XPLANT_STATUS": "Z1",
+        "PLANTS": "DE01,DE02",
+        "TPM": "TPM-0001",
+        "TPM_STATUS": None,
+    })
+    record.update(overrides)
+    return record
+
+
+def write_sqlite_file(path, records) -> None:
+    """Create a file-based masterdata_databricks table filled with the given records."""
+    column_definitions = ", ".join(
+        f"{column} TIMESTAMP DEFAULT CURRENT_TIMESTAMP" if column in ("created_at", "updated_at")
+        else f"{column} INTEGER" if column in INTEGER_COLUMNS
+        else f"{column} TEXT"
+        for column in MASTERDATA_COLUMNS
+    )
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute(f"CREATE TABLE masterdata_databricks ({column_definitions})")
+        columns = list(records[0].keys())
+        conn.executemany(
+            f"INSERT INTO masterdata_databricks ({','.join(columns)}) VALUES ({','.join('?' for _ in columns)})",
+            [tuple(record.get(column) for column in columns) for record in records],
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def sample_records():
+    """Provide a small, unordered masterdata set."""
+    return [
+        make_record(91967086, MATERIAL_DESCRIPTION="Xarelto 20mg folding box"),
+        make_record(81234567, MATERIAL_TYPE="YTXT", PLANTS="DE01"),
+        make_record(91960001, TPM="TPM-0002", MATERIAL_DESCRIPTION="Aspirin leaflet"),
+    ]
+
+
+@pytest.fixture(params=ENGINES)
+def cache(request):
+    """Provide an initialized cache manager for every engine."""
+    manager = create_cache_manager(request.param)
+    manager.initialize_cache()
+    yield manager
+    manager.close_cache()
+
+
+class TestCacheEngineSelection:
+    """Tests for choosing the cache engine at startup."""
+
+    def test_default_engine_is_sqlite(self, monkeypatch):
+        monkeypatch.delenv("MASTERDATA_CACHE_ENGINE", raising=False)
+        assert isinstance(create_cache_manager(), MasterdataCacheManager)
+
+    def test_engine_from_environment(self, monkeypatch):
+        monkeypatch.setenv("MASTERDATA_CACHE_ENGINE", "Columnar")
+        assert isinstance(create_cache_manager(), ColumnarMasterdataCacheManager)
+
+    def test_unknown_engine_raises(self):
+        with pytest.raises(ValueError):
+            create_cache_manager("redis")
+
+
+class TestCacheLookups:
+    """Tests for the public cache API shared by all engines."""
+
+    def test_requires_initialization(self):
+        manager = ColumnarMasterdataCacheManager()
+        with pytest.raises(RuntimeError):
+            manager.get_masterdata_by_matnr8(91967086)
+
+    def test_bulk_insert_and_lookup(self, cache, sample_records):
+        assert cache.bulk_insert_masterdata(sample_records) == 3
+
+        record = cache.get_masterdata_by_matnr8(91967086)
+        assert record["MATNR"] == "000000000091967086"
+        assert record["MATNR8"] == 91967086
+        assert record["MATERIAL_DESCRIPTION"] == "Xarelto 20mg folding box"
+        assert record["TPM_STATUS"] is None
+        assert record["DRA_1"] == ""
+        assert set(record.keys()) == set(MASTERDATA_COLUMNS)
+
+    def test_missing_matnr8_returns_none(self, cache, sample_records):
+        cache.bulk_insert_masterdata(sample_records)
+        assert cache.get_masterdata_by_matnr8(12345678) is None
+
+    def test_text_and_integer_affinity(self, cache):
+        cache.bulk_insert_masterdata([make_record("91967086", NUMBER_OF_PAGES=4)])
+
+        record = cache.get_masterdata_by_matnr8(91967086)
+        assert record["MATNR8"] == 91967086
+        assert record["NUMBER_OF_PAGES"] == "4"
+
+    def test_bulk_insert_replaces_previous_contents(self, cache, sample_records):
+        cache.bulk_insert_masterdata(sample_records)
+        cache.bulk_insert_masterdata([make_record(70000001)])
+
+        assert cache.get_masterdata_by_matnr8(91967086) is None
+        assert cache.get_masterdata_by_matnr8(70000001) is not None
+        assert cache.get_cache_stats()["record_count"] == 1
+
+    def test_get_all_masterdata_is_ordered_and_limited(self, cache, sample_records):
+        cache.bulk_insert_masterdata(sample_records)
+
+        records = cache.get_all_masterdata()
+        assert [record["MATNR8"] for record in records] == [81234567, 91960001, 91967086]
+        assert len(cache.get_all_masterdata(limit=2)) == 2
+
+    def test_load_from_sqlite_file(self, cache, sample_records, tmp_path):
+        db_path = str(tmp_path / "scripta-db.sqlite3")
+        write_sqlite_file(db_path, sample_records)
+
+        assert cache.load_masterdata_from_sqlite(db_path) == 3
+        record = cache.get_masterdata_by_matnr8(91960001)
+        assert record["TPM"] == "TPM-0002"
+        assert record["updated_at"] is not None
+
+    def test_load_from_sqlite_without_table(self, cache, tmp_path):
+        db_path = str(tmp_path / "empty.sqlite3")
+        sqlite3.connect(db_path).close()
+        assert cache.load_masterdata_from_sqlite(db_path) == 0
+
+    def test_cache_stats_and_clear(self, cache, sample_records):
+        cache.bulk_insert_masterdata(sample_records)
+
+        stats = cache.get_cache_stats()
+        assert stats["initialized"] is True
+        assert stats["record_count"] == 3
+        assert stats["last_updated"] is not None
+
+        cache.clear_cache()
+        assert cache.get_cache_stats()["record_count"] == 0
+        assert cache.get_all_masterdata() == []
+
+    def test_memory_stats(self, cache, sample_records):
+        cache.bulk_insert_masterdata(sample_records)
+        cache.get_masterdata_json_by_matnr8(91967086)
+
+        memory = cache.get_cache_stats()["memory"]
+        assert set(memory["columns_bytes"]) == set(MASTERDATA_COLUMNS)
+        assert memory["columns_bytes"]["MATERIAL_DESCRIPTION"] > 0
+        assert memory["records_bytes"] > 0
+        assert memory["bytes_per_record"] == round(memory["records_bytes"] / 3, 1)
+        assert {"typeahead", "facets", "tpm", "search"} <= set(memory["indexes_bytes"])
+        generation = cache._generation
+        assert memory["serialized_records_bytes"] == (
+            deep_sizeof(generation.serialized_records) + deep_sizeof(generation.record_etags)
+        )
+        assert memory["total_bytes"] == (
+            memory["records_bytes"] + sum(memory["indexes_bytes"].values()) + memory["serialized_records_bytes"]
+        )
+        assert memory["last_load"]["generation"] == cache.generation
+        assert memory["last_load"]["seconds"] >= 0
+
+    def test_serialized_record_is_reused_until_reload(self, cache, sample_records):
+        cache.bulk_insert_masterdata(sample_records)
+
+        serialized = cache.get_masterdata_json_by_matnr8(91967086)
+        assert json.loads(serialized)["materialDescription"] == "Xarelto 20mg folding box"
+        assert cache.get_masterdata_json_by_matnr8(91967086) is serialized
+        assert cache.get_masterdata_json_by_matnr8(12345678) is None
+
+        cache.bulk_insert_masterdata([make_record(91967086, MATERIAL_DESCRIPTION="Reloaded")])
+        assert json.loads(cache.get_masterdata_json_by_matnr8(91967086))["materialDescription"] == "Reloaded"
+
+    def test_batch_lookup_returns_found_and_missing(self, cache, sample_records):
+        cache.bulk_insert_masterdata(sample_records)
+        cached = cache.get_masterdata_json_by_matnr8(91960001)
+
+        found, missing = cache.get_masterdata_json_by_matnr8s([91967086, 12345678, 91960001, 91967086, 81234567])
+
+        assert [json.loads(record)["MATNR8"] for record in found] == [91967086, 91960001, 81234567]
+        assert found[1] is cached
+        assert missing == [12345678]
+        assert found[0] == cache.get_masterdata_json_by_matnr8(91967086)
+
+    def test_engines_return_identical_records(self, sample_records):
+        managers = [create_cache_manager(engine) for engine in ENGINES]
+        for manager in managers:
+            manager.initialize_cache()
+            manager.bulk_insert_masterdata(sample_records)
+
+        try:
+            sqlite_record, columnar_record = (manager.get_masterdata_by_matnr8(91967086) for manager in managers)
+            for column in ("created_at", "updated_at"):
+                sqlite_record.pop(column)
+                columnar_record.pop(column)
+            assert sqlite_record == columnar_record
+        finally:
+            for manager in managers:
+                manager.close_cache()
+
+
+class TestCacheProjection:
+    """Tests for sparse fieldsets pushed into the cache reads."""
+
+    FIELDS = (("MATNR8", "MATNR8"), ("tpm", "TPM"), ("colors", "COLORS"))
+
+    def test_projection_reads_only_requested_columns(self, cache, sample_records):
+        cache.bulk_insert_masterdata(sample_records)
+        generation = cache._current_generation()
+
+        record = cache._lookup(generation, 91960001, frozenset({"MATNR8", "TPM"}))
+        assert record == {"MATNR8": 91960001, "TPM": "TPM-0002"}
+
+    def test_projected_json_on_every_path(self, cache, sample_records):
+        cache.bulk_insert_masterdata(sample_records)
+        expected = {"MATNR8": 91960001, "tpm": "TPM-0002", "colors": ""}
+
+        assert json.loads(cache.get_masterdata_json_by_matnr8(91960001, fields=self.FIELDS)) == expected
+
+        found, missing = cache.get_masterdata_json_by_matnr8s([91960001, 12345678], fields=self.FIELDS)
+        assert [json.loads(record) for record in found] == [expected]
+        assert missing == [12345678]
+
+        page, _ = cache.get_masterdata_page_json(3, fields=self.FIELDS)
+        assert json.loads(page[1]) == expected
+
+        _, chunks = cache.export_masterdata_ndjson(fields=self.FIELDS)
+        assert json.loads(b"".join(chunks).splitlines()[1]) == expected
+
+    def test_projection_does_not_replace_full_serialization(self, cache, sample_records):
+        cache.bulk_insert_masterdata(sample_records)
+        cache.get_masterdata_json_by_matnr8(91960001, fields=self.FIELDS)
+
+        assert len(json.loads(cache.get_masterdata_json_by_matnr8(91960001))) == len(MASTERDATA_FIELD_COLUMNS)
+
+    def test_projected_export_has_its_own_etag(self, cache, sample_records):
+        cache.bulk_insert_masterdata(sample_records)
+
+        full_etag, _ = cache.export_masterdata_ndjson()
+        projected_etag, _ = cache.export_masterdata_ndjson(fields=self.FIELDS)
+        assert projected_etag != full_etag
+        assert cache.export_masterdata_ndjson(fields=self.FIELDS)[0] == projected_etag
+
+
+class TestCacheSearch:
+    """Tests for the full-text search index of every engine."""
+
+    @pytest.fixture
+    def searchable(self, cache):
+        cache.bulk_insert_masterdata([
+            make_record(91967086, MATERIAL_DESCRIPTION="Xarelto 20mg Faltschachtel", PLANTS_TXT="Leverkusen"),
+            make_record(91967087, MATERIAL_DESCRIPTION="Xarelto Xarelto Packungsbeilage", TPMTXT="Beilage"),
+            make_record(91960001, MATERIAL_DESCRIPTION="Aspirin Faltschachtel", PRDHATXT="Schmerzmittel Ärzte"),
+        ])
+        return cache
+
+    @staticmethod
+    def matnr8s(serialized_records):
+        return [json.loads(record)["MATNR8"] for record in serialized_records]
+
+    def test_all_words_must_match(self, searchable):
+        assert self.matnr8s(searchable.search_masterdata_json("faltschachtel xarelto")) == [91967086]
+        assert self.matnr8s(searchable.search_masterdata_json("leverkusen")) == [91967086]
+        assert searchable.search_masterdata_json("xarelto ibuprofen") == []
+        assert searchable.search_masterdata_json("  ,; ") == []
+
+    def test_ranked_by_relevance(self, searchable):
+        assert self.matnr8s(searchable.search_masterdata_json("xarelto")) == [91967087, 91967086]
+
+    def test_prefix_matching_and_limit(self, searchable):
+        assert self.matnr8s(searchable.search_masterdata_json("falt")) == [91967086, 91960001]
+        assert searchable.search_masterdata_json("falt", prefix=False) == []
+        assert len(searchable.search_masterdata_json("falt", limit=1)) == 1
+
+    def test_rare_word_narrows_a_common_one(self, cache):
+        cache.bulk_insert_masterdata(
+            [make_record(90000000 + n, MATERIAL_DESCRIPTION=f"Folding box {n}") for n in range(100)]
+            + [make_record(91967086, MATERIAL_DESCRIPTION="Xarelto folding box box")]
+        )
+
+        assert self.matnr8s(cache.search_masterdata_json("box xarelto")) == [91967086]
+        assert self.matnr8s(cache.search_masterdata_json("bo xar fold")) == [91967086]
+        assert self.matnr8s(cache.search_masterdata_json("box", limit=1)) == [91967086]
+
+    def test_case_and_accent_insensitive(self, searchable):
+        assert self.matnr8s(searchable.search_masterdata_json("ARZTE")) == [91960001]
+        assert self.matnr8s(searchable.search_masterdata_json("schmerz beilage")) == []
+
+    def test_index_follows_the_generation(self, searchable):
+        searchable.bulk_insert_masterdata([make_record(70000001, MATERIAL_DESCRIPTION="Ibuprofen")])
+
+        assert searchable.search_masterdata_json("xarelto") == []
+        assert self.matnr8s(searchable.search_masterdata_json("ibu")) == [70000001]
+
+
+class TestCacheTypeahead:
+    """Tests for material number completion."""
+
+    @staticmethod
+    def completed(serialized_completions):
+        return [json.loads(completion)["MATNR8"] for completion in serialized_completions]
+
+    def test_completes_matnr8_prefix_in_order(self, cache, sample_records):
+        cache.bulk_insert_masterdata(sample_records)
+
+        completions = cache.get_typeahead_completions("9196")
+        assert self.completed(completions) == [91960001, 91967086]
+        assert json.loads(completions[1]) == {
+            "MATNR8": 91967086, "MATNR": "000000000091967086", "materialDescription": "Xarelto 20mg folding box"
+        }
+        assert self.completed(cache.get_typeahead_completions("9196", limit=1)) == [91960001]
+
+    def test_completes_full_matnr_without_duplicates(self, cache, sample_records):
+        cache.bulk_insert_masterdata(sample_records + [make_record(12345678, MATNR="ab-1234")])
+
+        assert self.completed(cache.get_typeahead_completions("00000000009196")) == [91960001, 91967086]
+        assert self.completed(cache.get_typeahead_completions("91967086")) == [91967086]
+        assert self.completed(cache.get_typeahead_completions("AB-")) == [12345678]
+        assert cache.get_typeahead_completions("5") == []
+        assert cache.get_typeahead_completions(" ") == []
+
+    def test_index_follows_the_generation(self, cache, sample_records):
+        cache.bulk_insert_masterdata(sample_records)
+        cache.bulk_insert_masterdata([make_record(70000001)])
+
+        assert cache.get_typeahead_completions("9196") == []
+        assert self.completed(cache.get_typeahead_completions("7")) == [70000001]
+
+
+class TestCacheFacets:
+    """Tests for bitmap-backed faceted filtering."""
+
+    @pytest.fixture
+    def faceted(self, cache):
+        cache.bulk_insert_masterdata([
+            make_record(90000005, MATERIAL_TYPE="YPM", XPLANT_STATUS="Z1", ECLASS="A"),
+            make_record(90000004, MATERIAL_TYPE="YPM", XPLANT_STATUS="Z2", ECLASS="B"),
+            make_record(90000003, MATERIAL_TYPE="YTXT", XPLANT_STATUS="Z1", ECLASS="A"),
+            make_record(90000002, MATERIAL_TYPE="YTXT", XPLANT_STATUS="Z1", ECLASS="A", TPM_STATUS="30"),
+            make_record(90000001, MATERIAL_TYPE="YPM", XPLANT_STATUS="Z1", ECLASS="B"),
+        ])
+        return cache
+
+    @staticmethod
+    def matnr8s(result):
+        return [json.loads(record)["MATNR8"] for record in result.records]
+
+    def test_filters_are_and_across_and_or_within_facets(self, faceted):
+        result = faceted.filter_masterdata_json({"material_type": ["YPM"], "xplant_status": ["Z1"]}, 10)
+        assert self.matnr8s(result) == [90000001, 90000005]
+        assert result.total == 2
+
+        result = faceted.filter_masterdata_json({"material_type": ["YPM", "YTXT"], "eclass": ["B"]}, 10)
+        assert self.matnr8s(result) == [90000001, 90000004]
+
+    def test_empty_value_selects_missing_values(self, faceted):
+        result = faceted.filter_masterdata_json({"tpm_status": [""]}, 10)
+        assert result.total == 4
+
+    def test_facet_counts_exclude_their_own_filter(self, faceted):
+        result = faceted.filter_masterdata_json({"material_type": ["YPM"]}, 10)
+
+        assert result.facets["material_type"] == [{"value": "YPM", "count": 3}, {"value": "YTXT", "count": 2}]
+        assert result.facets["xplant_status"] == [{"value": "Z1", "count": 2}, {"value": "Z2", "count": 1}]
+        assert result.facets["tpm_status"] == [{"value": "", "count": 3}]
+
+    def test_pages_follow_matnr8_order(self, faceted):
+        first = faceted.filter_masterdata_json({"xplant_status": ["Z1"]}, 2)
+        second = faceted.filter_masterdata_json({"xplant_status": ["Z1"]}, 2, page_token=first.next_page_token)
+
+        assert self.matnr8s(first) + self.matnr8s(second) == [90000001, 90000002, 90000003, 90000005]
+        assert second.next_page_token is None
+
+        faceted.bulk_insert_masterdata([make_record(90000001)])
+        with pytest.raises(StalePageTokenError):
+            faceted.filter_masterdata_json({"xplant_status": ["Z1"]}, 2, page_token=first.next_page_token)
+
+    def test_counts_without_int_bit_count(self, faceted, monkeypatch):
+        # int.bit_count is Python 3.10+
+        monkeypatch.setattr(facets, "popcount", facets._count_bits)
+        monkeypatch.setattr(base, "popcount", facets._count_bits)
+        result = faceted.filter_masterdata_json({"material_type": ["YPM"]}, 10)
+
+        assert result.total == 3
+        assert result.facets["material_type"] == [{"value": "YPM", "count": 3}, {"value": "YTXT", "count": 2}]
+        assert facets._count_bits(2 ** 200 - 1) == 200
+
+    def test_unknown_facet_is_rejected(self, faceted):
+        with pytest.raises(ValueError):
+            faceted.filter_masterdata_json({"colors": ["red"]}, 10)
+
+
+class TestCachePlants:
+    """Tests for the plant posting lists built from the comma-separated PLANTS column."""
+
+    @pytest.fixture
+    def planted(self, cache):
+        cache.bulk_insert_masterdata([
+            make_record(90000001, PLANTS="DE01,DE02", MATERIAL_TYPE="YPM"),
+            make_record(90000002, PLANTS="DE02", MATERIAL_TYPE="YTXT"),
+            make_record(90000003, PLANTS="DE010,FR10", MATERIAL_TYPE="YPM"),
+            make_record(90000004, PLANTS="", MATERIAL_TYPE="YPM"),
+        ])
+        return cache
+
+    def test_plant_filter_matches_whole_plants_only(self, planted):
+        result = planted.filter_masterdata_json({"plant": ["DE01"]}, 10)
+        assert [json.loads(record)["MATNR8"] for record in result.records] == [90000001]
+
+        result = planted.filter_masterdata_json({"plant": ["DE01", "FR10"], "material_type": ["YPM"]}, 10)
+        assert result.total == 2
+
+    def test_plant_facet_counts_every_plant_of_a_material(self, planted):
+        result = planted.filter_masterdata_json({"material_type": ["YPM"]}, 10)
+
+        assert result.facets["plant"] == [
+            {"value": "", "count": 1},
+            {"value": "DE01", "count": 1},
+            {"value": "DE010", "count": 1},
+            {"value": "DE02", "count": 1},
+            {"value": "FR10", "count": 1},
+        ]
+
+    def test_plant_counts(self, planted):
+        assert planted.get_plant_counts() == [
+            {"plant": "DE01", "count": 1},
+            {"plant": "DE010", "count": 1},
+            {"plant": "DE02", "count": 2},
+            {"plant": "FR10", "count": 1},
+        ]
+
+
+class TestCacheTpmIndex:
+    """Tests for the TPM -> materials reverse index."""
+
+    @pytest.fixture
+    def linked(self, cache):
+        cache.bulk_insert_masterdata([
+            make_record(90000003, TPM="TPM-0001"),
+            make_record(90000001, TPM="TPM-0001"),
+            make_record(90000002, TPM="TPM-0002"),
+            make_record(90000004, TPM=None),
+            make_record(90000005, TPM="TPM-0001"),
+        ])
+        return cache
+
+    def test_returns_linked_materials_in_matnr8_order(self, linked):
+        result = linked.get_masterdata_json_by_tpm("TPM-0001", 10, fields=(("MATNR8", "MATNR8"),))
+
+        assert result.records == [b'{"MATNR8":90000001}', b'{"MATNR8":90000003}', b'{"MATNR8":90000005}']
+        assert result.total == 3
+        assert result.next_page_token is None
+
+    def test_pages_through_linked_materials(self, linked):
+        first = linked.get_masterdata_json_by_tpm("TPM-0001", 2)
+        second = linked.get_masterdata_json_by_tpm("TPM-0001", 2, page_token=first.next_page_token)
+
+        assert [json.loads(record)["MATNR8"] for record in first.records + second.records] == [
+            90000001, 90000003, 90000005
+        ]
+        assert second.next_page_token is None
+
+        linked.bulk_insert_masterdata([make_record(90000001, TPM="TPM-0001")])
+        with pytest.raises(StalePageTokenError):
+            linked.get_masterdata_json_by_tpm("TPM-0001", 2, page_token=first.next_page_token)
+
+    def test_unknown_tpm_has_no_materials(self, linked):
+        assert linked.get_masterdata_json_by_tpm("TPM-9999", 10) == ([], 0, None)
+
+
+class TestColumnarEncodings:
+    """Tests for the dictionary, sparse and plain column encodings of the columnar engine."""
+
+    @staticmethod
+    def records():
+        return [
+            make_record(
+                90000000 + number,
+                MATERIAL_DESCRIPTION=f"Folding box {number}",
+                ACF_FLAG="X" if number % 3 else "",
+                DRA_1=f"DRA_{number}-000" if number in (7, 300) else "",
+                DRA_2=None if number != 11 else "",
+                TPM_STATUS="RELEASED" if number == 5 else None,
+            )
+            for number in range(400)
+        ]
+
+    @pytest.fixture
+    def encoded(self):
+        manager = ColumnarMasterdataCacheManager()
+        manager.initialize_cache()
+        manager.bulk_insert_masterdata(self.records())
+        yield manager
+        manager.close_cache()
+
+    @staticmethod
+    def encoding(manager, column):
+        generation = manager._current_generation()
+        return type(generation.getters[generation.names.index(column)].__self__).__name__
+
+    def test_columns_get_the_smallest_encoding(self, encoded):
+        assert self.encoding(encoded, "ACF_FLAG") == "_DictionaryColumn"
+        assert self.encoding(encoded, "DRA_1") == "_SparseColumn"
+        assert self.encoding(encoded, "DRA_2") == "_SparseColumn"
+        assert self.encoding(encoded, "MATERIAL_DESCRIPTION") == "_TextColumn"
+
+    def test_encoding_is_chosen_by_estimated_size(self):
+        manager = ColumnarMasterdataCacheManager()
+        manager.initialize_cache()
+        manager.bulk_insert_masterdata([
+            make_record(
+                90000000 + number,
+                # 40% distinct short values cost more as str objects than as text
+                ECLASS=f"EC-{number % 400:05d}",
+                # Few long values repeated over many rows stay a dictionary
+                MATERIAL_DESCRIPTION=f"Folding box with a long description, variant {number % 50:02d}",
+            )
+            for number in range(1_000)
+        ])
+        try:
+            assert self.encoding(manager, "ECLASS") == "_TextColumn"
+            assert self.encoding(manager, "MATERIAL_DESCRIPTION") == "_DictionaryColumn"
+            record = manager.get_masterdata_by_matnr8(90000421)
+            assert record["ECLASS"] == "EC-00021"
+            assert record["MATERIAL_DESCRIPTION"] == "Folding box with a long description, variant 21"
+        finally:
+            manager.close_cache()
+
+    def test_values_are_decoded_unchanged(self, encoded):
+        for number in (0, 5, 7, 11, 300, 399):
+            record = encoded.get_masterdata_by_matnr8(90000000 + number)
+            assert record["MATERIAL_DESCRIPTION"] == f"Folding box {number}"
+            assert record["ACF_FLAG"] == ("X" if number % 3 else "")
+            assert record["DRA_1"] == (f"DRA_{number}-000" if number in (7, 300) else "")
+            assert record["DRA_2"] == (None if number != 11 else "")
+            assert record["TPM_STATUS"] == ("RELEASED" if number == 5 else None)
+
+
+    @pytest.mark.parametrize("mapped", [False, True])
+    def test_changes_are_copied_in_every_encoding(self, tmp_path, mapped):
+        records = self.records() + [make_record(None)]
+        snapshot_path = str(tmp_path / "masterdata.snapshot") if mapped else None
+        manager = ColumnarMasterdataCacheManager(snapshot_path=snapshot_path)
+        manager.initialize_cache()
+        manager.bulk_insert_masterdata(records)
+        changed = [
+            make_record(90000007, MATERIAL_DESCRIPTION="Changed box 7", ACF_FLAG="Y"),
+            make_record(90000400, DRA_1="DRA_400-000", DRA_2="", TPM_STATUS="RELEASED"),
+        ]
+        removed = {records[0]["MATNR"], records[200]["MATNR"], records[399]["MATNR"]}
+
+        manager.apply_masterdata_changes(changed, removed)
+
+        expected = ColumnarMasterdataCacheManager()
+        expected.initialize_cache()
+        replaced = removed | {"000000000090000007"}
+        expected.bulk_insert_masterdata([record for record in records if record["MATNR"] not in replaced] + changed)
+        # Both tables stamp the audit columns with their own load time
+        contents = [
+            [{name: value for name, value in record.items() if name not in ("created_at", "updated_at")}
+             for record in cache.get_all_masterdata()]
+            for cache in (manager, expected)
+        ]
+        assert contents[0] == contents[1]
+        for column in ("ACF_FLAG", "DRA_1", "DRA_2", "MATERIAL_DESCRIPTION"):
+            assert self.encoding(manager, column).replace("Mapped", "") == self.encoding(expected, column)
+        manager.close_cache()
+        expected.close_cache()
+
+    @pytest.mark.parametrize("batch", [[1, 2, "n/a"], [1, 2, 2 ** 64]])
+    def test_integer_batch_with_invalid_value(self, batch):
+        column = _IntColumn()
+        column.extend(batch)
+        column.extend([3, 4])
+
+        # Values that are no 64-bit integers become NULL, nothing is appended twice
+        assert len(column) == 5
+        assert [column.get(row) for row in range(5)] == [1, 2, None, 3, 4]
+
+
+class TestCacheSnapshot:
+    """Tests for sharing the columnar cache between workers through a mapped snapshot."""
+
+    @pytest.fixture
+    def records(self):
+        return [
+            make_record(
+                90000000 + number,
+                MATERIAL_DESCRIPTION=f"Folding box {number} ü",
+                ACF_FLAG="X" if number % 3 else "",
+                DRA_1=f"DRA_{number}-000" if number in (7, 300) else "",
+                TPM_STATUS="RELEASED" if number == 5 else None,
+                TPM="TPM-0001" if number % 2 else "TPM-0002",
+                ACS_VERSION=None if number % 5 else str(number),
+            )
+            for number in range(400)
+        ] + [make_record(None)]
+
+    @pytest.fixture
+    def managers(self):
+        created = []
+
+        def create(snapshot_path=None, snapshot_compression=None):
+            manager = ColumnarMasterdataCacheManager(snapshot_path=snapshot_path, snapshot_compression=snapshot_compression)
+            manager.initialize_cache()
+            created.append(manager)
+            return manager
+
+        yield create
+        for manager in created:
+            manager.close_cache()
+
+    def test_load_publishes_the_mapped_snapshot(self, managers, records, tmp_path):
+        snapshot_path = str(tmp_path / "masterdata.snapshot")
+        writer = managers(snapshot_path)
+        writer.bulk_insert_masterdata(records)
+
+        assert os.path.exists(snapshot_path)
+        assert writer._current_generation().snapshot is not None
+        assert writer.get_cache_stats()["snapshot"]["bytes"] == os.path.getsize(snapshot_path)
+
+        private = managers()
+        private.bulk_insert_masterdata(records)
+        assert writer.get_all_masterdata() == private.get_all_masterdata()
+
+    @pytest.mark.skipif(fcntl is None, reason="needs fcntl")
+    def test_publish_waits_for_other_workers(self, managers, records, tmp_path):
+        snapshot_path = str(tmp_path / "masterdata.snapshot")
+        writer = managers(snapshot_path)
+        refresh = threading.Thread(target=writer.bulk_insert_masterdata, args=(records,))
+
+        with open(f"{snapshot_path}.lock", "a") as other_worker:
+            fcntl.flock(other_worker.fileno(), fcntl.LOCK_EX)
+            refresh.start()
+            refresh.join(0.2)
+            assert refresh.is_alive()
+            assert not os.path.exists(snapshot_path)
+            fcntl.flock(other_worker.fileno(), fcntl.LOCK_UN)
+
+        refresh.join(5)
+        assert writer._current_generation().snapshot is not None
+
+    def test_other_worker_maps_the_snapshot(self, managers, records, tmp_path):
+        snapshot_path = str(tmp_path / "masterdata.snapshot")
+        managers(snapshot_path).bulk_insert_masterdata(records)
+
+        reader = managers(snapshot_path)
+        assert reader.load_masterdata_from_snapshot(snapshot_path) == len(records)
+
+        assert reader.get_masterdata_by_matnr8(90000007)["DRA_1"] == "DRA_7-000"
+        assert reader.get_masterdata_by_matnr8(90000005)["TPM_STATUS"] == "RELEASED"
+        assert reader.get_masterdata_by_matnr8(90000010)["ACS_VERSION"] == "10"
+        assert reader.get_masterdata_by_matnr8(90000011)["ACS_VERSION"] is None
+        assert reader.get_masterdata_by_matnr8(12345678) is None
+        found, missing = reader.get_masterdata_json_by_matnr8s([90000001, 12345678])
+        assert len(found) == 1 and missing == [12345678]
+        assert reader.search_masterdata_json("folding 12", limit=1)
+        assert reader.get_masterdata_json_by_tpm("TPM-0002", 500).total == 200
+
+        page, token = reader.get_masterdata_page_json(2)
+        assert [json.loads(record)["MATNR8"] for record in page] == [90000000, 90000001]
+        page, _ = reader.get_masterdata_page_json(1, page_token=token)
+        assert json.loads(page[0])["MATNR8"] == 90000002
+
+    @pytest.mark.parametrize("compression", [None, "zlib"])
+    def test_indexes_are_read_from_the_snapshot(self, managers, records, tmp_path, compression):
+        snapshot_path = str(tmp_path / "masterdata.snapshot")
+        managers(snapshot_path, compression).bulk_insert_masterdata(records)
+        private = managers()
+        private.bulk_insert_masterdata(records)
+
+        reader = managers(snapshot_path)
+        reader.load_masterdata_from_snapshot(snapshot_path)
+
+        assert reader.search_masterdata_json("folding 1", limit=5) == private.search_masterdata_json("folding 1", limit=5)
+        assert reader.search_masterdata_json("box", limit=3) == private.search_masterdata_json("box", limit=3)
+        assert reader.get_typeahead_completions("9000001", 20) == private.get_typeahead_completions("9000001", 20)
+        assert reader.get_plant_counts() == private.get_plant_counts()
+        filters = {"acf_flag": ["X"], "tpm_status": ["", "RELEASED"]}
+        assert reader.filter_masterdata_json(filters, 10)[:3] == private.filter_masterdata_json(filters, 10)[:3]
+        assert reader.get_masterdata_json_by_tpm("TPM-0001", 5)[:2] == private.get_masterdata_json_by_tpm("TPM-0001", 5)[:2]
+
+    def test_compressed_snapshot_is_smaller(self, managers, records, tmp_path):
+        plain_path, compressed_path = str(tmp_path / "plain.snapshot"), str(tmp_path / "compressed.snapshot")
+        managers(plain_path).bulk_insert_masterdata(records)
+        managers(compressed_path, "zlib").bulk_insert_masterdata(records)
+
+        assert os.path.getsize(compressed_path) < os.path.getsize(plain_path) / 2
+        with pytest.raises(ValueError):
+            managers(plain_path, "lz4")
+
+    def test_corrupt_buffer_is_rejected(self, managers, records, tmp_path):
+        snapshot_path = tmp_path / "masterdata.snapshot"
+        managers(str(snapshot_path)).bulk_insert_masterdata(records)
+        data = bytearray(snapshot_path.read_bytes())
+        data[100] ^= 0xFF
+        snapshot_path.write_bytes(bytes(data))
+
+        with pytest.raises(SnapshotError):
+            managers().load_masterdata_from_snapshot(str(snapshot_path))
+
+    def test_snapshot_saved_at_shutdown(self, managers, records, tmp_path):
+        snapshot_path = str(tmp_path / "masterdata.snapshot")
+        manager = managers(snapshot_path)
+        manager.bulk_insert_masterdata(records)
+        # Already holds the generation
+        assert manager.save_snapshot() is False
+
+        os.remove(snapshot_path)
+        assert manager.save_snapshot() is True
+        assert managers(snapshot_path).load_masterdata_from_snapshot(snapshot_path) == len(records)
+
+    def test_invalid_snapshot_is_rejected(self, managers, tmp_path):
+        snapshot_path = tmp_path / "masterdata.snapshot"
+        snapshot_path.write_bytes(b"not a snapshot" * 10)
+
+        with pytest.raises(SnapshotError):
+            managers().load_masterdata_from_snapshot(str(snapshot_path))
+
+    def test_startup_maps_a_fresh_snapshot(self, managers, records, tmp_path):
+        db_path = str(tmp_path / "scripta-db.sqlite3")
+        snapshot_path = str(tmp_path / "masterdata.snapshot")
+        write_sqlite_file(db_path, records[:10])
+        managers(snapshot_path).bulk_insert_masterdata(records)
+
+        # The snapshot is newer than the database, so it is used
+        assert managers(snapshot_path).load_masterdata_on_startup(db_path) == len(records)
+
+    def test_startup_rebuilds_a_stale_snapshot(self, managers, records, tmp_path):
+        db_path = str(tmp_path / "scripta-db.sqlite3")
+        snapshot_path = str(tmp_path / "masterdata.snapshot")
+        managers(snapshot_path).bulk_insert_masterdata(records)
+        write_sqlite_file(db_path, records[:10])
+        stale = os.stat(snapshot_path).st_mtime - 60
+        os.utime(snapshot_path, (stale, stale))
+
+        assert managers(snapshot_path).load_masterdata_on_startup(db_path) == 10
+        assert managers(snapshot_path).load_masterdata_from_snapshot(snapshot_path) == 10
+
+    def test_startup_ignores_a_corrupt_snapshot(self, managers, records, tmp_path):
+        db_path = str(tmp_path / "scripta-db.sqlite3")
+        snapshot_path = tmp_path / "masterdata.snapshot"
+        write_sqlite_file(db_path, records[:10])
+        snapshot_path.write_bytes(b"corrupt")
+
+        assert managers(str(snapshot_path)).load_masterdata_on_startup(db_path) == 10
+
+    def test_workers_follow_each_others_refreshes(self, managers, records, tmp_path):
+        db_path = str(tmp_path / "scripta-db.sqlite3")
+        snapshot_path = str(tmp_path / "masterdata.snapshot")
+        write_sqlite_file(db_path, records[:10])
+        first, second = managers(snapshot_path), managers(snapshot_path)
+        first.snapshot_poll_interval = second.snapshot_poll_interval = 0.01
+        first.load_masterdata_on_startup(db_path)
+        second.load_masterdata_on_startup(db_path)
+
+        first.bulk_insert_masterdata(records)
+
+        deadline = time.monotonic() + 5
+        while second.get_cache_stats()["record_count"] != len(records) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert second.get_cache_stats()["record_count"] == len(records)
+        # A worker does not reload the snapshot it wrote itself
+        generation = first.generation
+        time.sleep(0.05)
+        assert first.generation == generation
+
+
+class TestCacheGenerations:
+    """Tests for the double-buffered generation swap on refresh."""
+
+    def test_generation_increases_on_every_load(self, cache, sample_records):
+        initial = cache.generation
+        cache.bulk_insert_masterdata(sample_records)
+        cache.bulk_insert_masterdata(sample_records)
+
+        assert cache.generation == initial + 2
+        assert cache.get_cache_stats()["generation"] == cache.generation
+
+    def test_pinned_generation_survives_refresh(self, cache, sample_records):
+        cache.bulk_insert_masterdata(sample_records)
+        pinned = cache._current_generation()
+
+        cache.bulk_insert_masterdata([make_record(70000001)])
+
+        assert cache._lookup(pinned, 91967086)["MATNR8"] == 91967086
+        assert cache.get_masterdata_by_matnr8(91967086) is None
+
+    def test_record_etag_is_content_based(self, cache, sample_records):
+        cache.bulk_insert_masterdata(sample_records)
+        assert cache.get_masterdata_etag_by_matnr8(91967086) is None
+
+        cache.get_masterdata_json_by_matnr8(91967086)
+        etag = cache.get_masterdata_etag_by_matnr8(91967086)
+        assert etag.startswith('"r')
+
+        # Unchanged records keep their ETag in a new generation, changed ones do not
+        cache.bulk_insert_masterdata(sample_records)
+        cache.get_masterdata_json_by_matnr8(91967086)
+        assert cache.get_masterdata_etag_by_matnr8(91967086) == etag
+
+        cache.bulk_insert_masterdata([make_record(91967086, MATERIAL_DESCRIPTION="Changed")])
+        cache.get_masterdata_json_by_matnr8(91967086)
+        assert cache.get_masterdata_etag_by_matnr8(91967086) != etag
+
+    def test_generation_validators(self, cache, sample_records):
+        etag, loaded_at = cache.get_generation_validators()
+        cache.bulk_insert_masterdata(sample_records)
+
+        new_etag, new_loaded_at = cache.get_generation_validators()
+        assert new_etag != etag
+        assert new_loaded_at >= loaded_at
+
+    def test_readers_never_see_partial_refresh(self, cache):
+        records = [make_record(90000000 + number) for number in range(2000)]
+        cache.bulk_insert_masterdata(records)
+        misses = []
+        stop = threading.Event()
+
+        def reader():
+            while not stop.is_set():
+                if cache.get_masterdata_by_matnr8(90001999) is None:
+                    misses.append(1)
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        try:
+            for _ in range(5):
+                cache.bulk_insert_masterdata(records)
+        finally:
+            stop.set()
+            thread.join()
+
+        assert misses == []
+
+
+class TestCacheIncrementalChanges:
+    """Tests for applying an incremental refresh to the cache."""
+
+    def test_upserts_and_deletes_by_matnr(self, cache, sample_records):
+        cache.bulk_insert_masterdata(sample_records)
+        generation = cache.generation
+
+        rows = cache.apply_masterdata_changes(
+            [make_record(91967086, MATERIAL_DESCRIPTION="Changed box"), make_record(70000001, TPM="TPM-0002")],
+            ["000000000081234567"],
+        )
+
+        assert rows == 3
+        assert cache.generation == generation + 1
+        assert cache.get_masterdata_by_matnr8(91967086)["MATERIAL_DESCRIPTION"] == "Changed box"
+        assert cache.get_masterdata_by_matnr8(70000001)["TPM"] == "TPM-0002"
+        assert cache.get_masterdata_by_matnr8(81234567) is None
+        # Unchanged records and the indexes of the new generation
+        assert cache.get_masterdata_by_matnr8(91960001)["MATERIAL_DESCRIPTION"] == "Aspirin leaflet"
+        linked = cache.get_masterdata_json_by_tpm("TPM-0002", 10, fields=(("MATNR8", "MATNR8"),))
+        assert linked.records == [b'{"MATNR8":70000001}', b'{"MATNR8":91960001}']
+        assert json.loads(cache.search_masterdata_json("changed")[0])["MATNR8"] == 91967086
+
+    def test_keeps_unchanged_audit_columns(self, cache, sample_records):
+        cache.bulk_insert_masterdata([
+            {**record, "created_at": "2026-01-01 00:00:00", "updated_at": "2026-01-01 00:00:00"}
+            for record in sample_records
+        ])
+
+        cache.apply_masterdata_changes(
+            [make_record(91967086, created_at="2026-01-01 00:00:00", updated_at="2026-02-01 00:00:00")], []
+        )
+
+        assert cache.get_masterdata_by_matnr8(91967086)["updated_at"] == "2026-02-01 00:00:00"
+        assert cache.get_masterdata_by_matnr8(91960001)["updated_at"] == "2026-01-01 00:00:00"
+
+    def test_pinned_generation_survives_changes(self, cache, sample_records):
+        cache.bulk_insert_masterdata(sample_records)
+        pinned = cache._current_generation()
+
+        cache.apply_masterdata_changes([], ["000000000091967086"])
+
+        assert cache._lookup(pinned, 91967086)["MATNR8"] == 91967086
+        assert cache.get_masterdata_by_matnr8(91967086) is None
+
+
+class TestCachePagination:
+    """Tests for keyset pagination over the cache."""
+
+    def test_pages_cover_all_records_in_order(self, cache):
+        numbers = [90000000 + number for number in range(0, 250, 3)]
+        cache.bulk_insert_masterdata([make_record(matnr8) for matnr8 in reversed(numbers)])
+
+        seen = []
+        page, token = cache.get_masterdata_page_json(10)
+        while True:
+            seen.extend(json.loads(record)["MATNR8"] for record in page)
+            if token is None:
+                break
+            page, token = cache.get_masterdata_page_json(10, page_token=token)
+
+        assert seen == numbers
+
+    def test_page_after_matnr8(self, cache, sample_records):
+        cache.bulk_insert_masterdata(sample_records)
+
+        page, token = cache.get_masterdata_page_json(1, after_matnr8=81234567)
+        assert [json.loads(record)["MATNR8"] for record in page] == [91960001]
+        page, token = cache.get_masterdata_page_json(1, page_token=token)
+        assert [json.loads(record)["MATNR8"] for record in page] == [91967086]
+        assert token is None
+
+    def test_duplicate_matnr8_is_not_lost_across_pages(self, cache):
+        cache.bulk_insert_masterdata([
+            make_record(91967086, MATNR="A"),
+            make_record(91967086, MATNR="B"),
+            make_record(91967087),
+        ])
+
+        page, token = cache.get_masterdata_page_json(1)
+        second, token = cache.get_masterdata_page_json(2, page_token=token)
+        assert [json.loads(record)["MATNR"] for record in page + second] == ["A", "B", "000000000091967087"]
+
+    def test_token_is_rejected_after_refresh(self, cache, sample_records):
+        cache.bulk_insert_masterdata(sample_records)
+        _, token = cache.get_masterdata_page_json(1)
+
+        cache.bulk_insert_masterdata(sample_records)
+        with pytest.raises(StalePageTokenError):
+            cache.get_masterdata_page_json(1, page_token=token)
+        with pytest.raises(ValueError):
+            cache.get_masterdata_page_json(1, page_token="not-a-token")
+
+
+class TestCacheExport:
+    """Tests for the streamed NDJSON export."""
+
+    def test_export_yields_all_records_in_batches(self, cache):
+        cache.bulk_insert_masterdata([make_record(90000000 + number) for number in range(25)])
+
+        etag, chunks = cache.export_masterdata_ndjson(batch_size=10)
+        chunks = list(chunks)
+
+        assert etag == cache._current_generation().etag
+        assert [chunk.count(b"\n") for chunk in chunks] == [10, 10, 5]
+        lines = b"".join(chunks).splitlines()
+        assert [json.loads(line)["MATNR8"] for line in lines] == [90000000 + number for number in range(25)]
+
+    def test_export_keeps_its_generation_during_refresh(self, cache, sample_records):
+        cache.bulk_insert_masterdata(sample_records)
+        _, chunks = cache.export_masterdata_ndjson(batch_size=1)
+
+        first = next(chunks)
+        cache.bulk_insert_masterdata([make_record(70000001)])
+
+        lines = [first] + list(chunks)
+        assert [json.loads(line)["MATNR8"] for line in lines] == [81234567, 91960001, 91967086]
+
+
+class TestConcurrentReads:
+    """Tests for the thread-safe read path."""
+
+    def test_parallel_readers_get_correct_records(self, cache):
+        records = [make_record(90000000 + number) for number in range(500)]
+        cache.bulk_insert_masterdata(records)
+        errors = []
+
+        def reader(offset: int):
+            for number in range(offset, 500, 7):
+                record = cache.get_masterdata_by_matnr8(90000000 + number)
+                if record is None or record["MATNR8"] != 90000000 + number:
+                    errors.append(number)
+
+        threads = [threading.Thread(target=reader, args=(offset,)) for offset in range(7)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+
+    def test_sqlite_readers_use_private_read_only_connections(self, sample_records):
+        manager = MasterdataCacheManager()
+        manager.initialize_cache()
+        manager.bulk_insert_masterdata(sample_records)
+        generation = manager._current_generation()
+        connections = []
+
+        thread = threading.Thread(target=lambda: connections.append(generation.read_connection()))
+        thread.start()
+        thread.join()
+
+        main_connection = generation.read_connection()
+        assert main_connection is generation.read_connection()
+        assert connections[0] is not main_connection
+        assert main_connection is not generation.connection
+        with pytest.raises(sqlite3.OperationalError):
+            main_connection.execute("DELETE FROM masterdata_databricks")
+        manager.close_cache()
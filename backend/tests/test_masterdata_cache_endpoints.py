@@ -0,0 +1,553 @@
+"""
+Tests for the masterdata endpoints served from the in-memory cache.
+"""
+import importlib
+import json
+import threading
+
+import pytest
+
+from ..src.models.models import MASTERDATA_BATCH_MAX_SIZE, MasterdataConfigResponse
+from ..src.routers.masterdata_sqlite import _convert_dict_to_masterdata_config
+from .test_cache_manager import ENGINES, make_record
+
+
+@pytest.fixture(params=ENGINES)
+def masterdata_cache(request, monkeypatch):
+    """Serve the masterdata endpoints from a freshly filled cache of every engine."""
+    # The app imports its modules as top-level "src"; build the manager from
+    # the same modules so exceptions it raises match the router's except clauses
+    manager = importlib.import_module("src.cache.cache_manager").create_cache_manager(request.param)
+    manager.initialize_cache()
+    manager.bulk_insert_masterdata([
+        make_record(91967086, MATERIAL_DESCRIPTION="Xarelto 20mg Faltschachtel ü", ACS_VERSION="2"),
+        make_record(81234567, MATERIAL_TYPE="YTXT", PLANTS="DE01"),
+        make_record(91960001, TPM="TPM-0002"),
+    ])
+    monkeypatch.setattr("src.routers.masterdata_sqlite.cache_manager", manager)
+    yield manager
+    manager.close_cache()
+
+
+def record_calling_threads(monkeypatch, manager, method):
+    """Record the names of the threads calling one of the manager's methods."""
+    threads = []
+    read = getattr(manager, method)
+
+    def recording(*args, **kwargs):
+        threads.append(threading.current_thread().name)
+        return read(*args, **kwargs)
+
+    monkeypatch.setattr(manager, method, recording)
+    return threads
+
+
+class TestMasterdataLookupEndpoint:
+    """Tests for /get_masterdata_from_sqlite?matnr8="""
+
+    def test_lookup_reads_the_cache_in_the_threadpool(self, client, masterdata_cache, monkeypatch):
+        threads = record_calling_threads(monkeypatch, masterdata_cache, "get_masterdata_json_by_matnr8")
+
+        assert client.get("/get_masterdata_from_sqlite?matnr8=91967086").status_code == 200
+        # Not on the event loop, which serves all other requests
+        assert threads and all(name.startswith("AnyIO worker thread") for name in threads)
+
+    def test_lookup_returns_serialized_record(self, client, masterdata_cache):
+        response = client.get("/get_masterdata_from_sqlite?matnr8=91967086")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+
+        data = response.json()
+        assert len(data["masterdata"]) == 1
+        record = data["masterdata"][0]
+        assert record["MATNR8"] == 91967086
+        assert record["materialDescription"] == "Xarelto 20mg Faltschachtel ü"
+
+    def test_lookup_matches_model_serialization(self, client, masterdata_cache):
+        """Pre-serialized bytes must be identical to the validated Pydantic response."""
+        response = client.get("/get_masterdata_from_sqlite?matnr8=91967086")
+
+        record = masterdata_cache.get_masterdata_by_matnr8(91967086)
+        model_response = MasterdataConfigResponse(masterdata=[_convert_dict_to_masterdata_config(record)])
+        expected = json.dumps(
+            model_response.model_dump(by_alias=True), ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+        assert response.content == expected
+
+    def test_lookup_not_found(self, client, masterdata_cache):
+        response = client.get("/get_masterdata_from_sqlite?matnr8=12345678")
+        assert response.status_code == 404
+
+    def test_serialized_record_is_invalidated_on_reload(self, client, masterdata_cache):
+        client.get("/get_masterdata_from_sqlite?matnr8=91967086")
+        masterdata_cache.bulk_insert_masterdata([make_record(91967086, MATERIAL_DESCRIPTION="Reloaded")])
+
+        response = client.get("/get_masterdata_from_sqlite?matnr8=91967086")
+        assert response.json()["masterdata"][0]["materialDescription"] == "Reloaded"
+
+    def test_list_without_matnr8(self, client, masterdata_cache):
+        response = client.get("/get_masterdata_from_sqlite")
+        assert response.status_code == 200
+        assert [record["MATNR8"] for record in response.json()["masterdata"]] == [81234567, 91960001, 91967086]
+        assert response.json()["next_page_token"] is None
+
+    def test_list_pages_with_token(self, client, masterdata_cache):
+        first = client.get("/get_masterdata_from_sqlite?page_size=2").json()
+        assert [record["MATNR8"] for record in first["masterdata"]] == [81234567, 91960001]
+
+        response = client.get("/get_masterdata_from_sqlite", params={"page_token": first["next_page_token"]})
+        assert response.status_code == 200
+        assert [record["MATNR8"] for record in response.json()["masterdata"]] == [91967086]
+        assert response.json()["next_page_token"] is None
+
+    def test_list_after_matnr8(self, client, masterdata_cache):
+        response = client.get("/get_masterdata_from_sqlite?after_matnr8=91960001")
+        assert [record["MATNR8"] for record in response.json()["masterdata"]] == [91967086]
+
+    def test_list_rejects_stale_and_invalid_tokens(self, client, masterdata_cache):
+        token = client.get("/get_masterdata_from_sqlite?page_size=1").json()["next_page_token"]
+        masterdata_cache.bulk_insert_masterdata([make_record(91967086)])
+
+        assert client.get("/get_masterdata_from_sqlite", params={"page_token": token}).status_code == 410
+        assert client.get("/get_masterdata_from_sqlite", params={"page_token": "garbage"}).status_code == 400
+        assert client.get("/get_masterdata_from_sqlite?page_size=0").status_code == 422
+
+
+class TestMasterdataBatchEndpoint:
+    """Tests for POST /get_masterdata_from_sqlite/batch"""
+
+    def test_batch_returns_records_and_missing(self, client, masterdata_cache):
+        response = client.post(
+            "/get_masterdata_from_sqlite/batch", json={"matnr8s": [91960001, 12345678, 91967086]}
+        )
+        assert response.status_code == 200
+
+        data = response.json()
+        assert [record["MATNR8"] for record in data["masterdata"]] == [91960001, 91967086]
+        assert data["masterdata"][1]["materialDescription"] == "Xarelto 20mg Faltschachtel ü"
+        assert data["missing"] == [12345678]
+
+    def test_batch_records_match_single_lookup(self, client, masterdata_cache):
+        single = client.get("/get_masterdata_from_sqlite?matnr8=81234567").json()
+        batch = client.post("/get_masterdata_from_sqlite/batch", json={"matnr8s": [81234567]}).json()
+        assert batch == {"masterdata": single["masterdata"], "missing": []}
+
+    def test_batch_rejects_empty_and_oversized_requests(self, client, masterdata_cache):
+        assert client.post("/get_masterdata_from_sqlite/batch", json={"matnr8s": []}).status_code == 422
+        oversized = list(range(MASTERDATA_BATCH_MAX_SIZE + 1))
+        assert client.post("/get_masterdata_from_sqlite/batch", json={"matnr8s": oversized}).status_code == 422
+
+
+class TestMasterdataExportEndpoint:
+    """Tests for GET /get_masterdata_from_sqlite/export"""
+
+    def test_export_streams_one_record_per_line(self, client, masterdata_cache):
+        response = client.get("/get_masterdata_from_sqlite/export", headers={"Accept-Encoding": "identity"})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert "content-encoding" not in response.headers
+
+        lines = response.content.splitlines()
+        assert [json.loads(line)["MATNR8"] for line in lines] == [81234567, 91960001, 91967086]
+        assert lines[2] == masterdata_cache.get_masterdata_json_by_matnr8(91967086)
+
+    def test_export_is_gzip_compressed_on_request(self, client, masterdata_cache):
+        response = client.get("/get_masterdata_from_sqlite/export", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert len(response.text.splitlines()) == 3
+
+        refused = client.get("/get_masterdata_from_sqlite/export", headers={"Accept-Encoding": "gzip;q=0"})
+        assert "content-encoding" not in refused.headers
+
+    def test_export_not_modified_until_reload(self, client, masterdata_cache):
+        etag = client.get("/get_masterdata_from_sqlite/export").headers["etag"]
+
+        response = client.get("/get_masterdata_from_sqlite/export", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+
+        masterdata_cache.bulk_insert_masterdata([make_record(91967086)])
+        response = client.get("/get_masterdata_from_sqlite/export", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+        assert len(response.content.splitlines()) == 1
+
+
+class TestMasterdataFieldProjection:
+    """Tests for the fields= sparse fieldset parameter."""
+
+    def test_lookup_with_fields(self, client, masterdata_cache):
+        response = client.get("/get_masterdata_from_sqlite?matnr8=91960001&fields=tpm,MATNR8,PRINTCHAR_BRAILLE")
+        assert response.status_code == 200
+        assert response.json() == {"masterdata": [{"MATNR8": 91960001, "printcharBraille": "", "tpm": "TPM-0002"}]}
+
+    def test_list_batch_and_export_with_fields(self, client, masterdata_cache):
+        listing = client.get("/get_masterdata_from_sqlite?fields=MATNR8,materialType").json()
+        assert listing["masterdata"][0] == {"MATNR8": 81234567, "materialType": "YTXT"}
+
+        batch = client.post(
+            "/get_masterdata_from_sqlite/batch", json={"matnr8s": [81234567], "fields": ["plants"]}
+        ).json()
+        assert batch["masterdata"] == [{"plants": "DE01"}]
+
+        export = client.get("/get_masterdata_from_sqlite/export?fields=matnr8")
+        assert [json.loads(line) for line in export.content.splitlines()] == [
+            {"MATNR8": 81234567}, {"MATNR8": 91960001}, {"MATNR8": 91967086}
+        ]
+
+    def test_unknown_field_is_rejected(self, client, masterdata_cache):
+        assert client.get("/get_masterdata_from_sqlite?matnr8=91960001&fields=nope").status_code == 400
+        assert client.get("/get_masterdata_from_sqlite/export?fields=nope").status_code == 400
+        response = client.post("/get_masterdata_from_sqlite/batch", json={"matnr8s": [1], "fields": ["nope"]})
+        assert response.status_code == 400
+
+
+class TestMasterdataSearchEndpoint:
+    """Tests for GET /search_masterdata"""
+
+    def test_search_runs_in_the_threadpool(self, client, masterdata_cache, monkeypatch):
+        threads = record_calling_threads(monkeypatch, masterdata_cache, "search_masterdata_json")
+
+        assert client.get("/search_masterdata?q=folding").status_code == 200
+        assert threads and all(name.startswith("AnyIO worker thread") for name in threads)
+
+    def test_search_returns_ranked_records(self, client, masterdata_cache):
+        response = client.get("/search_masterdata?q=xarelto%20falt")
+        assert response.status_code == 200
+        assert [record["MATNR8"] for record in response.json()["masterdata"]] == [91967086]
+
+    def test_search_with_fields_and_limit(self, client, masterdata_cache):
+        response = client.get("/search_masterdata?q=folding&limit=1&fields=MATNR8")
+        assert response.json()["masterdata"] == [{"MATNR8": 81234567}]
+
+    def test_search_validates_parameters(self, client, masterdata_cache):
+        assert client.get("/search_masterdata").status_code == 422
+        assert client.get("/search_masterdata?q=x&limit=0").status_code == 422
+        assert client.get("/search_masterdata?q=x&fields=nope").status_code == 400
+
+
+class TestMasterdataTypeaheadEndpoint:
+    """Tests for GET /typeahead_masterdata"""
+
+    def test_typeahead_returns_completions(self, client, masterdata_cache):
+        response = client.get("/typeahead_masterdata?prefix=9196&limit=1")
+        assert response.status_code == 200
+        assert response.json() == {
+            "completions": [{"MATNR8": 91960001, "MATNR": "000000000091960001", "materialDescription": "Folding box 91960001"}]
+        }
+
+    def test_typeahead_requires_prefix(self, client, masterdata_cache):
+        assert client.get("/typeahead_masterdata").status_code == 422
+        assert client.get("/typeahead_masterdata?prefix=9&limit=101").status_code == 422
+
+
+class TestMasterdataFilterEndpoint:
+    """Tests for GET /filter_masterdata"""
+
+    def test_filter_runs_in_the_threadpool(self, client, masterdata_cache, monkeypatch):
+        threads = record_calling_threads(monkeypatch, masterdata_cache, "filter_masterdata_json")
+
+        assert client.get("/filter_masterdata?material_type=YPM").status_code == 200
+        assert threads and all(name.startswith("AnyIO worker thread") for name in threads)
+
+    def test_filter_returns_records_total_and_facets(self, client, masterdata_cache):
+        response = client.get("/filter_masterdata?material_type=YPM&fields=MATNR8")
+        assert response.status_code == 200
+
+        data = response.json()
+        assert data["masterdata"] == [{"MATNR8": 91960001}, {"MATNR8": 91967086}]
+        assert data["total"] == 2
+        assert data["facets"]["material_type"] == [{"value": "YPM", "count": 2}, {"value": "YTXT", "count": 1}]
+        assert data["next_page_token"] is None
+
+    def test_filter_with_repeated_values_and_paging(self, client, masterdata_cache):
+        first = client.get("/filter_masterdata?material_type=YPM&material_type=YTXT&page_size=2").json()
+        assert first["total"] == 3
+        second = client.get(
+            "/filter_masterdata",
+            params={"material_type": ["YPM", "YTXT"], "page_size": 2, "page_token": first["next_page_token"]},
+        ).json()
+        assert [record["MATNR8"] for record in second["masterdata"]] == [91967086]
+
+    def test_filter_by_plant(self, client, masterdata_cache):
+        data = client.get("/filter_masterdata?plant=DE02&fields=MATNR8").json()
+        assert data["masterdata"] == [{"MATNR8": 91960001}, {"MATNR8": 91967086}]
+        assert data["facets"]["plant"] == [{"value": "DE01", "count": 3}, {"value": "DE02", "count": 2}]
+
+
+class TestMasterdataPlantsEndpoint:
+    """Tests for GET /masterdata_plants"""
+
+    def test_lists_plants_with_material_counts(self, client, masterdata_cache):
+        response = client.get("/masterdata_plants")
+        assert response.status_code == 200
+        assert response.json() == {"plants": [{"plant": "DE01", "count": 3}, {"plant": "DE02", "count": 2}]}
+
+
+class TestMasterdataByTpmEndpoint:
+    """Tests for GET /get_masterdata_by_tpm"""
+
+    def test_returns_linked_materials_with_total(self, client, masterdata_cache):
+        response = client.get("/get_masterdata_by_tpm?tpm=TPM-0002&fields=MATNR8,tpm")
+        assert response.status_code == 200
+        assert response.json() == {
+            "masterdata": [{"MATNR8": 91960001, "tpm": "TPM-0002"}],
+            "next_page_token": None,
+            "tpm": "TPM-0002",
+            "total": 1,
+            "tpm_configs": None,
+        }
+
+    def test_joins_the_local_tpm_table(self, client, masterdata_cache, monkeypatch):
+        tpm_config = importlib.import_module("src.models.models").TpmConfig(id=7, TPM="TPM-0002", packType="box")
+        monkeypatch.setattr("src.routers.masterdata_sqlite.get_tpms_from_db", lambda tpm: [tpm_config])
+
+        data = client.get("/get_masterdata_by_tpm?tpm=TPM-0002&include_tpm_config=true").json()
+        assert data["total"] == 1
+        assert [(config["id"], config["TPM"], config["packType"]) for config in data["tpm_configs"]] == [
+            (7, "TPM-0002", "box")
+        ]
+
+
+class TestMasterdataConditionalRequests:
+    """Tests for ETag, Last-Modified and 304 responses of the masterdata endpoints"""
+
+    def test_lookup_carries_validators(self, client, masterdata_cache):
+        response = client.get("/get_masterdata_from_sqlite?matnr8=91967086")
+        assert response.headers["etag"].startswith('"r')
+        assert response.headers["last-modified"].endswith(" GMT")
+        assert response.headers["cache-control"] == "no-cache"
+
+    def test_lookup_if_none_match(self, client, masterdata_cache):
+        etag = client.get("/get_masterdata_from_sqlite?matnr8=91967086").headers["etag"]
+
+        response = client.get("/get_masterdata_from_sqlite?matnr8=91967086", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+        other = client.get("/get_masterdata_from_sqlite?matnr8=81234567", headers={"If-None-Match": etag})
+        assert other.status_code == 200
+
+        weak = client.get("/get_masterdata_from_sqlite?matnr8=91967086", headers={"If-None-Match": f'"x", W/{etag}'})
+        assert weak.status_code == 304
+
+    def test_lookup_304_does_not_read_the_record(self, client, masterdata_cache, monkeypatch):
+        etag = client.get("/get_masterdata_from_sqlite?matnr8=91967086").headers["etag"]
+
+        def fail(*args, **kwargs):
+            raise AssertionError("record was read")
+
+        monkeypatch.setattr(masterdata_cache, "_lookup", fail)
+        monkeypatch.setattr(masterdata_cache, "get_masterdata_json_by_matnr8", fail)
+        response = client.get("/get_masterdata_from_sqlite?matnr8=91967086", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+    def test_record_etag_survives_unchanged_refresh(self, client, masterdata_cache):
+        etag = client.get("/get_masterdata_from_sqlite?matnr8=91967086").headers["etag"]
+
+        masterdata_cache.bulk_insert_masterdata([
+            make_record(91967086, MATERIAL_DESCRIPTION="Xarelto 20mg Faltschachtel ü", ACS_VERSION="2"),
+        ])
+        response = client.get("/get_masterdata_from_sqlite?matnr8=91967086", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+        masterdata_cache.bulk_insert_masterdata([make_record(91967086, MATERIAL_DESCRIPTION="Reloaded")])
+        response = client.get("/get_masterdata_from_sqlite?matnr8=91967086", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+    def test_projected_lookup_has_its_own_etag(self, client, masterdata_cache):
+        full = client.get("/get_masterdata_from_sqlite?matnr8=91967086").headers["etag"]
+        projected = client.get("/get_masterdata_from_sqlite?matnr8=91967086&fields=MATNR8").headers["etag"]
+        assert projected != full
+
+        response = client.get(
+            "/get_masterdata_from_sqlite?matnr8=91967086&fields=MATNR8", headers={"If-None-Match": projected}
+        )
+        assert response.status_code == 304
+
+    def test_if_modified_since(self, client, masterdata_cache):
+        last_modified = client.get("/get_masterdata_from_sqlite").headers["last-modified"]
+
+        response = client.get("/get_masterdata_from_sqlite", headers={"If-Modified-Since": last_modified})
+        assert response.status_code == 304
+
+        response = client.get(
+            "/get_masterdata_from_sqlite", headers={"If-Modified-Since": "Mon, 01 Jan 2001 00:00:00 GMT"}
+        )
+        assert response.status_code == 200
+
+        response = client.get("/get_masterdata_from_sqlite", headers={"If-Modified-Since": "not a date"})
+        assert response.status_code == 200
+
+    def test_lookup_if_modified_since(self, client, masterdata_cache):
+        last_modified = client.get("/get_masterdata_from_sqlite").headers["last-modified"]
+        headers = {"If-Modified-Since": last_modified}
+
+        # Not serialized yet, so the record is read to learn it exists
+        assert client.get("/get_masterdata_from_sqlite?matnr8=91967086", headers=headers).status_code == 304
+        assert client.get("/get_masterdata_from_sqlite?matnr8=91967086", headers=headers).status_code == 304
+        assert client.get("/get_masterdata_from_sqlite?matnr8=12345678", headers=headers).status_code == 404
+
+    def test_if_none_match_takes_precedence(self, client, masterdata_cache):
+        last_modified = client.get("/get_masterdata_from_sqlite").headers["last-modified"]
+
+        response = client.get(
+            "/get_masterdata_from_sqlite", headers={"If-None-Match": '"other"', "If-Modified-Since": last_modified}
+        )
+        assert response.status_code == 200
+
+    @pytest.mark.parametrize("url", [
+        "/get_masterdata_from_sqlite?page_size=2",
+        "/filter_masterdata?material_type=YTXT",
+        "/get_masterdata_by_tpm?tpm=TPM-0002",
+        "/search_masterdata?q=xarelto",
+    ])
+    def test_listings_are_tagged_with_the_generation(self, client, masterdata_cache, url):
+        etag = client.get(url).headers["etag"]
+        assert etag.startswith('"g')
+        assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+        masterdata_cache.bulk_insert_masterdata([make_record(91960001, TPM="TPM-0002")])
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+    def test_tpm_config_responses_are_not_tagged(self, client, masterdata_cache, monkeypatch):
+        monkeypatch.setattr("src.routers.masterdata_sqlite.get_tpms_from_db", lambda tpm: [])
+
+        response = client.get("/get_masterdata_by_tpm?tpm=TPM-0002&include_tpm_config=true")
+        assert response.status_code == 200
+        assert "etag" not in response.headers
+
+
+class TestCacheStatsEndpoint:
+    """Tests for GET /cache_stats"""
+
+    def test_stats_are_measured_in_the_threadpool(self, client, masterdata_cache, monkeypatch):
+        threads = record_calling_threads(monkeypatch, masterdata_cache, "get_cache_stats")
+
+        response = client.get("/cache_stats")
+        assert response.status_code == 200
+        assert response.json()["cache_stats"]["record_count"] == 3
+        assert threads and all(name.startswith("AnyIO worker thread") for name in threads)
+
+
+def _metric_value(text, sample):
+    """Value of one sample line of a Prometheus text exposition, 0 when absent."""
+    for line in text.splitlines():
+        if line.startswith(sample + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+class TestMetricsEndpoint:
+    """Tests for /metrics"""
+
+    def test_lookup_counters(self, client, masterdata_cache):
+        samples = {
+            "serialized": 'scripta_masterdata_lookups_total{result="hit",source="serialized"}',
+            "engine": 'scripta_masterdata_lookups_total{result="hit",source="engine"}',
+            "not_found": 'scripta_masterdata_lookups_total{result="not_found"}',
+        }
+        before = client.get("/metrics").text
+
+        client.get("/get_masterdata_from_sqlite?matnr8=91967086")
+        client.get("/get_masterdata_from_sqlite?matnr8=91967086")
+        client.get("/get_masterdata_from_sqlite?matnr8=91967086&fields=MATNR8")
+        client.get("/get_masterdata_from_sqlite?matnr8=12345678")
+
+        after = client.get("/metrics").text
+        delta = {name: _metric_value(after, sample) - _metric_value(before, sample) for name, sample in samples.items()}
+        # Found records are hits whether or not their JSON was kept
+        assert delta == {"serialized": 1, "engine": 2, "not_found": 1}
+
+    def test_route_latency_is_labelled_by_template(self, client, masterdata_cache):
+        client.get("/get_masterdata_from_sqlite?matnr8=91967086")
+        client.get("/no_such_route/91967086")
+
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert _metric_value(response.text, 'scripta_http_request_duration_seconds_count'
+                             '{method="GET",route="/get_masterdata_from_sqlite",status="200"}') >= 1
+        assert 'route="/no_such_route/91967086"' not in response.text
+        assert _metric_value(response.text, 'scripta_http_request_duration_seconds_count'
+                             '{method="GET",route="unmatched",status="404"}') >= 1
+
+    def test_cache_gauges(self, client, masterdata_cache, monkeypatch):
+        monkeypatch.setattr("src.routers.utility.cache_manager", masterdata_cache)
+
+        text = client.get("/metrics").text
+        assert _metric_value(text, "scripta_cache_generation") == masterdata_cache.generation
+        assert 0 <= _metric_value(text, "scripta_cache_age_seconds") < 60
+        assert 'scripta_refresh_phase_duration_seconds_count{phase="cache_load"}' in text
+
+
+class TestCacheWarmup:
+    """Tests for the background cache warm-up and /ready."""
+
+    @pytest.fixture
+    def warmup(self, masterdata_cache, monkeypatch):
+        warmup = importlib.import_module("src.cache.warmup").CacheWarmup(masterdata_cache)
+        monkeypatch.setattr("src.routers.utility.cache_warmup", warmup)
+        monkeypatch.setattr("src.routers.masterdata_sqlite.cache_warmup", warmup)
+        return warmup
+
+    def test_not_ready_while_loading(self, client, masterdata_cache, warmup):
+        release = threading.Event()
+
+        def load():
+            masterdata_cache.load_rows_read = 2
+            release.wait(5)
+            return 3
+
+        warmup.start(load, records_expected=4)
+        try:
+            response = client.get("/ready")
+            assert response.status_code == 503
+            status = response.json()
+            assert status["ready"] is False
+            assert status["state"] == "loading"
+            assert status["records_loaded"] == 2
+            assert status["progress"] == 0.5
+
+            response = client.get("/get_masterdata_from_sqlite?matnr8=91967086")
+            assert response.status_code == 503
+            assert response.headers["retry-after"] == "5"
+            # Routes that do not need masterdata are served meanwhile
+            assert client.get("/health").status_code == 200
+            assert "scripta_cache_ready 0" in client.get("/metrics").text
+        finally:
+            release.set()
+            assert warmup.wait(5)
+
+        response = client.get("/ready")
+        assert response.status_code == 200
+        assert response.json()["records_loaded"] == 3
+        assert client.get("/get_masterdata_from_sqlite?matnr8=91967086").status_code == 200
+
+    def test_failed_warmup_until_refresh(self, client, masterdata_cache, warmup):
+        def load():
+            raise RuntimeError("database is locked")
+
+        warmup.start(load, records_expected=3)
+        assert warmup.wait(5)
+
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["error"] == "database is locked"
+        # Served from whatever the cache holds, as without a warm-up
+        assert client.get("/get_masterdata_from_sqlite?matnr8=91967086").status_code == 200
+
+        masterdata_cache.bulk_insert_masterdata([make_record(91967086)])
+        assert client.get("/ready").status_code == 200
+
+    def test_ready_without_data_to_load(self, client, warmup):
+        assert client.get("/ready").status_code == 503
+
+        warmup.mark_ready()
+        response = client.get("/ready")
+        assert response.status_code == 200
+        assert response.json()["state"] == "ready"
@@ -0,0 +1,624 @@
+"""
+Tests for the incremental masterdata refresh from Databricks.
+"""
+import asyncio
+import importlib
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from ..src.config import databricks as databricks_module
+from ..src.config.databricks import execute_databricks_query, prefetch, stream_databricks_query
+from ..src.config.masterdata_delta import (
+    WATCHED_VIEWS,
+    advance_watermarks,
+    change_date_columns,
+    changed_materials_query,
+    full_refresh_reason,
+    incremental_query,
+    load_unified_query,
+    watermark_query,
+)
+from .test_cache_manager import make_record
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+WATERMARKS = {view: "2026-10-01 00:00:00" for view in WATCHED_VIEWS}
+
+
+class TestDeltaQueries:
+    """Tests for building the incremental queries."""
+
+    def test_incremental_query_restricts_the_unified_cte(self):
+        full = load_unified_query()
+        query = incremental_query(WATERMARKS)
+
+        assert "@incremental" not in query
+        assert query.count("changed_materials AS (") == 1
+        assert "WHERE mara.MATNR IN (SELECT MATNR FROM changed_materials)" in query
+        # The CTE follows the last one of the unified query, the final SELECT is unchanged
+        assert query.index("changed_materials AS (") < query.index("-- Final SELECT statement")
+        assert query.endswith(full[full.index("-- Final SELECT statement"):].replace(
+            "        -- @incremental_filter: the incremental refresh restricts the materials here",
+            "        WHERE mara.MATNR IN (SELECT MATNR FROM changed_materials)",
+        ))
+
+    def test_changed_materials_use_the_watermark_of_every_view(self, monkeypatch):
+        monkeypatch.setenv("DATABRICKS_CHANGE_DATE_COLUMNS", "pmd_mara_view=LAEDA, p2r_drad_view=CHANGED_ON")
+        watermarks = {**WATERMARKS, "p2r_ausp_view": "2026-09-30 12:00:00.5"}
+
+        query = changed_materials_query(watermarks)
+
+        assert "mara.LAEDA > '2026-10-01 00:00:00'" in query
+        assert "ausp.OPTIMESTAMP > '2026-09-30 12:00:00.5'" in query
+        assert "drad.CHANGED_ON > '2026-10-01 00:00:00'" in query
+        assert "drad.DOKOB = 'MARA'" in query
+        assert query.rstrip().endswith("GROUP BY SOURCE, MATNR")
+
+    def test_invalid_watermark_is_rejected(self):
+        with pytest.raises(ValueError):
+            changed_materials_query({**WATERMARKS, "pmd_mara_view": "2026-10-01' OR '1'='1"})
+
+    @pytest.mark.parametrize("setting", ["unknown_view=LAEDA", "pmd_mara_view=LAEDA; DROP"])
+    def test_invalid_change_date_columns(self, monkeypatch, setting):
+        monkeypatch.setenv("DATABRICKS_CHANGE_DATE_COLUMNS", setting)
+        with pytest.raises(ValueError):
+            change_date_columns()
+
+    def test_missing_markers_are_rejected(self):
+        with pytest.raises(ValueError):
+            incremental_query(WATERMARKS, unified_query="SELECT 1")
+
+    def test_watermark_query_reads_every_view(self):
+        query = watermark_query()
+        for view in WATCHED_VIEWS:
+            assert f"SELECT '{view}' AS SOURCE, CAST(MAX(OPTIMESTAMP) AS STRING) AS WATERMARK" in query
+
+    def test_advance_watermarks(self):
+        changes = [
+            {"SOURCE": "pmd_mara_view", "MATNR": "1", "CHANGED_AT": "2026-10-02 08:00:00"},
+            {"SOURCE": "pmd_mara_view", "MATNR": "2", "CHANGED_AT": "2026-10-03 08:00:00"},
+            {"SOURCE": "p2r_ausp_view", "MATNR": "1", "CHANGED_AT": None},
+        ]
+
+        assert advance_watermarks(WATERMARKS, changes) == {**WATERMARKS, "pmd_mara_view": "2026-10-03 08:00:00"}
+
+    def test_full_refresh_reason(self, monkeypatch):
+        monkeypatch.setenv("MASTERDATA_FULL_RECONCILE_HOURS", "24")
+        now = datetime(2026, 10, 17, 12, 0, tzinfo=timezone.utc)
+        recent = (now - timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S")
+        old = (now - timedelta(hours=25)).strftime("%Y-%m-%d %H:%M:%S")
+
+        assert full_refresh_reason({"watermarks": WATERMARKS, "last_full_refresh": recent}, now) is None
+        assert "due for reconcile" in full_refresh_reason({"watermarks": WATERMARKS, "last_full_refresh": old}, now)
+        assert "p2r_drad_view" in full_refresh_reason(
+            {"watermarks": {**WATERMARKS, "p2r_drad_view": None}, "last_full_refresh": recent}, now
+        )
+        assert full_refresh_reason({"watermarks": WATERMARKS, "last_full_refresh": None}, now) is not None
+
+
+@pytest.fixture
+def refresh_db(tmp_path, monkeypatch):
+    """Point the app's SQLite database at a fresh file with the masterdata tables."""
+    db_path = str(tmp_path / "scripta-db.sqlite3")
+    sqlite3.connect(db_path).close()
+    database = importlib.import_module("src.routers.database")
+    monkeypatch.setattr(database, "DB_PATH", db_path)
+    monkeypatch.setattr("src.routers.databricks.DB_PATH", db_path)
+    database.create_masterdata_databricks_table()
+    return database
+
+
+@pytest.fixture
+def refresh_cache(monkeypatch):
+    """Serve the refresh endpoints with a fresh, warmed-up cache."""
+    manager = importlib.import_module("src.cache.cache_manager").create_cache_manager("sqlite")
+    manager.initialize_cache()
+    warmup = importlib.import_module("src.cache.warmup").CacheWarmup(manager)
+    warmup.mark_ready()
+    monkeypatch.setattr("src.routers.databricks.cache_manager", manager)
+    monkeypatch.setattr("src.routers.databricks.cache_warmup", warmup)
+    yield manager
+    manager.close_cache()
+
+
+class FakeDatabricks:
+    """Answers the refresh queries like Databricks would for a given state."""
+
+    def __init__(self, records, changes=(), watermark="2026-10-01 00:00:00"):
+        self.records = records
+        self.changes = list(changes)
+        self.watermark = watermark
+        self.queries = []
+
+    def __call__(self, query, params=None):
+        if "AS WATERMARK" in query:
+            self.queries.append("watermarks")
+            return [{"SOURCE": view, "WATERMARK": self.watermark} for view in WATCHED_VIEWS]
+        if "GROUP BY SOURCE, MATNR" in query:
+            self.queries.append("changes")
+            return self.changes
+        if "changed_materials" in query:
+            self.queries.append("incremental")
+            changed = {change["MATNR"] for change in self.changes}
+            return [record for record in self.records if record["MATNR"] in changed]
+        self.queries.append("full")
+        return list(self.records)
+
+    def stream(self, query, params=None, chunk_size=2):
+        """Like stream_databricks_query: the rows in chunks of chunk_size."""
+        rows = self(query, params)
+        for start in range(0, len(rows), chunk_size):
+            yield rows[start:start + chunk_size]
+
+
+def set_audit_times(db_path, timestamp="2026-01-01 00:00:00"):
+    """Backdate created_at and updated_at of every stored material."""
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE masterdata_databricks SET created_at = ?, updated_at = ?", (timestamp, timestamp))
+    conn.commit()
+    conn.close()
+
+
+def stored_audit_times(db_path):
+    """MATNR8 -> (created_at, updated_at) of every stored material."""
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT MATNR8, created_at, updated_at FROM masterdata_databricks").fetchall()
+    conn.close()
+    return {matnr8: (created_at, updated_at) for matnr8, created_at, updated_at in rows}
+
+
+class TestSQLiteChanges:
+    """Tests for writing only changed masterdata rows to SQLite."""
+
+    def test_full_save_writes_only_changes(self, refresh_db):
+        first = refresh_db.save_masterdata_to_sqlite([make_record(91967086), make_record(81234567)])
+        assert (first["inserted"], first["updated"], first["deleted"], first["unchanged"]) == (2, 0, 0, 0)
+        set_audit_times(refresh_db.DB_PATH)
+
+        report = refresh_db.save_masterdata_to_sqlite([
+            make_record(91967086, MATERIAL_DESCRIPTION="Changed"),
+            make_record(70000001),
+            make_record(81234567),
+        ])
+
+        assert report == {
+            "records": 3,
+            "inserted": 1,
+            "updated": 1,
+            "deleted": 0,
+            "unchanged": 1,
+            "sample_keys": {"inserted": ["000000000070000001"], "updated": ["000000000091967086"], "deleted": []},
+        }
+        times = stored_audit_times(refresh_db.DB_PATH)
+        # Only the changed material gets a new updated_at, and keeps its created_at
+        assert times[81234567] == ("2026-01-01 00:00:00", "2026-01-01 00:00:00")
+        assert times[91967086][0] == "2026-01-01 00:00:00"
+        assert times[91967086][1] > "2026-01-01 00:00:00"
+        assert times[70000001][0] > "2026-01-01 00:00:00"
+
+    def test_full_save_deletes_missing_materials(self, refresh_db):
+        refresh_db.save_masterdata_to_sqlite([make_record(91967086), make_record(81234567)])
+
+        report = refresh_db.save_masterdata_to_sqlite([make_record(91967086)])
+
+        assert (report["deleted"], report["unchanged"]) == (1, 1)
+        assert report["sample_keys"]["deleted"] == ["000000000081234567"]
+        assert set(stored_audit_times(refresh_db.DB_PATH)) == {91967086}
+
+    def test_sample_keys_are_limited(self, refresh_db):
+        report = refresh_db.save_masterdata_to_sqlite([make_record(90000000 + number) for number in range(25)])
+
+        assert report["inserted"] == 25
+        assert len(report["sample_keys"]["inserted"]) == refresh_db.DIFF_SAMPLE_SIZE
+
+    def test_empty_fetch_keeps_the_table(self, refresh_db):
+        refresh_db.save_masterdata_to_sqlite([make_record(91967086)])
+
+        assert refresh_db.save_masterdata_to_sqlite([])["deleted"] == 0
+        assert set(stored_audit_times(refresh_db.DB_PATH)) == {91967086}
+
+    def test_content_hash_ignores_audit_columns(self, refresh_db):
+        record = make_record(91967086)
+
+        assert refresh_db.masterdata_content_hash(record) == refresh_db.masterdata_content_hash(
+            {**record, "updated_at": "2026-01-01 00:00:00"}
+        )
+        assert refresh_db.masterdata_content_hash(record) != refresh_db.masterdata_content_hash(
+            {**record, "COLORS": "4"}
+        )
+
+    def test_table_without_content_hash_is_migrated(self, refresh_db):
+        # A table as created before content hashing, with a stored row
+        conn = sqlite3.connect(refresh_db.DB_PATH)
+        conn.execute("ALTER TABLE masterdata_databricks DROP COLUMN content_hash")
+        conn.execute("INSERT INTO masterdata_databricks (MATNR, MATNR8) VALUES ('000000000091967086', 91967086)")
+        conn.commit()
+        conn.close()
+
+        refresh_db.create_masterdata_databricks_table()
+        report = refresh_db.save_masterdata_to_sqlite([make_record(91967086)])
+
+        # Rows without a hash are rewritten once
+        assert report["updated"] == 1
+        assert refresh_db.save_masterdata_to_sqlite([make_record(91967086)])["unchanged"] == 1
+
+    def test_incremental_upsert_and_delete(self, refresh_db):
+        refresh_db.save_masterdata_to_sqlite([make_record(91967086), make_record(81234567), make_record(91960001)])
+        set_audit_times(refresh_db.DB_PATH)
+
+        stored, removed, report = refresh_db.upsert_masterdata_in_sqlite(
+            [make_record(91967086, MATERIAL_DESCRIPTION="Changed"), make_record(70000001), make_record(91960001)],
+            ["000000000091967086", "000000000081234567", "000000000070000001", "000000000091960001"],
+        )
+
+        assert {record["MATNR8"]: record["MATERIAL_DESCRIPTION"] for record in stored} == {
+            91967086: "Changed", 70000001: "Folding box 70000001"
+        }
+        assert removed == ["000000000081234567"]
+        assert (report["inserted"], report["updated"], report["deleted"], report["unchanged"]) == (1, 1, 1, 1)
+        times = stored_audit_times(refresh_db.DB_PATH)
+        assert set(times) == {91967086, 70000001, 91960001}
+        assert times[91967086][0] == "2026-01-01 00:00:00"
+        assert times[91960001] == ("2026-01-01 00:00:00", "2026-01-01 00:00:00")
+
+    def test_refresh_state_round_trip(self, refresh_db):
+        assert refresh_db.get_masterdata_refresh_state() == {
+            "watermarks": {}, "last_full_refresh": None, "last_incremental_refresh": None
+        }
+
+        refresh_db.save_masterdata_refresh_state(WATERMARKS, full_refresh=True)
+
+        state = refresh_db.get_masterdata_refresh_state()
+        assert state["watermarks"] == WATERMARKS
+        assert state["last_full_refresh"] is not None
+        assert state["last_incremental_refresh"] is None
+
+
+class FakeCursor:
+    """A DB-API cursor over fixed rows, recording the fetch sizes."""
+
+    def __init__(self, rows, arraysize):
+        self.rows = rows
+        self.arraysize = arraysize
+        self.description = [("MATNR",), ("MATNR8",)]
+        self.fetch_sizes = []
+
+    def execute(self, query, params=None):
+        self.query = query
+
+    def fetchmany(self, size):
+        self.fetch_sizes.append(size)
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.cursors = []
+        self.closed = False
+
+    def cursor(self, arraysize=100000):
+        self.cursors.append(FakeCursor(self.rows, arraysize))
+        return self.cursors[-1]
+
+    def close(self):
+        self.closed = True
+
+
+class TestStreamingIngest:
+    """Tests for streaming Databricks rows into SQLite in chunks."""
+
+    @pytest.fixture
+    def connection(self, monkeypatch):
+        connection = FakeConnection([(f"{number:018d}", number) for number in range(5)])
+        monkeypatch.setattr(databricks_module, "get_databricks_connection", lambda: connection)
+        return connection
+
+    def test_stream_fetches_chunks(self, connection):
+        chunks = list(stream_databricks_query("SELECT MATNR, MATNR8 FROM mara", chunk_size=2))
+
+        assert [[row["MATNR8"] for row in chunk] for chunk in chunks] == [[0, 1], [2, 3], [4]]
+        assert chunks[0][0] == {"MATNR": "000000000000000000", "MATNR8": 0}
+        # The connector buffers no more than a chunk
+        assert connection.cursors[0].arraysize == 2
+        assert connection.cursors[0].fetch_sizes == [2, 2, 2, 2]
+        assert connection.closed
+
+    def test_closing_the_stream_closes_the_connection(self, connection):
+        chunks = stream_databricks_query("SELECT MATNR, MATNR8 FROM mara", chunk_size=2)
+        next(chunks)
+        chunks.close()
+
+        assert connection.closed
+
+    def test_execute_query_returns_all_rows(self, connection, monkeypatch):
+        monkeypatch.setenv("DATABRICKS_FETCH_SIZE", "3")
+
+        rows = execute_databricks_query("SELECT MATNR, MATNR8 FROM mara")
+
+        assert [row["MATNR8"] for row in rows] == [0, 1, 2, 3, 4]
+        assert connection.cursors[0].fetch_sizes == [3, 3, 3]
+
+    def test_prefetch_stays_a_bounded_number_of_chunks_ahead(self):
+        produced = []
+
+        def chunks():
+            for number in range(20):
+                produced.append(number)
+                yield [number]
+
+        consumed = []
+        for chunk in prefetch(chunks(), depth=1):
+            time.sleep(0.005)
+            # One chunk in the buffer and one waiting to be put into it
+            assert len(produced) - len(consumed) <= 3
+            consumed.append(chunk[0])
+
+        assert consumed == list(range(20))
+
+    def test_prefetch_raises_errors_of_the_producer(self):
+        def chunks():
+            yield [1]
+            raise RuntimeError("Databricks connection lost")
+
+        iterator = prefetch(chunks())
+
+        assert next(iterator) == [1]
+        with pytest.raises(RuntimeError, match="connection lost"):
+            next(iterator)
+
+    def test_closing_prefetch_closes_the_chunks(self):
+        closed = []
+
+        def chunks():
+            try:
+                number = 0
+                while True:
+                    number += 1
+                    yield [number]
+            finally:
+                closed.append(True)
+
+        iterator = prefetch(chunks())
+        assert next(iterator) == [1]
+        iterator.close()
+
+        assert closed == [True]
+
+    def test_closing_prefetch_stops_fetching(self):
+        fetched = []
+
+        def chunks():
+            while True:
+                fetched.append(len(fetched))
+                yield fetched[-1:]
+
+        iterator = prefetch(chunks(), depth=1)
+        next(iterator)
+        # The producer has filled the buffer and waits to put the next chunk
+        time.sleep(0.05)
+        iterator.close()
+        count = len(fetched)
+        time.sleep(0.05)
+
+        assert len(fetched) == count <= 3
+
+    def test_chunked_save_reports_like_a_single_save(self, refresh_db):
+        refresh_db.save_masterdata_to_sqlite([make_record(91967086), make_record(81234567), make_record(91960001)])
+
+        report = refresh_db.save_masterdata_chunks_to_sqlite(iter([
+            [make_record(91967086, MATERIAL_DESCRIPTION="Changed"), make_record(70000001)],
+            [make_record(91960001)],
+            # Repeated in a later chunk: written again, counted once
+            [make_record(70000001, COLORS="4")],
+        ]))
+
+        assert report == {
+            "records": 3,
+            "inserted": 1,
+            "updated": 1,
+            "deleted": 1,
+            "unchanged": 1,
+            "sample_keys": {
+                "inserted": ["000000000070000001"],
+                "updated": ["000000000091967086"],
+                "deleted": ["000000000081234567"],
+            },
+        }
+        assert set(stored_audit_times(refresh_db.DB_PATH)) == {91967086, 70000001, 91960001}
+
+    def test_failed_fetch_deletes_nothing(self, refresh_db):
+        refresh_db.save_masterdata_to_sqlite([make_record(91967086), make_record(81234567)])
+
+        def chunks():
+            yield [make_record(91967086, MATERIAL_DESCRIPTION="Changed")]
+            raise RuntimeError("Databricks connection lost")
+
+        with pytest.raises(RuntimeError):
+            refresh_db.save_masterdata_chunks_to_sqlite(chunks())
+
+        # The chunk read before the failure is kept
+        assert set(stored_audit_times(refresh_db.DB_PATH)) == {91967086, 81234567}
+        assert refresh_db.save_masterdata_to_sqlite([make_record(91967086, MATERIAL_DESCRIPTION="Changed"),
+                                                     make_record(81234567)])["unchanged"] == 2
+
+
+class TestIncrementalRefreshEndpoint:
+    """Tests for POST /databricks/refresh_masterdata_incremental"""
+
+    @pytest.fixture
+    def databricks(self, monkeypatch):
+        fake = FakeDatabricks([make_record(91967086), make_record(81234567), make_record(91960001)])
+        monkeypatch.setattr("src.routers.databricks.execute_databricks_query", fake)
+        monkeypatch.setattr("src.routers.databricks.stream_databricks_query", fake.stream)
+        return fake
+
+    def test_first_refresh_is_full_and_stores_watermarks(self, client, refresh_db, refresh_cache, databricks):
+        response = client.post("/databricks/refresh_masterdata_incremental")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["mode"] == "full"
+        assert data["full_refresh_reason"].startswith("no watermark")
+        assert data["sqlite_records_saved"] == 3
+        assert databricks.queries == ["watermarks", "full"]
+        assert refresh_db.get_masterdata_refresh_state()["watermarks"] == WATERMARKS
+
+    def test_refresh_reads_only_changed_materials(self, client, refresh_db, refresh_cache, databricks):
+        client.post("/databricks/save_masterdata_to_sqlite_and_cache")
+        databricks.records[0] = make_record(91967086, MATERIAL_DESCRIPTION="Changed")
+        # 81234567 no longer passes the CTE's filters
+        del databricks.records[1]
+        databricks.changes = [
+            {"SOURCE": "pmd_mara_view", "MATNR": "000000000091967086", "CHANGED_AT": "2026-10-02 08:00:00"},
+            {"SOURCE": "p2r_drad_view", "MATNR": "000000000081234567", "CHANGED_AT": "2026-10-03 09:00:00"},
+        ]
+        databricks.queries.clear()
+
+        response = client.post("/databricks/refresh_masterdata_incremental")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["mode"] == "incremental"
+        assert databricks.queries == ["changes", "incremental"]
+        assert (data["changed_materials"], data["sqlite_records_upserted"], data["sqlite_records_deleted"]) == (2, 1, 1)
+        assert data["cache_records_loaded"] == 2
+        assert data["watermarks"] == {
+            **WATERMARKS, "pmd_mara_view": "2026-10-02 08:00:00", "p2r_drad_view": "2026-10-03 09:00:00"
+        }
+        assert refresh_cache.get_masterdata_by_matnr8(91967086)["MATERIAL_DESCRIPTION"] == "Changed"
+        assert refresh_cache.get_masterdata_by_matnr8(81234567) is None
+        assert refresh_cache.get_masterdata_by_matnr8(91960001) is not None
+        assert refresh_db.get_masterdata_databricks_stats()["record_count"] == 2
+
+    def test_refresh_without_changes_reads_nothing_else(self, client, refresh_db, refresh_cache, databricks):
+        client.post("/databricks/save_masterdata_to_sqlite_and_cache")
+        generation = refresh_cache.generation
+        databricks.queries.clear()
+
+        data = client.post("/databricks/refresh_masterdata_incremental").json()
+
+        assert databricks.queries == ["changes"]
+        assert data["changed_materials"] == 0
+        assert refresh_cache.generation == generation
+
+    def test_full_refresh_reports_changes(self, client, refresh_db, refresh_cache, databricks):
+        client.post("/databricks/save_masterdata_to_sqlite_and_cache")
+        generation = refresh_cache.generation
+
+        unchanged = client.post("/databricks/save_masterdata_to_sqlite_and_cache").json()
+
+        assert unchanged["sqlite_changes"]["unchanged"] == 3
+        assert unchanged["cache_records_loaded"] is None
+        assert refresh_cache.generation == generation
+
+        databricks.records[2] = make_record(91960001, COLORS="4")
+        changed = client.post("/databricks/save_masterdata_to_sqlite_and_cache").json()
+
+        assert changed["sqlite_changes"]["sample_keys"]["updated"] == ["000000000091960001"]
+        assert changed["cache_records_loaded"] == 3
+        # The cache is loaded from SQLite and carries when each record changed
+        record = refresh_cache.get_masterdata_by_matnr8(91960001)
+        assert (record["COLORS"], record["updated_at"]) == ("4", stored_audit_times(refresh_db.DB_PATH)[91960001][1])
+
+    def test_reconcile_runs_a_full_refresh(self, client, refresh_db, refresh_cache, databricks, monkeypatch):
+        client.post("/databricks/save_masterdata_to_sqlite_and_cache")
+        monkeypatch.setenv("MASTERDATA_FULL_RECONCILE_HOURS", "0")
+        databricks.queries.clear()
+
+        data = client.post("/databricks/refresh_masterdata_incremental").json()
+
+        assert data["mode"] == "full"
+        assert "due for reconcile" in data["full_refresh_reason"]
+        assert databricks.queries == ["watermarks", "full"]
+
+    def test_full_refresh_works_without_watermarks(self, client, refresh_db, refresh_cache, databricks, monkeypatch):
+        def failing_watermarks(query, params=None):
+            if "AS WATERMARK" in query:
+                raise RuntimeError("column OPTIMESTAMP not found")
+            return databricks(query, params)
+
+        monkeypatch.setattr("src.routers.databricks.execute_databricks_query", failing_watermarks)
+
+        response = client.post("/databricks/save_masterdata_to_sqlite_and_cache")
+
+        assert response.status_code == 200
+        assert refresh_db.get_masterdata_refresh_state()["watermarks"] == {}
+
+
+    def test_failed_save_closes_the_stream_in_the_threadpool(self, client, refresh_db, refresh_cache, databricks,
+                                                             monkeypatch):
+        closed_in = []
+
+        def recording_prefetch(chunks):
+            try:
+                yield from prefetch(chunks)
+            finally:
+                closed_in.append(threading.current_thread().name)
+
+        def failing_save(chunks):
+            next(chunks)
+            raise RuntimeError("disk full")
+
+        monkeypatch.setattr("src.routers.databricks.prefetch", recording_prefetch)
+        monkeypatch.setattr("src.routers.databricks.save_masterdata_chunks_to_sqlite", failing_save)
+
+        assert client.post("/databricks/save_masterdata_to_sqlite_and_cache").status_code == 500
+        # Stopped where the save ran, not on the event loop
+        assert len(closed_in) == 1 and closed_in[0].startswith("AnyIO worker thread")
+
+
+class TestSingleFlightRefresh:
+    """Tests for running the refresh endpoints one at a time."""
+
+    @pytest.fixture
+    def databricks(self, monkeypatch):
+        fake = FakeDatabricks([make_record(91967086), make_record(81234567)])
+
+        def slow_databricks(query, params=None):
+            # Keep the refresh in flight while the other request arrives
+            time.sleep(0.2)
+            return fake(query, params)
+
+        def slow_stream(query, params=None):
+            time.sleep(0.2)
+            yield from fake.stream(query, params)
+
+        monkeypatch.setattr("src.routers.databricks.execute_databricks_query", slow_databricks)
+        monkeypatch.setattr("src.routers.databricks.stream_databricks_query", slow_stream)
+        return fake
+
+    @pytest.mark.asyncio
+    async def test_concurrent_full_refreshes_run_once(self, async_client, refresh_db, refresh_cache, databricks):
+        responses = await asyncio.gather(
+            async_client.post("/databricks/save_masterdata_to_sqlite_and_cache"),
+            async_client.post("/databricks/save_masterdata_to_sqlite_and_cache"),
+        )
+
+        assert [response.status_code for response in responses] == [200, 200]
+        assert databricks.queries == ["watermarks", "full"]
+        assert sorted(response.json().get("attached", False) for response in responses) == [False, True]
+        assert responses[0].json()["sqlite_changes"] == responses[1].json()["sqlite_changes"]
+
+        status = (await async_client.get("/databricks/refresh_status")).json()
+        assert status["running"] is False
+        assert status["last_run"]["mode"] == "full"
+        assert (status["last_run"]["success"], status["last_run"]["attached_requests"]) == (True, 1)
+        assert status["last_run"]["duration_seconds"] >= 0.2
+
+    @pytest.mark.skipif(fcntl is None, reason="needs fcntl")
+    def test_refresh_in_another_worker_is_a_conflict(self, client, refresh_db, refresh_cache, databricks):
+        with open(f"{refresh_db.DB_PATH}.refresh.lock", "a") as other_worker:
+            fcntl.flock(other_worker.fileno(), fcntl.LOCK_EX)
+            response = client.post("/databricks/refresh_masterdata_incremental")
+
+        assert response.status_code == 409
+        assert databricks.queries == []
@@ -0,0 +1,95 @@
+"""
+Tests for the in-process metrics registry.
+"""
+import threading
+
+from ..src.metrics import MetricsRegistry
+
+
+def make_registry():
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests.")
+    registry.histogram("duration_seconds", "Durations.", (0.1, 1.0))
+    return registry
+
+
+def test_counters_are_summed_across_threads():
+    registry = make_registry()
+
+    def record():
+        for _ in range(1000):
+            registry.inc("requests_total", (("result", "hit"),))
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    registry.inc("requests_total", (("result", "miss"),), 2)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE requests_total counter" in lines
+    assert 'requests_total{result="hit"} 4000' in lines
+    assert 'requests_total{result="miss"} 2' in lines
+
+
+def test_exited_threads_are_folded_into_one_shard():
+    registry = make_registry()
+
+    def record():
+        registry.inc("requests_total")
+        registry.observe("duration_seconds", 0.5)
+
+    for _ in range(50):
+        thread = threading.Thread(target=record)
+        thread.start()
+        thread.join()
+        # Every new thread retires the shards of those that have exited
+        assert len(registry._shards) == 1
+
+    lines = registry.render().splitlines()
+    assert not registry._shards
+    assert "requests_total 50" in lines
+    assert "duration_seconds_count 50" in lines
+    assert 'duration_seconds_bucket{le="1.0"} 50' in lines
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = make_registry()
+    for value in (0.05, 0.5, 0.5, 3.0):
+        registry.observe("duration_seconds", value, (("phase", "load"),))
+
+    lines = registry.render().splitlines()
+    assert 'duration_seconds_bucket{phase="load",le="0.1"} 1' in lines
+    assert 'duration_seconds_bucket{phase="load",le="1.0"} 3' in lines
+    assert 'duration_seconds_bucket{phase="load",le="+Inf"} 4' in lines
+    assert 'duration_seconds_sum{phase="load"} 4.05' in lines
+    assert 'duration_seconds_count{phase="load"} 4' in lines
+
+
+def test_timer_observes_on_error():
+    registry = make_registry()
+    try:
+        with registry.timer("duration_seconds"):
+            raise ValueError
+    except ValueError:
+        pass
+
+    assert "duration_seconds_count 1" in registry.render().splitlines()
+
+
+def test_gauges_are_read_at_scrape_time():
+    registry = MetricsRegistry()
+    value = [None]
+    registry.gauge("generation", "Generation.", lambda: value[0])
+
+    assert "generation" not in [line.split(" ")[0] for line in registry.render().splitlines()]
+    value[0] = 3
+    assert "generation 3" in registry.render().splitlines()
+
+
+def test_label_values_are_escaped():
+    registry = make_registry()
+    registry.inc("requests_total", (("route", 'a"b\\c'),))
+
+    assert 'requests_total{route="a\\"b\\\\c"} 1' in registry.render().splitlines()
@@ -0,0 +1,162 @@
+"""
+Tests for the cron schedule and the single-flight refresh scheduler.
+"""
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from ..src.scheduler import CronSchedule, RefreshInProgressError, RefreshScheduler
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class TestCronSchedule:
+    """Tests for parsing cron expressions and finding their next run."""
+
+    @pytest.mark.parametrize("expression, moment, expected", [
+        ("*/15 * * * *", datetime(2026, 10, 17, 10, 7, 30), datetime(2026, 10, 17, 10, 15)),
+        ("*/15 * * * *", datetime(2026, 10, 17, 10, 45), datetime(2026, 10, 17, 11, 0)),
+        ("0 2 * * *", datetime(2026, 10, 17, 2, 0), datetime(2026, 10, 18, 2, 0)),
+        ("30 6-18/4 * * mon-fri", datetime(2026, 10, 16, 19, 0), datetime(2026, 10, 19, 6, 30)),
+        ("0 0 1 jan,jul *", datetime(2026, 10, 17), datetime(2027, 1, 1)),
+        ("0 0 29 2 *", datetime(2026, 3, 1), datetime(2028, 2, 29)),
+        ("0 0 * * 7", datetime(2026, 10, 17), datetime(2026, 10, 18)),
+        ("@daily", datetime(2026, 12, 31, 23, 59), datetime(2027, 1, 1)),
+        ("@hourly", datetime(2026, 10, 17, 10, 0), datetime(2026, 10, 17, 11, 0)),
+    ])
+    def test_next_after(self, expression, moment, expected):
+        assert CronSchedule(expression).next_after(moment) == expected
+
+    def test_restricted_day_fields_match_either_day(self):
+        # The 13th or any Friday, like cron
+        schedule = CronSchedule("0 12 13 * 5")
+
+        assert schedule.next_after(datetime(2026, 10, 10)) == datetime(2026, 10, 13, 12, 0)
+        assert schedule.next_after(datetime(2026, 10, 14)) == datetime(2026, 10, 16, 12, 0)
+
+    @pytest.mark.parametrize("expression", [
+        "* * * *", "60 * * * *", "* 24 * * *", "0 0 0 * *", "*/0 * * * *", "5-1 * * * *", "0 0 * foo *",
+    ])
+    def test_invalid_expression(self, expression):
+        with pytest.raises(ValueError):
+            CronSchedule(expression)
+
+    def test_expression_that_never_matches(self):
+        with pytest.raises(ValueError, match="never matches"):
+            CronSchedule("0 0 31 2 *").next_after(datetime(2026, 10, 17))
+
+
+class SlowRefresh:
+    """A refresh that runs until it is released."""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.release = None
+
+    async def __call__(self):
+        self.calls += 1
+        self.release = self.release or asyncio.Event()
+        await self.release.wait()
+        self.release = None
+        return {"success": True, "message": f"{self.name} {self.calls}"}
+
+
+async def until(condition):
+    while not condition():
+        await asyncio.sleep(0)
+
+
+@pytest.fixture
+def lock_path(tmp_path):
+    return str(tmp_path / "refresh.lock")
+
+
+class TestRefreshScheduler:
+    """Tests for running refreshes one at a time."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_attach_to_the_run_in_flight(self, lock_path):
+        full = SlowRefresh("full")
+        scheduler = RefreshScheduler({"full": full}, lambda: lock_path)
+
+        first = asyncio.ensure_future(scheduler.run("full"))
+        await until(lambda: full.release is not None)
+        second = asyncio.ensure_future(scheduler.run("full"))
+        await until(lambda: scheduler.status()["current_run"]["attached_requests"] == 1)
+        full.release.set()
+
+        results = await asyncio.gather(first, second)
+
+        assert full.calls == 1
+        assert results[0] == {"success": True, "message": "full 1"}
+        assert results[1] == {"success": True, "message": "full 1", "attached": True}
+        last_run = scheduler.status()["last_run"]
+        assert (last_run["mode"], last_run["trigger"], last_run["success"]) == ("full", "request", True)
+        assert last_run["attached_requests"] == 1
+        assert last_run["duration_seconds"] >= 0
+
+    @pytest.mark.asyncio
+    async def test_other_mode_runs_after_the_run_in_flight(self, lock_path):
+        full, incremental = SlowRefresh("full"), SlowRefresh("incremental")
+        scheduler = RefreshScheduler({"full": full, "incremental": incremental}, lambda: lock_path)
+
+        first = asyncio.ensure_future(scheduler.run("full"))
+        await until(lambda: full.release is not None)
+        second = asyncio.ensure_future(scheduler.run("incremental"))
+        await asyncio.sleep(0.01)
+
+        assert incremental.calls == 0
+        full.release.set()
+        await first
+        await until(lambda: incremental.release is not None)
+        assert scheduler.status()["current_run"]["mode"] == "incremental"
+        incremental.release.set()
+        assert await second == {"success": True, "message": "incremental 1"}
+
+    @pytest.mark.asyncio
+    async def test_failed_run_is_reported(self, lock_path):
+        async def failing():
+            raise RuntimeError("Databricks is down")
+
+        scheduler = RefreshScheduler({"full": failing}, lambda: lock_path)
+
+        with pytest.raises(RuntimeError):
+            await scheduler.run("full")
+
+        status = scheduler.status()
+        assert status["running"] is False
+        assert (status["last_run"]["success"], status["last_run"]["error"]) == (False, "Databricks is down")
+
+    @pytest.mark.skipif(fcntl is None, reason="needs fcntl")
+    @pytest.mark.asyncio
+    async def test_run_in_another_worker_is_reported(self, lock_path):
+        full = SlowRefresh("full")
+        scheduler = RefreshScheduler({"full": full}, lambda: lock_path)
+
+        with open(lock_path, "a") as other_worker:
+            fcntl.flock(other_worker.fileno(), fcntl.LOCK_EX)
+            with pytest.raises(RefreshInProgressError):
+                await scheduler.run("full")
+
+        assert full.calls == 0
+
+    @pytest.mark.asyncio
+    async def test_start_and_stop_the_schedule(self, lock_path):
+        scheduler = RefreshScheduler({"incremental": SlowRefresh("incremental")}, lambda: lock_path)
+
+        assert scheduler.start("") is False
+        with pytest.raises(ValueError):
+            scheduler.start("*/5 * * * *", mode="partial")
+        assert scheduler.start("*/5 * * * *") is True
+
+        status = scheduler.status()
+        assert (status["schedule"], status["scheduled_mode"]) == ("*/5 * * * *", "incremental")
+        assert datetime.fromisoformat(status["next_run"]).minute % 5 == 0
+
+        await scheduler.stop()
+        assert scheduler.status()["next_run"] is None